@@ -5,11 +5,28 @@ Created on Mon Dec 11 11:30:37 2023
 @author: k2143494
 
 Analysis of Census 2021 and population projection data for response to CMO annual report 2023
+
+Processing is organised as named pipeline stages (see pipeline.py): load -> geodata -> IMD -> RUC -> LSOA merge ->
+per-figure tables. Each stage declares its inputs and is memoized to disk by a hash of its code, parameters and
+inputs, so after a change only the stages downstream of it re-run.
 """
 
 #%% Load packages
 import pandas as pd
 
+import crosswalk_sensitivity
+import data_cache
+import instrumentation
+from geography_index import GeographyIndex
+from lsoa_table import LSOATableBuilder
+from crosswalk import LSOACrosswalk
+from aggregate_cube import AggregateCube
+from projections import PopulationProjections, LAD_PREFIXES
+from general_health import GeneralHealth, PROPORTION_BIN_EDGES, PROPORTION_BIN_LABELS
+from spatial import SpatialIndex, BIN_SIZES_KM, write_aggregates
+from config import FILES
+from pipeline import Pipeline
+
 #%% Define functions
 # -----------------------------------------------------------------------------
 def sum_cols(data, col_list, new_col):
@@ -19,328 +36,482 @@ def sum_cols(data, col_list, new_col):
         data[new_col] += data[col]
     return data
 
-#%% Load data
-# -----------------------------------------------------------------------------
-# Census 2021, Lower Super Output Area population by age, 5-year bands. https://www.nomisweb.co.uk/datasets/c2021ts007a
-census_ageband = pd.read_csv(r"census2021-ts007a-lsoa.csv")
-
-# -----------------------------------------------------------------------------
-# Census 2021, General health by age, sex and deprivation. Local authority table, Table 6 from: https://www.ons.gov.uk/peoplepopulationandcommunity/healthandsocialcare/healthandwellbeing/datasets/generalhealthbyagesexanddeprivationenglandandwales
-data_healthbyage = pd.read_csv(r"HealthByAgeSexDeprivation_Census20212011_LocalAuthority.csv")
-data_healthbyage_cols = data_healthbyage.columns.to_list()
-
-# -----------------------------------------------------------------------------
-# Subnational population projections. "Population projections for local authorities: Table 2" https://www.ons.gov.uk/peoplepopulationandcommunity/populationandmigration/populationprojections/datasets/localauthoritiesinenglandtable2
-population_projections = pd.read_csv(r"subnationalprojections_mid2018_LAD19version.csv")
-
-# -----------------------------------------------------------------------------
-# Area-level Deprivation lower super output area (LSOA) level data
-# England 2019 https://www.gov.uk/government/statistics/english-indices-of-deprivation-2019
-deprivation_LSOA_lookup_england = pd.read_csv(r"File_2_-_IoD2019_Domains_of_Deprivation.csv")
-deprivation_LSOA_lookup_england_cols = deprivation_LSOA_lookup_england.columns.to_list()
-# Wales 2019 https://statswales.gov.wales/Catalogue/Community-Safety-and-Social-Inclusion/Welsh-Index-of-Multiple-Deprivation
-deprivation_LSOA_lookup_wales = pd.read_csv(r"welsh-index-multiple-deprivation-2019-index-and-domain-ranks-by-small-area.csv")
-deprivation_LSOA_lookup_wales_cols = deprivation_LSOA_lookup_wales.columns.to_list()
-
-# -----------------------------------------------------------------------------
-# LSOA Rural-Urban Classification, 2011 England and Wales. https://www.gov.uk/government/collections/rural-urban-classification
-RUC_LSOA_lookup_englandwales = pd.read_csv(r"Rural_Urban_Classification_2011_lookup_tables_for_small_area_geographies_EnglandWales.csv")
-RUC_LSOA_lookup_englandwales_cols = RUC_LSOA_lookup_englandwales.columns.to_list()
-
-# -----------------------------------------------------------------------------
-# Local authority level Rural-Urban classification 2011, England only. https://www.gov.uk/government/collections/rural-urban-classification
-# Mapped to Local Authority 2021 boundaries
-RUC_LAD21 = pd.read_csv(r"RUC11_LAD21CD_level.csv")
-RUC_LAD21_cols = RUC_LAD21.columns.to_list()
-# Mapped to Local Authority 2019 boundaries
-RUC_LAD19 = pd.read_csv(r"RUC11_LAD19CD_level.csv")
-RUC_LAD19_cols = RUC_LAD19.columns.to_list()
+pipeline = Pipeline()
 
+#%% Load data
 # -----------------------------------------------------------------------------
-# Geodata lookup files
-# Mapping from output area (OA) based on 2021 OA codes, OA to LSOA, MSOA, LA. https://geoportal.statistics.gov.uk/datasets/ons::output-area-to-lower-layer-super-output-area-to-middle-layer-super-output-area-to-local-authority-district-december-2021-lookup-in-england-and-wales-v2-1/about
-geocode_mapping_2021 = pd.read_csv(r"OA21_LSOA21_MSOA21_LAD22_EW_LU.csv")
-geocode_mapping_2021_cols = geocode_mapping_2021.columns.to_list()
-# Mapping from OA to Region based on 2021 OA codes, OA to Region. https://geoportal.statistics.gov.uk/datasets/efda0d0e14da4badbd8bdf8ae31d2f00/about
-geocode_mapping_2021_OAtoRegion = pd.read_csv(r"OA21_RGN22_LU.csv")
-
-
-#%% PROCESSING: Geodata
-# merge together on OA, so region is added
-geocode_mapping_2021 = pd.merge(geocode_mapping_2021, geocode_mapping_2021_OAtoRegion, how = 'left', on = 'oa21cd')
-# Group by LSOA, take first row
-geocode_mapping_2021_LSOA = geocode_mapping_2021.groupby('lsoa21cd').nth(0).reset_index()
-geocode_mapping_2021_LSOA_cols = geocode_mapping_2021_LSOA.columns.to_list()
-# Group by LAD, take first row
-geocode_mapping_2021_LAD = geocode_mapping_2021.groupby('lad22cd').nth(0).reset_index()
-geocode_mapping_2021_LAD_cols = geocode_mapping_2021_LAD.columns.to_list()
+# Source files are loaded through a typed, column-pruned cache (see data_cache.py). First run parses each CSV and
+# writes a cached copy, later runs read the cached copy until the contents of the source file change. Load stages are
+# not memoized again by the pipeline, but the hash of each source file and the data_cache code are part of the load
+# stage key, so stages downstream of a load re-run when either changes. Source file paths are listed in config.py
 
 # # Mapping from OA based on 2011 OA codes - IF NEEDED
 # # geocode_mapping_2011 = pd.read_csv(r"~\Geodata\Area lookups\Output_Area_to_LSOA_to_MSOA_to_Local_Authority_District_(December_2017)_Lookup_with_Area_Classifications_in_Great_Britain.csv")
 # # geocode_mapping_2011_cols = geocode_mapping_2011.columns.to_list()
 
-# Mapping from LSOA 2011 to 2021
-geocode_mapping_2011to2021_LSOA = pd.read_csv(r"LSOA_(2011)_to_LSOA_(2021)_to_Local_Authority_District_(2022)_Lookup_for_England_and_Wales_(Version_2).csv")
-# Group by LSOA 2011 to get one row by 2011 code. Where LSOA 2011 matches to multiple 2021 codes, take first LSOA 2021 code. ALTERNATIVE - Aggregate based on random sample, so that where LSOA 2011 matches to multiple 2021 codes, a 2021 code is chosen at random
-geocode_mapping_2011to2021_LSOA_group2011 = geocode_mapping_2011to2021_LSOA.groupby('LSOA11CD')['LSOA21CD'].nth(0).reset_index()
-
-# Group by LSOA 2021 to get one row by 2021 code. Where LSOA 2021 matches to multiple 2011 codes, take first LSOA 2011 code. ALTERNATIVE - Aggregate based on random sample, so that where LSOA 2021 matches to multiple 2011 codes, a 2011 code is chosen at random
-geocode_mapping_2011to2021_LSOA_group2021 = geocode_mapping_2011to2021_LSOA.groupby('LSOA21CD')['LSOA11CD'].nth(0).reset_index()
-
-# Lat and Long positions of LSOAs, 2021 boundaries
-LSOA2021_positions = pd.read_csv(r"Lower_layer_Super_Output_Areas_2021_EW_BSC_v2_7982568775378104300.csv")
-
-# LSOA 2011 and LAD 2022 to 2022 NHS ICBs and sub-ICB locations
-geocode_mapping_LSOA2011toNHS = pd.read_csv(r"LSOA11_LOC22_ICB22_LAD22_EN_LU.csv")
-geocode_mapping_LSOA2011toNHS_cols = geocode_mapping_LSOA2011toNHS.columns.to_list()
-
-
-#%% PROCESSING: Census 2021, Lower Super Output Area population by age, 5-year bands dataset
-# -----------------------------------------------------------------------------
-# Rename columns 
-dictionary = {}
-dictionary['var_rename'] = {#
-                # Age band
-                'Age: Total':'Age_Total_N',
-                'Age: Aged 4 years and under':'Age_Under5',
-                'Age: Aged 5 to 9 years':'Age_5to9', 
-                'Age: Aged 10 to 14 years':'Age_10to14',
-                'Age: Aged 15 to 19 years':'Age_15to19',
-                'Age: Aged 20 to 24 years':'Age_20to24',
-                'Age: Aged 25 to 29 years':'Age_25to29',
-                'Age: Aged 30 to 34 years':'Age_30to34', 
-                'Age: Aged 35 to 39 years':'Age_35to39',
-                'Age: Aged 40 to 44 years':'Age_40to44',
-                'Age: Aged 45 to 49 years':'Age_45to49',
-                'Age: Aged 50 to 54 years':'Age_50to54',
-                'Age: Aged 55 to 59 years':'Age_55to59',
-                'Age: Aged 60 to 64 years':'Age_60to64', 
-                'Age: Aged 65 to 69 years':'Age_65to69', 
-                'Age: Aged 70 to 74 years':'Age_70to74',
-                'Age: Aged 75 to 79 years':'Age_75to79',
-                'Age: Aged 80 to 84 years':'Age_80to84', 
-                'Age: Aged 85 years and over':'Age_85plus',
-                }
-
-census_ageband = census_ageband.rename(columns = dictionary['var_rename'])
-census_ageband = census_ageband.rename(columns = {'geography code':'lsoa21cd'})
-census_ageband_cols = census_ageband.columns.to_list()
-
-# -----------------------------------------------------------------------------
-# Sum columns where relevant
-census_ageband = sum_cols(data = census_ageband, col_list = ['Age_65to69','Age_70to74','Age_75to79','Age_80to84','Age_85plus'], new_col = 'Age_65plus')
-census_ageband = sum_cols(data = census_ageband, col_list = ['Age_75to79','Age_80to84','Age_85plus'], new_col = 'Age_75plus')
-
-
-#%% PROCESSING: Index of Multiple deprivation
 # -----------------------------------------------------------------------------
-# England 2019 - https://www.gov.uk/government/statistics/english-indices-of-deprivation-2019
-deprivation_LSOA_lookup_england = deprivation_LSOA_lookup_england.rename(columns = {'LSOA code (2011)': 'LSOA_England',
-        'Index of Multiple Deprivation (IMD) Decile (where 1 is most deprived 10% of LSOAs)': 'IMD_Decile_England2019',
-        'Index of Multiple Deprivation (IMD) Rank (where 1 is most deprived)':'IMD_Rank_England2019',
-        'Income Decile (where 1 is most deprived 10% of LSOAs)': 'IncomeDeprivation_Decile_England2019',
-        'Health Deprivation and Disability Decile (where 1 is most deprived 10% of LSOAs)': 'HealthDeprivation_Decile_England2019'})
+# One load stage per source file, named load_<key>
+def register_load(key):
+    """Function to register stage loading source file through data cache"""
+    @pipeline.stage(name = 'load_' + key, params = {'path': FILES[key], 'engine': data_cache.CSV_ENGINE}, files = [FILES[key]],
+                    depends = [data_cache], memoize = False)
+    def load(path, engine, use_cache = True):
+        return data_cache.load_csv(path, use_cache = use_cache, engine = engine)
 
-# Convert rank column from string to numeric
-deprivation_LSOA_lookup_england['IMD_Rank_England2019'] = deprivation_LSOA_lookup_england['IMD_Rank_England2019'].str.replace(',', '').astype(float)
+for key in FILES:
+    if key != 'projections':
+        register_load(key)
 
-# Bin area deprivation rank into percentiles
-deprivation_LSOA_lookup_england['IMD_Percentile_England2019'] = pd.qcut(deprivation_LSOA_lookup_england['IMD_Rank_England2019'], 100, labels = False)
-deprivation_LSOA_lookup_england['IMD_Percentile_England2019'] = deprivation_LSOA_lookup_england['IMD_Percentile_England2019'] + 1 # Add 1 to start at 1
+# Subnational population projections are streamed in chunks into area x age group x year array (see projections.py)
+@pipeline.stage(params = {'path': FILES['projections']}, files = [FILES['projections']], depends = [PopulationProjections])
+def load_projections(path):
+    return PopulationProjections.from_csv(path)
 
-# -----------------------------------------------------------------------------
-# Wales 2019 - downloaded from https://gov.wales/welsh-index-multiple-deprivation-full-index-update-ranks-2019
-# LSOA to IMD
-deprivation_LSOA_lookup_wales = deprivation_LSOA_lookup_wales.rename(columns = {'LSOA Code':'LSOA_Wales',
-                                                                                'WIMD 2019 Overall Decile':'IMD_Decile_Wales2019'})
-
-# Bin area deprivation rank into percentiles
-deprivation_LSOA_lookup_wales['IMD_Percentile_Wales2019'] = pd.qcut(deprivation_LSOA_lookup_wales['WIMD 2019 Overall Rank '], 100, labels = False)
-deprivation_LSOA_lookup_wales['IMD_Percentile_Wales2019'] = deprivation_LSOA_lookup_wales['IMD_Percentile_Wales2019'] + 1 # Add 1 to start at 1
-
-# -----------------------------------------------------------------------------
-# Join IMD to LSOA 2011 to 2021 mapping
-# England
-deprivation_LSOA21CD = pd.merge(geocode_mapping_2011to2021_LSOA_group2021,deprivation_LSOA_lookup_england[['LSOA_England','IMD_Decile_England2019','IMD_Percentile_England2019']], how = 'left', left_on = 'LSOA11CD', right_on = 'LSOA_England')
-test1 = deprivation_LSOA21CD[['LSOA21CD','LSOA11CD','LSOA_England','IMD_Decile_England2019']] 
-
-# Wales
-deprivation_LSOA21CD = pd.merge(deprivation_LSOA21CD,deprivation_LSOA_lookup_wales[['LSOA_Wales','IMD_Decile_Wales2019','IMD_Percentile_Wales2019']], how = 'left', left_on = 'LSOA11CD', right_on = 'LSOA_Wales')
-test1 = deprivation_LSOA21CD[['LSOA21CD','LSOA11CD','LSOA_Wales','IMD_Decile_Wales2019']] 
 
-# -----------------------------------------------------------------------------
-# Combine IMD deciles from different nations into single column
-deprivation_LSOA21CD['IMD_Percentile_2019'] = deprivation_LSOA21CD['IMD_Percentile_England2019'].fillna(deprivation_LSOA21CD['IMD_Percentile_Wales2019'])
-test_all = deprivation_LSOA21CD[['LSOA21CD','LSOA11CD','IMD_Percentile_2019']] 
-deprivation_LSOA21CD['IMD_Decile_2019'] = deprivation_LSOA21CD['IMD_Decile_England2019'].fillna(deprivation_LSOA21CD['IMD_Decile_Wales2019'])
-test_all = deprivation_LSOA21CD[['LSOA21CD','LSOA11CD','IMD_Decile_2019']] 
+#%% PROCESSING: Geodata
+@pipeline.stage(inputs = ['load_oa_lookup', 'load_oa_region', 'load_lsoa_lookup', 'load_nhs_lookup'], depends = [LSOACrosswalk, GeographyIndex, instrumentation])
+def geodata(load_oa_lookup, load_oa_region, load_lsoa_lookup, load_nhs_lookup):
+    """Function to build LSOA 2011 to 2021 crosswalk, geography hierarchy and LSOA and LAD level geocode lookups"""
+    # -----------------------------------------------------------------------------
+    # Sparse weighted crosswalk between LSOA 2011 and 2021 codes, equal shares. Used to transfer 2011 LSOA level data (IMD,
+    # RUC, NHS) to 2021 LSOAs. Where LSOA 2021 matches to multiple 2011 codes, takes the value with the largest share of 2011
+    # LSOAs rather than the value of the first 2011 LSOA (ties go to first 2011 LSOA)
+    crosswalk_LSOA = LSOACrosswalk.from_lookup(load_lsoa_lookup)
+
+    # -----------------------------------------------------------------------------
+    # Build integer-coded geography hierarchy (OA -> LSOA -> MSOA -> LAD -> Region, LSOA -> sub-ICB -> ICB) once from lookups.
+    # Region is added to OAs inside the index, and each area takes the parents of its first OA
+    geography = GeographyIndex.from_lookups(oa_lookup = load_oa_lookup,
+                                            oa_region_lookup = load_oa_region,
+                                            nhs_lookup = load_nhs_lookup,
+                                            crosswalk = crosswalk_LSOA)
+
+    # -----------------------------------------------------------------------------
+    # NHS sub-ICB location mapped to 2021 LSOA code, plus ICB of sub-ICB location
+    NHS_LSOA21CD = crosswalk_LSOA.frame_2021(load_nhs_lookup, key = 'LSOA11CD', columns = ['LOC22CD'])
+    instrumentation.record_crosswalk('Crosswalk: NHS sub-ICB to 2021 LSOA', crosswalk_LSOA, load_nhs_lookup, 'LSOA11CD', NHS_LSOA21CD)
+    NHS_LSOA21CD = instrumentation.merge('NHS: sub-ICB attributes', NHS_LSOA21CD, load_nhs_lookup[['LOC22CD', 'LOC22CDH', 'LOC22NM', 'ICB22CD', 'ICB22CDH', 'ICB22NM']].drop_duplicates(subset = 'LOC22CD'), how = 'left', on = 'LOC22CD', sample_key = 'LSOA21CD')
+
+    return {'crosswalk_LSOA': crosswalk_LSOA,
+            'geography': geography,
+            # One row per LSOA, with MSOA, LAD and Region codes and names
+            'geocode_mapping_2021_LSOA': geography.to_frame('lsoa', ancestors = ['msoa','lad','rgn']),
+            # One row per LAD, with Region codes and names
+            'geocode_mapping_2021_LAD': geography.to_frame('lad', ancestors = ['rgn']),
+            'NHS_LSOA21CD': NHS_LSOA21CD,
+            }
 
-# Add quintile
-deprivation_LSOA21CD.loc[deprivation_LSOA21CD['IMD_Decile_2019'].isin([1,2]), 'IMD_Quintile_2019'] = 1
-deprivation_LSOA21CD.loc[deprivation_LSOA21CD['IMD_Decile_2019'].isin([3,4]), 'IMD_Quintile_2019'] = 2
-deprivation_LSOA21CD.loc[deprivation_LSOA21CD['IMD_Decile_2019'].isin([5,6]), 'IMD_Quintile_2019'] = 3
-deprivation_LSOA21CD.loc[deprivation_LSOA21CD['IMD_Decile_2019'].isin([7,8]), 'IMD_Quintile_2019'] = 4
-deprivation_LSOA21CD.loc[deprivation_LSOA21CD['IMD_Decile_2019'].isin([9,10]), 'IMD_Quintile_2019'] = 5
 
+#%% PROCESSING: Census 2021, Lower Super Output Area population by age, 5-year bands dataset
+@pipeline.stage(inputs = ['load_census_ageband'], depends = [sum_cols])
+def census(load_census_ageband):
+    """Function to rename census age band columns and add 65+ and 75+ totals"""
+    # -----------------------------------------------------------------------------
+    # Rename columns
+    dictionary = {}
+    dictionary['var_rename'] = {#
+                    # Age band
+                    'Age: Total':'Age_Total_N',
+                    'Age: Aged 4 years and under':'Age_Under5',
+                    'Age: Aged 5 to 9 years':'Age_5to9',
+                    'Age: Aged 10 to 14 years':'Age_10to14',
+                    'Age: Aged 15 to 19 years':'Age_15to19',
+                    'Age: Aged 20 to 24 years':'Age_20to24',
+                    'Age: Aged 25 to 29 years':'Age_25to29',
+                    'Age: Aged 30 to 34 years':'Age_30to34',
+                    'Age: Aged 35 to 39 years':'Age_35to39',
+                    'Age: Aged 40 to 44 years':'Age_40to44',
+                    'Age: Aged 45 to 49 years':'Age_45to49',
+                    'Age: Aged 50 to 54 years':'Age_50to54',
+                    'Age: Aged 55 to 59 years':'Age_55to59',
+                    'Age: Aged 60 to 64 years':'Age_60to64',
+                    'Age: Aged 65 to 69 years':'Age_65to69',
+                    'Age: Aged 70 to 74 years':'Age_70to74',
+                    'Age: Aged 75 to 79 years':'Age_75to79',
+                    'Age: Aged 80 to 84 years':'Age_80to84',
+                    'Age: Aged 85 years and over':'Age_85plus',
+                    }
+
+    census_ageband = load_census_ageband.rename(columns = dictionary['var_rename'])
+    census_ageband = census_ageband.rename(columns = {'geography code':'lsoa21cd'})
+
+    # -----------------------------------------------------------------------------
+    # Sum columns where relevant
+    census_ageband = sum_cols(data = census_ageband, col_list = ['Age_65to69','Age_70to74','Age_75to79','Age_80to84','Age_85plus'], new_col = 'Age_65plus')
+    census_ageband = sum_cols(data = census_ageband, col_list = ['Age_75to79','Age_80to84','Age_85plus'], new_col = 'Age_75plus')
+    return census_ageband
 
-#%% PROCESSING: Rural-Urban Classification 
-# -----------------------------------------------------------------------------
-# LSOA to Rural-Urban Classification 
-RUC_LSOA_lookup_englandwales = RUC_LSOA_lookup_englandwales.rename(columns = {'Lower Super Output Area 2011 Code':'LSOA11CD',
-                                                                              'Rural Urban Classification 2011 code':'RUC2011_code',
-                                                                              'Rural Urban Classification 2011 (10 fold)':'RUC2011_cat10',
-                                                                              'Rural Urban Classification 2011 (2 fold)':'RUC2011_cat2'})
 
-# -----------------------------------------------------------------------------
-# Join IMD to LSOA 2011 to 2021 mapping
-RUC_LSOA_englandwales = pd.merge(geocode_mapping_2011to2021_LSOA_group2021,RUC_LSOA_lookup_englandwales[['LSOA11CD','RUC2011_cat10','RUC2011_cat2']], how = 'left', left_on = 'LSOA11CD', right_on = 'LSOA11CD')
+#%% PROCESSING: Index of Multiple deprivation
+@pipeline.stage(inputs = ['load_imd_england', 'load_imd_wales', 'geodata'], depends = [LSOACrosswalk, instrumentation])
+def imd(load_imd_england, load_imd_wales, geodata):
+    """Function to bin IMD rank into percentiles and map England and Wales IMD to 2021 LSOA code"""
+    # -----------------------------------------------------------------------------
+    # England 2019 - https://www.gov.uk/government/statistics/english-indices-of-deprivation-2019
+    deprivation_LSOA_lookup_england = load_imd_england.rename(columns = {'LSOA code (2011)': 'LSOA_England',
+            'Index of Multiple Deprivation (IMD) Decile (where 1 is most deprived 10% of LSOAs)': 'IMD_Decile_England2019',
+            'Index of Multiple Deprivation (IMD) Rank (where 1 is most deprived)':'IMD_Rank_England2019',
+            'Income Decile (where 1 is most deprived 10% of LSOAs)': 'IncomeDeprivation_Decile_England2019',
+            'Health Deprivation and Disability Decile (where 1 is most deprived 10% of LSOAs)': 'HealthDeprivation_Decile_England2019'})
+
+    # Convert rank column from string to numeric
+    deprivation_LSOA_lookup_england['IMD_Rank_England2019'] = deprivation_LSOA_lookup_england['IMD_Rank_England2019'].str.replace(',', '').astype(float)
+
+    # Bin area deprivation rank into percentiles
+    deprivation_LSOA_lookup_england['IMD_Percentile_England2019'] = pd.qcut(deprivation_LSOA_lookup_england['IMD_Rank_England2019'], 100, labels = False)
+    deprivation_LSOA_lookup_england['IMD_Percentile_England2019'] = deprivation_LSOA_lookup_england['IMD_Percentile_England2019'] + 1 # Add 1 to start at 1
+
+    # -----------------------------------------------------------------------------
+    # Wales 2019 - downloaded from https://gov.wales/welsh-index-multiple-deprivation-full-index-update-ranks-2019
+    # LSOA to IMD
+    deprivation_LSOA_lookup_wales = load_imd_wales.rename(columns = {'LSOA Code':'LSOA_Wales',
+                                                                     'WIMD 2019 Overall Decile':'IMD_Decile_Wales2019'})
+
+    # Bin area deprivation rank into percentiles
+    deprivation_LSOA_lookup_wales['IMD_Percentile_Wales2019'] = pd.qcut(deprivation_LSOA_lookup_wales['WIMD 2019 Overall Rank '], 100, labels = False)
+    deprivation_LSOA_lookup_wales['IMD_Percentile_Wales2019'] = deprivation_LSOA_lookup_wales['IMD_Percentile_Wales2019'] + 1 # Add 1 to start at 1
+
+    # -----------------------------------------------------------------------------
+    # Combine IMD from different nations into single 2011 LSOA level table
+    col_rename = {'LSOA_England':'LSOA11CD', 'IMD_Decile_England2019':'IMD_Decile_2019', 'IMD_Percentile_England2019':'IMD_Percentile_2019',
+                  'LSOA_Wales':'LSOA11CD', 'IMD_Decile_Wales2019':'IMD_Decile_2019', 'IMD_Percentile_Wales2019':'IMD_Percentile_2019'}
+    deprivation_LSOA11CD = pd.concat([deprivation_LSOA_lookup_england[['LSOA_England','IMD_Decile_England2019','IMD_Percentile_England2019']].rename(columns = col_rename),
+                                      deprivation_LSOA_lookup_wales[['LSOA_Wales','IMD_Decile_Wales2019','IMD_Percentile_Wales2019']].rename(columns = col_rename)],
+                                     ignore_index = True)
+
+    # -----------------------------------------------------------------------------
+    # Map IMD to 2021 LSOA code using crosswalk. One 2011 LSOA is chosen per 2021 LSOA by majority IMD decile, and both
+    # decile and percentile are taken from it, so they stay consistent with each other
+    deprivation_LSOA21CD = geodata['crosswalk_LSOA'].frame_2021(deprivation_LSOA11CD, key = 'LSOA11CD', columns = ['IMD_Percentile_2019','IMD_Decile_2019'], by = 'IMD_Decile_2019')
+    instrumentation.record_crosswalk('Crosswalk: IMD to 2021 LSOA', geodata['crosswalk_LSOA'], deprivation_LSOA11CD, 'LSOA11CD', deprivation_LSOA21CD)
+
+    # Add quintile
+    deprivation_LSOA21CD.loc[deprivation_LSOA21CD['IMD_Decile_2019'].isin([1,2]), 'IMD_Quintile_2019'] = 1
+    deprivation_LSOA21CD.loc[deprivation_LSOA21CD['IMD_Decile_2019'].isin([3,4]), 'IMD_Quintile_2019'] = 2
+    deprivation_LSOA21CD.loc[deprivation_LSOA21CD['IMD_Decile_2019'].isin([5,6]), 'IMD_Quintile_2019'] = 3
+    deprivation_LSOA21CD.loc[deprivation_LSOA21CD['IMD_Decile_2019'].isin([7,8]), 'IMD_Quintile_2019'] = 4
+    deprivation_LSOA21CD.loc[deprivation_LSOA21CD['IMD_Decile_2019'].isin([9,10]), 'IMD_Quintile_2019'] = 5
+
+    return {'deprivation_LSOA11CD': deprivation_LSOA11CD,
+            'deprivation_LSOA21CD': deprivation_LSOA21CD,
+            }
+
+
+#%% PROCESSING: Rural-Urban Classification
+@pipeline.stage(inputs = ['load_ruc_lsoa', 'geodata'], depends = [LSOACrosswalk, instrumentation])
+def ruc(load_ruc_lsoa, geodata):
+    """Function to map LSOA rural-urban classification to 2021 LSOA code"""
+    # -----------------------------------------------------------------------------
+    # LSOA to Rural-Urban Classification
+    RUC_LSOA_lookup_englandwales = load_ruc_lsoa.rename(columns = {'Lower Super Output Area 2011 Code':'LSOA11CD',
+                                                                   'Rural Urban Classification 2011 code':'RUC2011_code',
+                                                                   'Rural Urban Classification 2011 (10 fold)':'RUC2011_cat10',
+                                                                   'Rural Urban Classification 2011 (2 fold)':'RUC2011_cat2'})
+
+    # -----------------------------------------------------------------------------
+    # Map RUC to 2021 LSOA code using crosswalk. RUC code is mapped, then 10 and 2 fold categories are added from the code,
+    # so that categories stay consistent with each other
+    RUC_LSOA_englandwales = geodata['crosswalk_LSOA'].frame_2021(RUC_LSOA_lookup_englandwales, key = 'LSOA11CD', columns = ['RUC2011_code'])
+    instrumentation.record_crosswalk('Crosswalk: RUC to 2021 LSOA', geodata['crosswalk_LSOA'], RUC_LSOA_lookup_englandwales, 'LSOA11CD', RUC_LSOA_englandwales)
+    RUC_LSOA_englandwales = instrumentation.merge('RUC: categories from code', RUC_LSOA_englandwales, RUC_LSOA_lookup_englandwales[['RUC2011_code','RUC2011_cat10','RUC2011_cat2']].drop_duplicates(subset = 'RUC2011_code'), how = 'left', on = 'RUC2011_code')
+
+    return {'RUC_LSOA_lookup_englandwales': RUC_LSOA_lookup_englandwales,
+            'RUC_LSOA_englandwales': RUC_LSOA_englandwales,
+            }
 
 
 #%% Merge LSOA level datasets, 1 row per LSOA
-# -----------------------------------------------------------------------------
-# Start with Census LSOA level age band data
-data_combined_LSOA = census_ageband.copy()
-
-# -----------------------------------------------------------------------------
-# Add 2019 IMD (mapped to 2021 LSOA code)
-col_list = ['LSOA21CD', 'IMD_Percentile_2019', 'IMD_Quintile_2019']
-data_combined_LSOA = pd.merge(data_combined_LSOA, deprivation_LSOA21CD, how = 'left', left_on = 'lsoa21cd', right_on = 'LSOA21CD')
-
-# -----------------------------------------------------------------------------
-# Add geocode lookups for mapping
-col_list = ['lsoa21cd', 'lsoa21nm', 'msoa21cd', 'msoa21nm', 'lad22cd', 'lad22nm', 'lad22nmw', 'rgn22cd', 'rgn22nm', 'rgn22nmw']
-data_combined_LSOA = pd.merge(data_combined_LSOA, geocode_mapping_2021_LSOA[col_list], how = 'left', left_on = 'lsoa21cd', right_on = 'lsoa21cd')
-
-# -----------------------------------------------------------------------------
-# Add LSOA 2021 geo data - latitude and longitude for mapping
-data_combined_LSOA = pd.merge(data_combined_LSOA, LSOA2021_positions, how = 'left', left_on = 'lsoa21cd', right_on = 'LSOA21CD')
-
-# -----------------------------------------------------------------------------
-# Add mapping to NHS regions
-data_combined_LSOA = pd.merge(data_combined_LSOA, geocode_mapping_LSOA2011toNHS[['LSOA11CD', 'LOC22CD', 'LOC22CDH', 'LOC22NM', 'ICB22CD', 'ICB22CDH', 'ICB22NM']], how = 'left', left_on = 'LSOA11CD', right_on = 'LSOA11CD')
-
-# -----------------------------------------------------------------------------
-# Add 2011 LSOA level RUC (mapped to 2021 LSOA code)
-col_list = ['LSOA21CD', 'RUC2011_cat10', 'RUC2011_cat2']
-data_combined_LSOA = pd.merge(data_combined_LSOA, RUC_LSOA_englandwales[col_list], how = 'left', left_on = 'lsoa21cd', right_on = 'LSOA21CD')
-
-# -----------------------------------------------------------------------------
-# Add 2011 Local authority level RUC (mapped to 2021 Local authority code)
-data_combined_LSOA = pd.merge(data_combined_LSOA, RUC_LAD21, how = 'left', left_on = 'lad22cd', right_on = 'Local Authority District Area 2021 Code')
-data_combined_LSOA = data_combined_LSOA.drop(columns = ['Local Authority District Area 2021 Code','Local Authority District Area 2021 Name'])
-
+@pipeline.stage(inputs = ['census', 'imd', 'geodata', 'load_positions', 'ruc', 'load_ruc_lad21'], depends = [LSOATableBuilder, instrumentation])
+def lsoa_merge(census, imd, geodata, load_positions, ruc, load_ruc_lad21):
+    """Function to combine LSOA level datasets, 1 row per LSOA"""
+    # -----------------------------------------------------------------------------
+    # Start with Census LSOA level age band data. Each source below is checked to be unique on its join key, so no join can
+    # add rows, and only the listed columns are added. Table is assembled in one pass once all sources are registered
+    builder_LSOA = LSOATableBuilder(census, key = 'lsoa21cd')
+
+    # -----------------------------------------------------------------------------
+    # Add 2019 IMD (mapped to 2021 LSOA code)
+    col_list = ['IMD_Percentile_2019', 'IMD_Decile_2019', 'IMD_Quintile_2019']
+    builder_LSOA.add_source('IMD', imd['deprivation_LSOA21CD'], key = 'LSOA21CD', columns = col_list)
+
+    # -----------------------------------------------------------------------------
+    # Add geocode lookups for mapping
+    col_list = ['lsoa21nm', 'msoa21cd', 'msoa21nm', 'lad22cd', 'lad22nm', 'lad22nmw', 'rgn22cd', 'rgn22nm', 'rgn22nmw']
+    builder_LSOA.add_source('Geocodes', geodata['geocode_mapping_2021_LSOA'], key = 'lsoa21cd', columns = col_list)
+
+    # -----------------------------------------------------------------------------
+    # Add LSOA 2021 geo data - latitude and longitude for mapping
+    builder_LSOA.add_source('Positions', load_positions, key = 'LSOA21CD', columns = ['LAT', 'LONG'], dtypes = {'LAT':'float64', 'LONG':'float64'})
+
+    # -----------------------------------------------------------------------------
+    # Add mapping to NHS regions (mapped to 2021 LSOA code)
+    col_list = ['LOC22CD', 'LOC22CDH', 'LOC22NM', 'ICB22CD', 'ICB22CDH', 'ICB22NM']
+    builder_LSOA.add_source('NHS', geodata['NHS_LSOA21CD'], key = 'LSOA21CD', columns = col_list)
+
+    # -----------------------------------------------------------------------------
+    # Add 2011 LSOA level RUC (mapped to 2021 LSOA code)
+    col_list = ['RUC2011_cat10', 'RUC2011_cat2']
+    builder_LSOA.add_source('RUC LSOA', ruc['RUC_LSOA_englandwales'], key = 'LSOA21CD', columns = col_list)
+
+    # -----------------------------------------------------------------------------
+    # Add 2011 Local authority level RUC (mapped to 2021 Local authority code)
+    col_list = [col for col in load_ruc_lad21.columns if col not in ['Local Authority District Area 2021 Code','Local Authority District Area 2021 Name']]
+    builder_LSOA.add_source('RUC LAD', load_ruc_lad21, key = 'Local Authority District Area 2021 Code', on = 'lad22cd', columns = col_list)
+
+    data_combined_LSOA = builder_LSOA.build()
+    instrumentation.record_sources(builder_LSOA, data_combined_LSOA)
+    return data_combined_LSOA
+
+
+#%% Aggregate cube of LSOA level population, 1 cell per combination of area groupings, by age band
+# -----------------------------------------------------------------------------
+# Sum LSOA population by age band once for every observed combination of region, LAD, ICB, RUC and IMD. Tables by any
+# subset of these groupings, for any age threshold on a 5-year band boundary, are then taken from the cube
+ageband_cols = ['Age_Under5', 'Age_5to9', 'Age_10to14', 'Age_15to19', 'Age_20to24', 'Age_25to29', 'Age_30to34', 'Age_35to39', 'Age_40to44',
+                'Age_45to49', 'Age_50to54', 'Age_55to59', 'Age_60to64', 'Age_65to69', 'Age_70to74', 'Age_75to79', 'Age_80to84', 'Age_85plus']
+cube_dims = ['rgn22cd', 'lad22cd', 'ICB22CD', 'RUC2011_cat2', 'RUC2011_cat10', 'Rural Urban Classification 2011 (3 fold)', 'IMD_Quintile_2019', 'IMD_Decile_2019']
+
+@pipeline.stage(inputs = ['lsoa_merge'], params = {'dims': cube_dims, 'bands': ageband_cols}, depends = [AggregateCube])
+def cube(lsoa_merge, dims, bands):
+    return AggregateCube.from_frame(lsoa_merge, dims = dims, bands = bands,
+                                    attrs = {'rgn22cd':['rgn22nm'], 'lad22cd':['lad22nm'], 'ICB22CD':['ICB22NM']})
 
 
 #%% FIGURE 1 - LSOA level Census 2021 Population aged 65+ by rural-urban classification of LSOA
 # -----------------------------------------------------------------------------
 # FIGURE 1 (a) TABLE - 65+ population by LSOA level rural-urban
-figure1a_65plus_byRUC_Overall = data_combined_LSOA.groupby('RUC2011_cat2').agg({'Age_65plus':'sum'}).reset_index()
+@pipeline.stage(inputs = ['cube'], params = {'min_age': 65})
+def figure1a(cube, min_age):
+    return cube.table(['RUC2011_cat2'], min_age = min_age)
 
 # -----------------------------------------------------------------------------
 # FIGURE 1 (b) TABLE - 65+ population by LSOA level rural-urban classification
-figure1b_65plus_byRUCandRegion = data_combined_LSOA.groupby(['rgn22cd','RUC2011_cat2']).agg({'rgn22nm':'first',
-                                                                                       'Age_65plus':'sum'}).reset_index()
+@pipeline.stage(inputs = ['cube'], params = {'min_age': 65})
+def figure1b(cube, min_age):
+    return cube.table(['rgn22cd','RUC2011_cat2'], min_age = min_age)
 
 # -----------------------------------------------------------------------------
 # FIGURE 1 (c) - Map of - read field 'Age_65plus' as-is into Power BI software for mapping with mapbox visual, circle map option
+# Points are also indexed by position (see spatial.py): 65+ population summed into hexagonal bins at several bin sizes for
+# map rendering, and 65+ population within radius_km of each LSOA
+@pipeline.stage(inputs = ['lsoa_merge'], params = {'columns': ['Age_65plus', 'Age_Total_N'], 'sizes_km': BIN_SIZES_KM, 'shape': 'hex', 'radius_km': 10},
+                depends = [SpatialIndex])
+def figure1c(lsoa_merge, columns, sizes_km, shape, radius_km):
+    """Function to bin LSOA population by position and sum 65+ population within radius of each LSOA"""
+    index_LSOA = SpatialIndex.from_frame(lsoa_merge, code = 'lsoa21cd')
+    values = {col: index_LSOA.align(lsoa_merge, col) for col in columns}
+
+    # Population in hexagonal bins, one row per non-empty bin per bin size
+    figure1c_65plus_bins = index_LSOA.bin_aggregates(values, sizes_km = sizes_km, shape = shape)
+
+    # 65+ population and number of LSOAs within radius of each LSOA
+    within_65plus, within_count = index_LSOA.within(values['Age_65plus'], radius_km)
+    figure1c_65plus_within = pd.DataFrame({'lsoa21cd': index_LSOA.codes,
+                                           'LAT': index_LSOA.lat,
+                                           'LONG': index_LSOA.long,
+                                           f'Age_65plus_within_{radius_km}km': within_65plus,
+                                           f'LSOAs_within_{radius_km}km': within_count})
+
+    # Export for mapping: python CMOresponse_GitHub.py --figures 1c --export-bins Census2021_65plus_LSOA_hexbins.parquet
+    # writes bins to a compact columnar file (see write_aggregates)
+
+    return {'index_LSOA': index_LSOA,
+            'figure1c_65plus_bins': figure1c_65plus_bins,
+            'figure1c_65plus_within': figure1c_65plus_within,
+            }
 
 
 #%% FIGURE 2 - Estimated (2018) and projected (2043) population aged 65+ by rural urban classification of local authority
-# -----------------------------------------------------------------------------
-# Filter for aged 65+ and Local authority regions 
-age_group_list = ['65-69','70-74','75-79','80-84','85-89','90+']
-population_projections_filter = population_projections[(population_projections['CODE'].str.contains('E06|E07|E08|E09'))
-                                                       & (population_projections['AGE GROUP'].isin(age_group_list))]
-
-# -----------------------------------------------------------------------------
-# Group by local authority regions to get totals across ages
-population_projections_filter_grouped = population_projections_filter.groupby('CODE').agg({'AREA':'first',
-                                                                                            '2018':'sum',
-                                                                                            '2043':'sum',
-                                                                                            }).reset_index()
-
-# -----------------------------------------------------------------------------
-# Join 2011 local authority level rural-urban classification to Local authority level population estimates and projections
-population_projections_filter_RUCmerge = pd.merge(population_projections_filter_grouped, RUC_LAD19, how = 'left', left_on = 'CODE', right_on = 'Local Authority District Area 2019 Code')
-
-# -----------------------------------------------------------------------------
-# Group by local authority to get totals for visualisation
-# FIGURE 2 TABLE
-figure2_populationprojections_byRUC = population_projections_filter_RUCmerge.groupby('Rural Urban Classification 2011 (3 fold)').agg({'2018':'sum',
-             '2043':'sum',})
+@pipeline.stage(inputs = ['load_projections', 'load_ruc_lad19'], params = {'min_age': 65, 'years': ['2018','2043']}, depends = [instrumentation])
+def figure2(load_projections, load_ruc_lad19, min_age, years):
+    """Function to sum projected population aged min_age+ by local authority rural-urban classification"""
+    # -----------------------------------------------------------------------------
+    # Totals aged 65+ for Local authority regions (codes starting E06, E07, E08, E09), all projection years
+    population_projections_filter_grouped = load_projections.totals(prefixes = LAD_PREFIXES, min_age = min_age)
+
+    # -----------------------------------------------------------------------------
+    # Group by 2011 local authority level rural-urban classification to get totals for visualisation, all projection years
+    RUC_LAD19_3fold = load_ruc_lad19.set_index('Local Authority District Area 2019 Code')['Rural Urban Classification 2011 (3 fold)']
+    figure2_populationprojections_byRUC_allyears = load_projections.by_group(RUC_LAD19_3fold, prefixes = LAD_PREFIXES, min_age = min_age)
+    instrumentation.record_join('Figure 2: projections CODE to LAD RUC', population_projections_filter_grouped.index, RUC_LAD19_3fold.index[RUC_LAD19_3fold.notna().to_numpy()],
+                                left_rows = len(population_projections_filter_grouped), right_rows = len(load_ruc_lad19))
+
+    # FIGURE 2 TABLE - 2018 estimate and 2043 projection
+    return {'population_projections_filter_grouped': population_projections_filter_grouped,
+            'figure2_populationprojections_byRUC_allyears': figure2_populationprojections_byRUC_allyears,
+            'figure2_populationprojections_byRUC': figure2_populationprojections_byRUC_allyears[years],
+            }
 
 
 #%% FIGURE 3 - Population aged 65+ by rural-urban classification and index of multiple deprivation quintile of LSOA
-figure3_65plus_byRUCandIMD = data_combined_LSOA.groupby(['RUC2011_cat2','IMD_Quintile_2019']).agg({'Age_65plus':'sum'}).reset_index()
-
-
-#%% FIGURE 4 - Proportion of population aged 65+ with very bad and bad health by local authority area
-# -----------------------------------------------------------------------------
-# Filter general health data for over 65s
-data_healthbyage_filter = data_healthbyage[(data_healthbyage['Sex'] == 'Persons')
-                                           & (data_healthbyage['Year'] == 2021)
-                                           & (data_healthbyage['Age'].isin(['65 to 69','70 to 74','75 to 79','80 to 84','85 to 89', '90+']))]
-
-# Group by area and health status
-data_healthbyage_filter_grouped = data_healthbyage_filter.groupby(['Area Code', 'Health Status']).agg({'Local Authority':'first',
-                                                                                    'Count':'sum',
-                                                                                    'Population':'sum',
-                                                                                    }).reset_index()
-
-# Calculate proportions for areas
-data_healthbyage_filter_grouped['proportion'] = data_healthbyage_filter_grouped['Count'] / data_healthbyage_filter_grouped['Population']
-
-# Rename to be alphabetical for mapping
-data_healthbyage_filter_grouped['Health Status'] = data_healthbyage_filter_grouped['Health Status'].replace({'Very good':'5. Very good',
-                                                                                                             'Good':'4. Good',
-                                                                                                             'Fair':'3. Fair',
-                                                                                                             'Bad':'2. Bad',
-                                                                                                             'Very bad':'1. Very bad',
-                                                                                                             })
-
+@pipeline.stage(inputs = ['cube'], params = {'min_age': 65})
+def figure3(cube, min_age):
+    return cube.table(['RUC2011_cat2','IMD_Quintile_2019'], min_age = min_age)
 
-# -----------------------------------------------------------------------------
-# Edit area code of City of London and Westminster to match Westminster, and Cornwall and Isles of Scilly to match Cornwall for mapping
-# Westminster E09000033, Cornwall E06000052
-data_healthbyage_filter_grouped.loc[(data_healthbyage_filter_grouped['Local Authority'] == 'Cornwall and Isles of Scilly'),'Area Code'] = 'E06000052'
-data_healthbyage_filter_grouped.loc[(data_healthbyage_filter_grouped['Local Authority'] == 'City of London and Westminster'),'Area Code'] = 'E09000033' 
-
-
-# -----------------------------------------------------------------------------
-# Join 2011 local authority level rural-urban classification to Local authority level general health population size and proportions
-data_healthbyage_RUCmerge = pd.merge(data_healthbyage_filter_grouped, RUC_LAD21, how = 'left', left_on = 'Area Code', right_on = 'Local Authority District Area 2021 Code')
-
-# Fill gaps where groupings don't match due to aggregations
-data_healthbyage_RUCmerge.loc[(data_healthbyage_RUCmerge['Local Authority'] == 'Cornwall and Isles of Scilly'),'Rural Urban Classification 2011 (3 fold)'] = 'Predominantly Rural'
-data_healthbyage_RUCmerge.loc[(data_healthbyage_RUCmerge['Local Authority'] == 'City of London and Westminster'),'Rural Urban Classification 2011 (3 fold)'] = 'Predominantly Urban'
-
-# Export for mapping
-# data_healthbyage_RUCmerge.to_csv('Census2021GeneralHealthbyLAD21CDandRUC2011.csv')
-
-# -----------------------------------------------------------------------------
-# Group by Local authority and combine Very bad and Bad
-figure4_badhealth_bylocalauthority = data_healthbyage_RUCmerge[data_healthbyage_RUCmerge['Health Status'].isin(['1. Very bad','2. Bad'])].groupby('Area Code').agg({'Count':'sum',
-            'Population':'first',})
-figure4_badhealth_bylocalauthority['proportion'] = figure4_badhealth_bylocalauthority['Count'] / figure4_badhealth_bylocalauthority['Population']
-
-# Group into ~ equal percentage bins
-figure4_badhealth_bylocalauthority.loc[(figure4_badhealth_bylocalauthority['proportion'] < 0.09),'proportion_bin'] = '1: 7 to 9 %'
-figure4_badhealth_bylocalauthority.loc[(figure4_badhealth_bylocalauthority['proportion'] >= 0.09) 
-                       & (figure4_badhealth_bylocalauthority['proportion'] < 0.11),'proportion_bin'] = '2: 9 to 11 %'
-figure4_badhealth_bylocalauthority.loc[(figure4_badhealth_bylocalauthority['proportion'] >= 0.11) 
-                       & (figure4_badhealth_bylocalauthority['proportion'] < 0.13),'proportion_bin'] = '3: 11 to 13 %'
-figure4_badhealth_bylocalauthority.loc[(figure4_badhealth_bylocalauthority['proportion'] >= 0.13) 
-                       & (figure4_badhealth_bylocalauthority['proportion'] < 0.15),'proportion_bin'] = '4: 13 to 15 %'
-figure4_badhealth_bylocalauthority.loc[(figure4_badhealth_bylocalauthority['proportion'] >= 0.15) 
-                       & (figure4_badhealth_bylocalauthority['proportion'] < 0.17),'proportion_bin'] = '5: 15 to 17 %'
-figure4_badhealth_bylocalauthority.loc[(figure4_badhealth_bylocalauthority['proportion'] >= 0.17),'proportion_bin'] = '6: 17 to 24 %'
 
+#%% SENSITIVITY - Figures 1(a) and 3 under random LSOA 2011 to 2021 assignment
 # -----------------------------------------------------------------------------
-# Merge in geodata area lookups so can map local authority to region
-figure4_badhealth_bylocalauthority = figure4_badhealth_bylocalauthority.reset_index()
-figure4_badhealth_bylocalauthority = pd.merge(figure4_badhealth_bylocalauthority, geocode_mapping_2021_LAD, how = 'left', left_on = 'Area Code', right_on = 'lad22cd')
-
-# Export for mapping visualisation
-# figure4_badhealth_bylocalauthority.to_csv('Census2021GeneralHealthbyLAD21CDandRUC2011_combinedbad.csv')
+# Where LSOA 2021 matches to multiple 2011 codes, choose a 2011 code at random (in proportion to crosswalk share) and
+# recompute 65+ totals by RUC, and by RUC and IMD quintile. Repeat for many random draws to get interval estimates.
+# workers > 1 runs draws across a process pool - only use when running the script as a whole, not cell by cell
+@pipeline.stage(inputs = ['geodata', 'lsoa_merge', 'ruc', 'imd'], params = {'n_draws': 1000, 'seed': 2023, 'workers': 1},
+                depends = [crosswalk_sensitivity])
+def sensitivity(geodata, lsoa_merge, ruc, imd, n_draws, seed, workers):
+    return crosswalk_sensitivity.crosswalk_sensitivity(crosswalk = geodata['crosswalk_LSOA'],
+                                                       population = lsoa_merge.set_index('lsoa21cd')['Age_65plus'],
+                                                       ruc11 = ruc['RUC_LSOA_lookup_englandwales'].set_index('LSOA11CD')['RUC2011_cat2'],
+                                                       decile11 = imd['deprivation_LSOA11CD'].set_index('LSOA11CD')['IMD_Decile_2019'],
+                                                       ruc21 = lsoa_merge.set_index('lsoa21cd')['RUC2011_cat2'],
+                                                       quintile21 = lsoa_merge.set_index('lsoa21cd')['IMD_Quintile_2019'],
+                                                       n_draws = n_draws, seed = seed, workers = workers)
 
 
+#%% FIGURE 4 - Proportion of population aged 65+ with very bad and bad health by local authority area
+@pipeline.stage(inputs = ['load_healthbyage', 'load_ruc_lad21', 'geodata'],
+                params = {'age_thresholds': [65, 75, 85], 'bin_edges': PROPORTION_BIN_EDGES, 'bin_labels': PROPORTION_BIN_LABELS},
+                depends = [GeneralHealth, instrumentation])
+def figure4(load_healthbyage, load_ruc_lad21, geodata, age_thresholds, bin_edges, bin_labels):
+    """Function to calculate proportion with very bad and bad health by local authority, binned for mapping"""
+    # -----------------------------------------------------------------------------
+    # Pivot general health data once into arrays by area, year, sex, age band and health status. Area code of City of London
+    # and Westminster is set to match Westminster, and Cornwall and Isles of Scilly to match Cornwall, for mapping
+    health_general = GeneralHealth.from_frame(load_healthbyage)
+
+    # Proportions in each health status and combined Very bad and Bad, for all years and sexes, aged 65+, 75+ and 85+
+    data_healthbyage_proportions = health_general.proportions(min_ages = age_thresholds)
+    data_healthbyage_badhealth = health_general.bad_health(min_ages = age_thresholds, bin_edges = bin_edges, bin_labels = bin_labels)
+
+    # -----------------------------------------------------------------------------
+    # Select Persons, 2021, aged 65+
+    data_healthbyage_filter_grouped = data_healthbyage_proportions[(data_healthbyage_proportions['Sex'] == 'Persons')
+                                                                   & (data_healthbyage_proportions['Year'] == 2021)
+                                                                   & (data_healthbyage_proportions['Min age'] == 65)]
+
+    # -----------------------------------------------------------------------------
+    # Join 2011 local authority level rural-urban classification to Local authority level general health population size and proportions
+    data_healthbyage_RUCmerge = instrumentation.merge('Figure 4: general health to LAD RUC', data_healthbyage_filter_grouped, load_ruc_lad21, how = 'left', left_on = 'Area Code', right_on = 'Local Authority District Area 2021 Code')
+
+    # Fill gaps where groupings don't match due to aggregations
+    data_healthbyage_RUCmerge.loc[(data_healthbyage_RUCmerge['Local Authority'] == 'Cornwall and Isles of Scilly'),'Rural Urban Classification 2011 (3 fold)'] = 'Predominantly Rural'
+    data_healthbyage_RUCmerge.loc[(data_healthbyage_RUCmerge['Local Authority'] == 'City of London and Westminster'),'Rural Urban Classification 2011 (3 fold)'] = 'Predominantly Urban'
+
+    # Export for mapping
+    # data_healthbyage_RUCmerge.to_csv('Census2021GeneralHealthbyLAD21CDandRUC2011.csv')
+
+    # -----------------------------------------------------------------------------
+    # Combined Very bad and Bad by Local authority, grouped into ~ equal percentage bins
+    figure4_badhealth_bylocalauthority = data_healthbyage_badhealth[(data_healthbyage_badhealth['Sex'] == 'Persons')
+                                                                    & (data_healthbyage_badhealth['Year'] == 2021)
+                                                                    & (data_healthbyage_badhealth['Min age'] == 65)]
+    figure4_badhealth_bylocalauthority = figure4_badhealth_bylocalauthority[['Area Code','Count','Population','proportion','proportion_bin']]
+
+    # -----------------------------------------------------------------------------
+    # Merge in geodata area lookups so can map local authority to region
+    figure4_badhealth_bylocalauthority = instrumentation.merge('Figure 4: bad health to LAD geocodes', figure4_badhealth_bylocalauthority, geodata['geocode_mapping_2021_LAD'], how = 'left', left_on = 'Area Code', right_on = 'lad22cd')
+
+    # Export for mapping visualisation
+    # figure4_badhealth_bylocalauthority.to_csv('Census2021GeneralHealthbyLAD21CDandRUC2011_combinedbad.csv')
+
+    return {'data_healthbyage_proportions': data_healthbyage_proportions,
+            'data_healthbyage_badhealth': data_healthbyage_badhealth,
+            'data_healthbyage_RUCmerge': data_healthbyage_RUCmerge,
+            'figure4_badhealth_bylocalauthority': figure4_badhealth_bylocalauthority,
+            }
+
+
+#%% Run pipeline
+# -----------------------------------------------------------------------------
+# Figures can be selected on the command line, e.g. python CMOresponse_GitHub.py --figures 2,4. Only the stages and
+# source files the selected figures need are loaded - Figure 2 only reads the projections and RUC11_LAD19CD_level.csv.
+# Stages unchanged since the last run are loaded from .cache/stages, so only stages downstream of a change re-run.
+# Independent stages (source file loads, figure tables) run concurrently
+FIGURE_STAGES = {'1a': 'figure1a',
+                 '1b': 'figure1b',
+                 '1c': 'figure1c',
+                 '2': 'figure2',
+                 '3': 'figure3',
+                 '4': 'figure4',
+                 'sensitivity': 'sensitivity',
+                 'lsoa': 'lsoa_merge', # LSOA level table
+                 }
+
+# Output variable -> (stage, key within stage output or None)
+FIGURE_OUTPUTS = {'data_combined_LSOA': ('lsoa_merge', None),
+                  'figure1c_65plus_bins': ('figure1c', 'figure1c_65plus_bins'),
+                  'figure1c_65plus_within': ('figure1c', 'figure1c_65plus_within'),
+                  'figure1a_65plus_byRUC_Overall': ('figure1a', None),
+                  'figure1b_65plus_byRUCandRegion': ('figure1b', None),
+                  'figure2_populationprojections_byRUC': ('figure2', 'figure2_populationprojections_byRUC'),
+                  'figure3_65plus_byRUCandIMD': ('figure3', None),
+                  'figure1a_65plus_byRUC_Overall_sensitivity': ('sensitivity', 'figure1a'),
+                  'figure3_65plus_byRUCandIMD_sensitivity': ('sensitivity', 'figure3'),
+                  'figure4_badhealth_bylocalauthority': ('figure4', 'figure4_badhealth_bylocalauthority'),
+                  }
+
+
+# -----------------------------------------------------------------------------
+def figure_stages(figures):
+    """Function to return stage names for comma separated list of figures, e.g. '2,4'. '1' selects 1a, 1b and 1c, 'all' selects all"""
+    stages = []
+    for figure in [figure.strip() for figure in figures.split(',') if figure.strip()]:
+        if figure == 'all':
+            selected = list(FIGURE_STAGES.values())
+        elif figure == '1':
+            selected = [FIGURE_STAGES['1a'], FIGURE_STAGES['1b'], FIGURE_STAGES['1c']]
+        elif figure in FIGURE_STAGES:
+            selected = [FIGURE_STAGES[figure]]
+        else:
+            raise ValueError(f"Unknown figure '{figure}', options are 'all', '1', {list(FIGURE_STAGES)}")
+        stages += [stage_name for stage_name in selected if stage_name not in stages]
+    return stages
+
+
+# -----------------------------------------------------------------------------
+def main(argv = None):
+    """Function to run pipeline for figures selected on command line. Returns dict of output variable -> table"""
+    import argparse
+    import os
+    parser = argparse.ArgumentParser(description = 'Census 2021 and population projection tables for CMO annual report 2023')
+    parser.add_argument('--figures', default = 'all', help = "comma separated figures to produce, e.g. '2,4'. Options: all, 1, " + ', '.join(FIGURE_STAGES))
+    parser.add_argument('--workers', type = int, default = os.cpu_count() or 1, help = 'number of stages (e.g. file loads) run concurrently, default number of CPUs')
+    parser.add_argument('--no-cache', action = 'store_true', help = 'ignore and do not write stage cache or cached copies of source files, read source CSVs directly')
+    parser.add_argument('--report', default = None, help = 'write JSON run report (stage time, memory, row counts, join key coverage) to this path. '
+                                                            'Stages run one at a time. Use with --no-cache to record every stage')
+    parser.add_argument('--report-time-only', action = 'store_true', help = 'do not trace memory in run report - tracemalloc slows stages several times over')
+    parser.add_argument('--export-bins', default = None, help = 'write Figure 1c binned 65+ population to this compact columnar file for mapping, '
+                                                                 'e.g. Census2021_65plus_LSOA_hexbins.parquet')
+    args = parser.parse_args(argv)
+
+    try:
+        targets = figure_stages(args.figures)
+    except ValueError as error:
+        parser.error(str(error))
+    if args.export_bins and 'figure1c' not in targets:
+        parser.error('--export-bins needs Figure 1c, e.g. --figures 1c')
+    print('Source files:', *pipeline.source_files(targets), sep = '\n  ')
+    print('Stages:', *[f'{stage_name}: {action}' for stage_name, action in pipeline.plan(targets, use_cache = not args.no_cache).items()], sep = '\n  ')
+    recorder = instrumentation.RunRecorder(trace_memory = not args.report_time_only) if args.report else None
+    results = pipeline.run(targets, workers = args.workers, use_cache = not args.no_cache, recorder = recorder)
+    if recorder is not None:
+        print(f'\nRun report written to {recorder.write(args.report)}, slowest stages:\n{recorder.summary().head(5)}')
+    if args.export_bins:
+        print(f"\nFigure 1c bins written to {write_aggregates(results['figure1c']['figure1c_65plus_bins'], args.export_bins)}")
+    return {name: results[stage_name] if key is None else results[stage_name][key]
+            for name, (stage_name, key) in FIGURE_OUTPUTS.items() if stage_name in targets}
+
+
+if __name__ == '__main__':
+    outputs = main()
+    # Output tables, None for figures not selected
+    data_combined_LSOA = outputs.get('data_combined_LSOA')
+    figure1a_65plus_byRUC_Overall = outputs.get('figure1a_65plus_byRUC_Overall')
+    figure1b_65plus_byRUCandRegion = outputs.get('figure1b_65plus_byRUCandRegion')
+    figure1c_65plus_bins = outputs.get('figure1c_65plus_bins')
+    figure1c_65plus_within = outputs.get('figure1c_65plus_within')
+    figure2_populationprojections_byRUC = outputs.get('figure2_populationprojections_byRUC')
+    figure3_65plus_byRUCandIMD = outputs.get('figure3_65plus_byRUCandIMD')
+    figure1a_65plus_byRUC_Overall_sensitivity = outputs.get('figure1a_65plus_byRUC_Overall_sensitivity')
+    figure3_65plus_byRUCandIMD_sensitivity = outputs.get('figure3_65plus_byRUCandIMD_sensitivity')
+    figure4_badhealth_bylocalauthority = outputs.get('figure4_badhealth_bylocalauthority')
+    for name, table in outputs.items():
+        print(f'\n{name}\n{table}')
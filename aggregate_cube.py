@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Pre-computed aggregate cube of LSOA level population by area dimensions x 5-year age band
+
+LSOA rows are summed once into cells - one cell per observed combination of the dimension columns (e.g. region, LAD,
+ICB, RUC, IMD quintile) - with a dense cells x age bands matrix of population counts. Only combinations that occur are
+stored, so the cube stays small however many dimensions are added. Cumulative sums over age bands are stored too, so
+population aged N+ (or in any age range on band boundaries) is a column lookup.
+
+Any figure table grouped by a subset of dimensions is then a bincount over cells, rather than another groupby over all
+LSOA rows.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from grouping import group_sums
+
+
+#%% Define functions
+# -----------------------------------------------------------------------------
+def band_start_age(col):
+    """Function to return start age of age band column name, e.g. 'Age_Under5' -> 0, 'Age_65to69' -> 65, 'Age_85plus' -> 85"""
+    if 'Under' in col:
+        return 0
+    match = re.search(r'\d+', col)
+    if match is None:
+        raise ValueError(f"Cannot read start age from age band column '{col}'")
+    return int(match.group())
+
+
+#%% AggregateCube
+# -----------------------------------------------------------------------------
+class AggregateCube:
+    """Population by observed combination of dimensions (cells) x age band"""
+
+    def __init__(self, dims, labels, cell_codes, bands, band_starts, values, attrs):
+        self.dims = dims  # list of dimension column names
+        self.labels = labels  # dim -> np.array of labels, position = code
+        self.cell_codes = cell_codes  # (n_cells, n_dims) codes, -1 where missing
+        self.bands = bands  # list of age band column names
+        self.band_starts = np.asarray(band_starts)
+        self.values = values  # (n_cells, n_bands) population
+        # Cumulative population from each band upwards: cumulative[:, j] = population aged band_starts[j]+
+        self.cumulative = np.cumsum(values[:, ::-1], axis = 1)[:, ::-1]
+        self.attrs = attrs  # dim -> {attribute column: np.array aligned to dim codes}
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def from_frame(cls, data, dims, bands, attrs = None):
+        """Function to build cube from LSOA level data. dims are dimension columns, bands are age band columns in age
+        order, attrs optionally maps a dimension to attribute columns that depend on it (e.g. {'rgn22cd': ['rgn22nm']})"""
+        attrs = attrs if attrs is not None else {}
+        codes = np.empty((len(data), len(dims)), dtype = np.int64)
+        labels, attr_values = {}, {}
+        for i, dim in enumerate(dims):
+            dim_codes, uniques = pd.factorize(data[dim], sort = True)
+            codes[:, i] = dim_codes
+            labels[dim] = np.asarray(uniques)
+            if dim in attrs:
+                # First row for each code
+                first = np.unique(dim_codes, return_index = True)
+                first_pos = first[1][first[0] >= 0]
+                attr_values[dim] = {col: data[col].to_numpy(dtype = object)[first_pos] for col in attrs[dim]}
+
+        cell_codes, cell_ids = np.unique(codes, axis = 0, return_inverse = True)
+        cell_ids = cell_ids.ravel()
+        values = group_sums(cell_ids, data[bands].to_numpy(dtype = np.float64), len(cell_codes))
+        return cls(list(dims), labels, cell_codes, list(bands), [band_start_age(col) for col in bands], values, attr_values)
+
+    # -------------------------------------------------------------------------
+    def band_index(self, age):
+        """Function to return position of age band starting at age"""
+        matches = np.flatnonzero(self.band_starts == age)
+        if matches.size == 0:
+            raise ValueError(f'Age {age} is not the start of an age band, band start ages are {self.band_starts.tolist()}')
+        return matches[0]
+
+    # -------------------------------------------------------------------------
+    def population(self, min_age = 0, max_age = None):
+        """Function to return population of each cell aged min_age and over, and under max_age if given. Ages must be
+        band start ages. The last band is open-ended (e.g. 85+), so max_age cannot be above its start"""
+        result = self.cumulative[:, self.band_index(min_age)]
+        if max_age is not None:
+            if max_age > self.band_starts.max():
+                raise ValueError(f'max_age {max_age} is above the start of the last, open-ended age band ({self.band_starts.max()}+)')
+            result = result - self.cumulative[:, self.band_index(max_age)]
+        return result
+
+    # -------------------------------------------------------------------------
+    def table(self, by, min_age = 0, max_age = None, name = None):
+        """Function to return population aged min_age+ (under max_age if given) summed by dimensions in by, as a
+        DataFrame with one row per observed combination, sorted by dimensions. Rows missing any dimension in by are dropped"""
+        if name is None:
+            name = f'Age_{min_age}plus' if max_age is None else f'Age_{min_age}to{max_age - 1}'
+        positions = [self.dims.index(dim) for dim in by]
+        sub_codes = self.cell_codes[:, positions]
+        keep = (sub_codes >= 0).all(axis = 1)
+        groups, group_ids = np.unique(sub_codes[keep], axis = 0, return_inverse = True)
+        totals = group_sums(group_ids.ravel(), self.population(min_age, max_age)[keep], len(groups))
+
+        table = pd.DataFrame({dim: self.labels[dim][groups[:, i]] for i, dim in enumerate(by)})
+        for i, dim in enumerate(by):
+            for col, values in self.attrs.get(dim, {}).items():
+                table[col] = values[groups[:, i]]
+        table[name] = np.round(totals).astype(np.int64)
+        return table
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite for the CMO response pipeline, run on synthetic data (see synthetic_data.py)
+
+Synthetic input files are generated once per scale and seed into the benchmark directory. Every stage of the pipeline
+in CMOresponse_GitHub.py - file loads, geodata, IMD, RUC, LSOA merge, cube, each figure table - is then run in
+dependency order, one stage at a time, without the stage cache:
+    - wall time: best of --repeats runs
+    - peak memory: one further run under tracemalloc, peak allocated while the stage runs over memory held before it.
+      Memory allocated by pyarrow's own allocator is not traced
+
+Results are compared with stored baselines for the same scale, and stages slower or using more memory than baseline
+by more than the tolerances are reported as regressions (exit code 1). Each baseline records the machine, library
+versions, scale and seed it was measured with. benchmark_baseline.json holds reference baselines; times are only
+comparable on the machine that recorded them, so against a baseline from another machine only memory regressions
+fail the run - record a baseline for the machine with --update-baseline.
+
+Usage:
+    python benchmark.py --scale 1 --repeats 3
+    python benchmark.py --scale 1 --update-baseline
+    python benchmark.py --scale 0.1 --stages figure2,figure4
+"""
+
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import synthetic_data
+from CMOresponse_GitHub import pipeline
+from config import FILES
+
+BENCHMARK_DIR = os.path.join('.cache', 'benchmark')
+BASELINE_PATH = 'benchmark_baseline.json'
+
+# Differences smaller than these are treated as noise, whatever the tolerance
+MIN_TIME_DIFF = 0.05  # seconds
+MIN_MEMORY_DIFF = 1.0  # MB
+
+
+#%% Define functions
+# -----------------------------------------------------------------------------
+def prepare_data(scale = 1.0, seed = 0, benchmark_dir = BENCHMARK_DIR):
+    """Function to return directory of synthetic input files for scale and seed, generating them if not present.
+    Directory is keyed on the generator code too, so files are regenerated when synthetic_data.py changes"""
+    version = hashlib.sha256(inspect.getsource(synthetic_data).encode()).hexdigest()[:8]
+    data_dir = os.path.abspath(os.path.join(benchmark_dir, f'scale{scale:g}_seed{seed}_{version}'))
+    if not all(os.path.exists(os.path.join(data_dir, path)) for path in FILES.values()):
+        print(f'Generating synthetic data, scale {scale:g}, seed {seed} -> {data_dir}')
+        synthetic_data.generate(data_dir, scale = scale, seed = seed)
+    return data_dir
+
+
+# -----------------------------------------------------------------------------
+def run_stages(stage_names, trace_memory = False):
+    """Function to run stages in order, one at a time. Returns dict of stage name -> wall time (s) or, if
+    trace_memory, peak memory allocated while the stage runs (MB)"""
+    outputs, results = {}, {}
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        for stage_name in stage_names:
+            if trace_memory:
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            outputs[stage_name] = pipeline.call(stage_name, outputs)
+            elapsed = time.perf_counter() - start
+            if trace_memory:
+                results[stage_name] = (tracemalloc.get_traced_memory()[1] - before) / 1e6
+            else:
+                results[stage_name] = elapsed
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return results
+
+
+# -----------------------------------------------------------------------------
+def benchmark(data_dir, targets = None, repeats = 3, cold = False):
+    """Function to time and memory profile stages needed for targets (default all) on input files in data_dir.
+    cold = True removes the data cache before each run, so load stages include CSV parsing. Returns DataFrame with one
+    row per stage: time_s (best of repeats), peak_mb"""
+    stage_names = pipeline.upstream(targets if targets is not None else pipeline.sinks())
+    cwd = os.getcwd()
+    os.chdir(data_dir)
+    try:
+        times = []
+        for _ in range(repeats):
+            if cold:
+                shutil.rmtree('.cache', ignore_errors = True)
+            times.append(run_stages(stage_names))
+        if cold:
+            shutil.rmtree('.cache', ignore_errors = True)
+        memory = run_stages(stage_names, trace_memory = True)
+    finally:
+        os.chdir(cwd)
+    return pd.DataFrame({'time_s': pd.DataFrame(times).min(axis = 0),
+                         'peak_mb': pd.Series(memory)}).rename_axis('stage')
+
+
+# -----------------------------------------------------------------------------
+def machine_info():
+    """Function to return description of machine and library versions benchmark runs on"""
+    return {'platform': platform.platform(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            }
+
+
+# -----------------------------------------------------------------------------
+def same_machine(info, baseline):
+    """Function to return whether baseline was recorded on a machine matching info"""
+    return all(baseline.get(field) == info[field] for field in ['platform', 'machine', 'processor', 'cpu_count'])
+
+
+# -----------------------------------------------------------------------------
+def load_baseline(path = BASELINE_PATH):
+    """Function to return stored baselines, dict of run name -> {'stages': {stage: {'time_s', 'peak_mb'}}, ...}"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+# -----------------------------------------------------------------------------
+def save_baseline(results, run_name, path = BASELINE_PATH, **settings):
+    """Function to store benchmark results as baseline for run_name, with machine info and settings (e.g. scale,
+    seed), keeping baselines of other runs"""
+    baselines = load_baseline(path)
+    baselines[run_name] = {'recorded': time.strftime('%Y-%m-%d'),
+                           **machine_info(),
+                           **settings,
+                           'stages': results.round(4).to_dict(orient = 'index'),
+                           }
+    with open(path, 'w') as f:
+        json.dump(baselines, f, indent = 2)
+
+
+# -----------------------------------------------------------------------------
+def compare(results, baseline, time_tolerance = 0.2, memory_tolerance = 0.2, check_time = True):
+    """Function to join results to baseline stage results and flag regressions: time (if check_time) or peak memory
+    above baseline by more than tolerance (fraction of baseline) and by more than noise threshold"""
+    baseline = pd.DataFrame.from_dict(baseline, orient = 'index').add_prefix('baseline_')
+    table = results.join(baseline, how = 'left')
+    table['time_ratio'] = table['time_s'] / table['baseline_time_s']
+    table['peak_ratio'] = table['peak_mb'] / table['baseline_peak_mb']
+    slower = ((table['time_s'] > table['baseline_time_s'] * (1 + time_tolerance))
+              & (table['time_s'] - table['baseline_time_s'] > MIN_TIME_DIFF)
+              & check_time)
+    larger = ((table['peak_mb'] > table['baseline_peak_mb'] * (1 + memory_tolerance))
+              & (table['peak_mb'] - table['baseline_peak_mb'] > MIN_MEMORY_DIFF))
+    table['regression'] = ''
+    table.loc[slower, 'regression'] = 'time'
+    table.loc[larger, 'regression'] = table.loc[larger, 'regression'].str.cat(['memory'] * larger.sum(), sep = ' ').str.strip()
+    return table
+
+
+#%% Command line
+# -----------------------------------------------------------------------------
+def main(argv = None):
+    """Function to run benchmark from command line arguments. Returns exit code, 1 if any stage regressed"""
+    parser = argparse.ArgumentParser(description = 'Time and memory profile pipeline stages on synthetic data')
+    parser.add_argument('--scale', type = float, default = 1.0, help = 'Scale factor on number of areas (1 = real ONS scale)')
+    parser.add_argument('--seed', type = int, default = 0, help = 'Random seed for synthetic data')
+    parser.add_argument('--stages', default = None, help = 'comma separated target stages, default all')
+    parser.add_argument('--repeats', type = int, default = 3, help = 'timed runs per stage, best is kept')
+    parser.add_argument('--cold', action = 'store_true', help = 'clear data cache before each run, so loads parse CSVs')
+    parser.add_argument('--baseline', default = BASELINE_PATH, help = 'baseline file')
+    parser.add_argument('--update-baseline', action = 'store_true', help = 'store results as baseline')
+    parser.add_argument('--time-tolerance', type = float, default = 0.2, help = 'allowed slowdown over baseline, fraction')
+    parser.add_argument('--memory-tolerance', type = float, default = 0.2, help = 'allowed peak memory increase over baseline, fraction')
+    args = parser.parse_args(argv)
+
+    data_dir = prepare_data(args.scale, args.seed)
+    targets = args.stages.split(',') if args.stages else None
+    results = benchmark(data_dir, targets = targets, repeats = args.repeats, cold = args.cold)
+    run_name = f'scale{args.scale:g}' + ('_cold' if args.cold else '')
+
+    if args.update_baseline:
+        save_baseline(results, run_name, args.baseline, scale = args.scale, seed = args.seed, repeats = args.repeats, cold = args.cold)
+        print(results.round(3).to_string())
+        print(f'Baseline {run_name} saved to {args.baseline}')
+        return 0
+
+    baseline = load_baseline(args.baseline).get(run_name)
+    if baseline is None:
+        print(results.round(3).to_string())
+        print(f'No baseline {run_name} in {args.baseline}, run with --update-baseline to store one')
+        return 0
+    check_time = same_machine(machine_info(), baseline)
+    table = compare(results, baseline['stages'], args.time_tolerance, args.memory_tolerance, check_time)
+    print(table.round(3).to_string())
+    print(f"Baseline {run_name}: recorded {baseline.get('recorded')} on {baseline.get('platform')}, {baseline.get('cpu_count')} CPUs, "
+          f"python {baseline.get('python')}, pandas {baseline.get('pandas')}")
+    if not check_time:
+        print('Baseline was recorded on a different machine, so times are not compared. Run with --update-baseline to record one for this machine')
+    regressions = table.index[table['regression'] != ''].tolist()
+    print(f"Total time {table['time_s'].sum():.2f} s, baseline {table['baseline_time_s'].sum():.2f} s")
+    if regressions:
+        print('Regressions:', ', '.join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
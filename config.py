@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+Source files read by CMOresponse_GitHub.py, by key. Paths are relative to the working directory the analysis is run
+from. Kept in their own module so tools that only need the file names (e.g. synthetic_data.py) do not import the
+analysis script and register all of its stages
+"""
+
+FILES = {
+    # Census 2021, Lower Super Output Area population by age, 5-year bands. https://www.nomisweb.co.uk/datasets/c2021ts007a
+    'census_ageband': r"census2021-ts007a-lsoa.csv",
+    # Census 2021, General health by age, sex and deprivation. Local authority table, Table 6 from: https://www.ons.gov.uk/peoplepopulationandcommunity/healthandsocialcare/healthandwellbeing/datasets/generalhealthbyagesexanddeprivationenglandandwales
+    'healthbyage': r"HealthByAgeSexDeprivation_Census20212011_LocalAuthority.csv",
+    # Subnational population projections. "Population projections for local authorities: Table 2" https://www.ons.gov.uk/peoplepopulationandcommunity/populationandmigration/populationprojections/datasets/localauthoritiesinenglandtable2
+    'projections': r"subnationalprojections_mid2018_LAD19version.csv",
+    # Area-level Deprivation lower super output area (LSOA) level data
+    # England 2019 https://www.gov.uk/government/statistics/english-indices-of-deprivation-2019
+    'imd_england': r"File_2_-_IoD2019_Domains_of_Deprivation.csv",
+    # Wales 2019 https://statswales.gov.wales/Catalogue/Community-Safety-and-Social-Inclusion/Welsh-Index-of-Multiple-Deprivation
+    'imd_wales': r"welsh-index-multiple-deprivation-2019-index-and-domain-ranks-by-small-area.csv",
+    # LSOA Rural-Urban Classification, 2011 England and Wales. https://www.gov.uk/government/collections/rural-urban-classification
+    'ruc_lsoa': r"Rural_Urban_Classification_2011_lookup_tables_for_small_area_geographies_EnglandWales.csv",
+    # Local authority level Rural-Urban classification 2011, England only. https://www.gov.uk/government/collections/rural-urban-classification
+    # Mapped to Local Authority 2021 boundaries
+    'ruc_lad21': r"RUC11_LAD21CD_level.csv",
+    # Mapped to Local Authority 2019 boundaries
+    'ruc_lad19': r"RUC11_LAD19CD_level.csv",
+    # Geodata lookup files
+    # Mapping from output area (OA) based on 2021 OA codes, OA to LSOA, MSOA, LA. https://geoportal.statistics.gov.uk/datasets/ons::output-area-to-lower-layer-super-output-area-to-middle-layer-super-output-area-to-local-authority-district-december-2021-lookup-in-england-and-wales-v2-1/about
+    'oa_lookup': r"OA21_LSOA21_MSOA21_LAD22_EW_LU.csv",
+    # Mapping from OA to Region based on 2021 OA codes, OA to Region. https://geoportal.statistics.gov.uk/datasets/efda0d0e14da4badbd8bdf8ae31d2f00/about
+    'oa_region': r"OA21_RGN22_LU.csv",
+    # Mapping from LSOA 2011 to 2021
+    'lsoa_lookup': r"LSOA_(2011)_to_LSOA_(2021)_to_Local_Authority_District_(2022)_Lookup_for_England_and_Wales_(Version_2).csv",
+    # Lat and Long positions of LSOAs, 2021 boundaries
+    'positions': r"Lower_layer_Super_Output_Areas_2021_EW_BSC_v2_7982568775378104300.csv",
+    # LSOA 2011 and LAD 2022 to 2022 NHS ICBs and sub-ICB locations
+    'nhs_lookup': r"LSOA11_LOC22_ICB22_LAD22_EN_LU.csv",
+    }
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Weighted LSOA 2011 <-> 2021 crosswalk held as a sparse allocation matrix
+
+Built from the ONS LSOA (2011) to LSOA (2021) lookup. Each row of the lookup is one (2011 LSOA, 2021 LSOA) pair, with
+a weight - equal shares by default, or e.g. 2021 population of the 2021 LSOA. Where LSOAs are unchanged or split, each
+2021 LSOA has a single 2011 parent so transfers are exact. Where LSOAs are merged or redrawn, values are combined across
+all 2011 parents by weight instead of taking the first parent listed (groupby().nth(0)).
+
+Transfers are a single sparse matrix-vector product:
+- to_2021(values, how = 'mean') - weighted mean over 2011 parents, for rates and scores
+- to_2021(values, how = 'sum') - split 2011 counts across 2021 children, for counts
+- to_2011(values, how = 'sum' / 'mean') - the same in the other direction
+- majority_2021(labels) - category with largest share of 2011 parents, for classifications (IMD decile, RUC, sub-ICB)
+- majority_parent_2021(labels) - one 2011 parent holding the majority category, so that several columns (e.g. IMD
+  decile and percentile) can all be taken from the same parent
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Added to the share of the first-listed 2011 parent, so that ties between categories in majority_2021 resolve to the
+# first parent, matching previous groupby().nth(0) behaviour
+TIEBREAK = 1e-9
+
+
+#%% Define functions
+# -----------------------------------------------------------------------------
+def normalise_rows(matrix):
+    """Function to scale rows of sparse matrix to sum to 1. Empty rows stay empty"""
+    totals = np.asarray(matrix.sum(axis = 1)).ravel()
+    scale = np.divide(1.0, totals, out = np.zeros_like(totals), where = totals > 0)
+    return sparse.diags(scale) @ matrix
+
+
+#%% LSOACrosswalk
+# -----------------------------------------------------------------------------
+class LSOACrosswalk:
+    """Sparse allocation matrix between 2011 and 2021 LSOA codes"""
+
+    def __init__(self, codes11, codes21, pair11, pair21, weights):
+        self.codes11 = pd.Index(codes11, name = 'LSOA11CD')
+        self.codes21 = pd.Index(codes21, name = 'LSOA21CD')
+        shape = (len(self.codes21), len(self.codes11))
+        # Raw pair weights, 2021 LSOAs in rows, 2011 LSOAs in columns
+        self.matrix = sparse.csr_matrix((weights, (pair21, pair11)), shape = shape)
+        # Share of each 2021 LSOA coming from each 2011 parent (rows sum to 1)
+        self.shares_2021 = normalise_rows(self.matrix).tocsr()
+        # Share of each 2011 LSOA going to each 2021 child (columns sum to 1)
+        self.shares_2011 = normalise_rows(self.matrix.T.tocsr()).T.tocsr()
+        # First-listed 2011 parent of each 2021 LSOA, for tie-breaks
+        order = np.unique(pair21, return_index = True)[1]
+        self.first_parent = sparse.csr_matrix((np.full(order.size, TIEBREAK), (pair21[order], pair11[order])), shape = shape)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def from_lookup(cls, lookup, weights = None, code11 = 'LSOA11CD', code21 = 'LSOA21CD'):
+        """Function to build crosswalk from lookup with one row per (2011, 2021) LSOA pair. weights is None for equal
+        shares, a column name in lookup, or a pd.Series of weights indexed by 2021 LSOA code (e.g. population)"""
+        lookup = lookup[lookup[code11].notna() & lookup[code21].notna()]
+        pair11, codes11 = pd.factorize(lookup[code11].astype(str), sort = True)
+        pair21, codes21 = pd.factorize(lookup[code21].astype(str), sort = True)
+        if weights is None:
+            pair_weights = np.ones(len(lookup))
+        elif isinstance(weights, str):
+            pair_weights = lookup[weights].to_numpy(dtype = np.float64)
+        else:
+            pair_weights = weights.reindex(codes21).to_numpy(dtype = np.float64)[pair21]
+        # Pairs with missing or zero weight fall back to equal share, so no pair drops out of the crosswalk
+        pair_weights = np.where(np.isfinite(pair_weights) & (pair_weights > 0), pair_weights, 1.0)
+        return cls(codes11, codes21, pair11, pair21, pair_weights)
+
+    # -------------------------------------------------------------------------
+    def vector(self, data, key, col, year = 2011):
+        """Function to align column of data, keyed on LSOA code column key, to crosswalk order for year 2011 or 2021"""
+        codes = self.codes11 if year == 2011 else self.codes21
+        data = data[data[key].notna()].drop_duplicates(subset = key)
+        return pd.Series(data[col].to_numpy(), index = data[key].astype(str).to_numpy()).reindex(codes).to_numpy()
+
+    # -------------------------------------------------------------------------
+    def to_2021(self, values, how = 'mean'):
+        """Function to transfer values aligned to 2011 codes onto 2021 codes. how = 'mean' (weighted mean over 2011
+        parents, missing values ignored) or 'sum' (2011 counts split across 2021 children)"""
+        if how == 'mean':
+            return weighted_mean(self.shares_2021, values)
+        if how == 'sum':
+            return self.shares_2011 @ np.nan_to_num(np.asarray(values, dtype = np.float64))
+        raise ValueError(f"how must be 'mean' or 'sum', not '{how}'")
+
+    # -------------------------------------------------------------------------
+    def to_2011(self, values, how = 'sum'):
+        """Function to transfer values aligned to 2021 codes onto 2011 codes. how = 'sum' (2021 counts split across
+        2011 parents) or 'mean' (weighted mean over 2021 children, missing values ignored)"""
+        if how == 'sum':
+            return self.shares_2021.T @ np.nan_to_num(np.asarray(values, dtype = np.float64))
+        if how == 'mean':
+            return weighted_mean(self.shares_2011.T.tocsr(), values)
+        raise ValueError(f"how must be 'sum' or 'mean', not '{how}'")
+
+    # -------------------------------------------------------------------------
+    def _majority_ids(self, label_ids, n_labels):
+        """Function to return id of label with largest share of 2011 parents for each 2021 LSOA, -1 where no parent has a label"""
+        has_label = label_ids >= 0
+        onehot = sparse.csr_matrix((np.ones(has_label.sum()), (np.flatnonzero(has_label), label_ids[has_label])),
+                                   shape = (len(self.codes11), max(n_labels, 1)))
+        label_shares = ((self.shares_2021 + self.first_parent) @ onehot).tocoo()
+        return row_argmax(label_shares, len(self.codes21))
+
+    # -------------------------------------------------------------------------
+    def majority_2021(self, labels):
+        """Function to transfer categorical labels aligned to 2011 codes onto 2021 codes, taking the label with the
+        largest share of 2011 parents. Ties go to the label of the first-listed parent. Missing where no parent has a label"""
+        label_ids, uniques = pd.factorize(pd.Series(labels, dtype = object), sort = True)
+        winner = self._majority_ids(label_ids, len(uniques))
+        result = np.full(len(self.codes21), None, dtype = object)
+        result[winner >= 0] = np.asarray(uniques, dtype = object)[winner[winner >= 0]]
+        return result
+
+    # -------------------------------------------------------------------------
+    def majority_parent_2021(self, labels):
+        """Function to return position (in codes11) of one 2011 parent of each 2021 LSOA, holding the label
+        majority_2021 gives: of the parents with that label, the one with the largest share, then the first-listed,
+        then the lowest code. -1 where no parent has a label"""
+        label_ids, uniques = pd.factorize(pd.Series(labels, dtype = object), sort = True)
+        winner = self._majority_ids(label_ids, len(uniques))
+        pairs = (self.shares_2021 + self.first_parent).tocoo()
+        keep = (label_ids[pairs.col] >= 0) & (label_ids[pairs.col] == winner[pairs.row])
+        pairs = sparse.coo_matrix((pairs.data[keep], (pairs.row[keep], pairs.col[keep])), shape = pairs.shape)
+        return row_argmax(pairs, len(self.codes21))
+
+    # -------------------------------------------------------------------------
+    def frame_2021(self, data, key, columns, how = 'majority', by = None):
+        """Function to transfer columns of 2011 LSOA keyed data onto 2021 codes. Returns one row per 2021 LSOA, with
+        'LSOA21CD' column. how = 'majority', 'mean' or 'sum', applied to all columns. With how = 'majority' and by a
+        column name, one 2011 parent is chosen per 2021 LSOA by majority of column by (majority_parent_2021), and every
+        column is taken from that parent, so columns stay consistent with each other (e.g. IMD decile and percentile)"""
+        result = pd.DataFrame({'LSOA21CD': self.codes21.to_numpy()})
+        parent = self.majority_parent_2021(self.vector(data, key, by)) if how == 'majority' and by is not None else None
+        for col in columns:
+            values = self.vector(data, key, col)
+            if how != 'majority':
+                result[col] = self.to_2021(values.astype(np.float64), how = how)
+                continue
+            if parent is None:
+                result[col] = self.majority_2021(values)
+            else:
+                result[col] = np.where(parent >= 0, np.asarray(values, dtype = object)[parent], None)
+            # Restore numeric dtype of numeric labels (e.g. deciles), with missing as NaN
+            if pd.api.types.is_numeric_dtype(data[col]):
+                result[col] = pd.to_numeric(result[col])
+        return result
+
+
+# -----------------------------------------------------------------------------
+def row_argmax(matrix, n_rows):
+    """Function to return column of largest positive entry in each row of sparse matrix (lowest column on exact ties),
+    -1 for rows with none. Sorts entries by row, then largest value, and takes the first entry of each row, without a
+    Python loop over rows"""
+    matrix = matrix.tocoo()
+    keep = matrix.data > 0
+    rows, cols, values = matrix.row[keep], matrix.col[keep], matrix.data[keep]
+    order = np.lexsort((cols, -values, rows))
+    found, first = np.unique(rows[order], return_index = True)
+    result = np.full(n_rows, -1, dtype = np.int64)
+    result[found] = cols[order][first]
+    return result
+
+
+# -----------------------------------------------------------------------------
+def weighted_mean(shares, values):
+    """Function to take weighted mean of values over non-zero entries in each row of share matrix, ignoring missing values"""
+    values = np.asarray(values, dtype = np.float64)
+    present = ~np.isnan(values)
+    numerator = shares @ np.where(present, values, 0.0)
+    denominator = shares @ present.astype(np.float64)
+    return np.divide(numerator, denominator, out = np.full(numerator.shape, np.nan), where = denominator > 0)
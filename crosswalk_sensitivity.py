@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Monte Carlo sensitivity of the LSOA level figure tables to the LSOA 2011 -> 2021 assignment
+
+Where a 2021 LSOA is formed from more than one 2011 LSOA (merged or redrawn), its IMD and RUC could come from any of
+its 2011 parents. Each draw picks one 2011 parent at random for every such 2021 LSOA (probability = crosswalk share),
+and Figure 1(a) (65+ by RUC 2 fold) and Figure 3 (65+ by RUC 2 fold and IMD quintile) are recomputed. 2021 LSOAs with
+a single 2011 parent are the same in every draw, so their totals are computed once and only ambiguous LSOAs are drawn.
+Draws are compared with the figure tables, which take IMD and RUC of each 2021 LSOA from its majority 2011 parent (see
+LSOACrosswalk.frame_2021).
+
+Draws are batched as NumPy arrays (one draw per row) and split into chunks, each chunk seeded from its own
+np.random.SeedSequence child, so results are the same whatever the number of worker processes.
+"""
+
+import concurrent.futures
+import os
+
+import numpy as np
+import pandas as pd
+
+from grouping import group_sums
+
+
+#%% Define functions
+# -----------------------------------------------------------------------------
+def draw_parents(indptr, indices, cum_shares, rows, u):
+    """Function to pick one 2011 parent for each 2021 row in rows, for each draw. u is (n_draws, len(rows)) uniform
+    random numbers. Returns (n_draws, len(rows)) array of 2011 ids"""
+    start = indptr[rows]
+    end = indptr[rows + 1]
+    before = np.where(start > 0, cum_shares[np.maximum(start - 1, 0)], 0.0)
+    target = before + u * (cum_shares[end - 1] - before)
+    pos = np.searchsorted(cum_shares, target, side = 'right')
+    # Clip to the row's own entries, guarding against rounding in the cumulative sum
+    pos = np.clip(pos, start, end - 1)
+    return indices[pos]
+
+
+# -----------------------------------------------------------------------------
+def sum_by_draw(codes, weights, n_codes):
+    """Function to sum weights by code separately for each draw (row). codes is (n_draws, m) with -1 for missing,
+    weights is (m,). Returns (n_draws, n_codes)"""
+    # Each draw is a column grouped by its own codes
+    return group_sums(codes.T, np.broadcast_to(weights[:, None], codes.T.shape), n_codes).T
+
+
+# -----------------------------------------------------------------------------
+def simulate_chunk(seed, n_draws, indptr, indices, cum_shares, rows, weights, ruc_ids, quintile_ids, n_ruc, n_quintile):
+    """Function to run one chunk of draws. Returns 65+ totals by RUC (n_draws, n_ruc) and by RUC x IMD quintile
+    (n_draws, n_ruc * n_quintile) for ambiguous 2021 LSOAs only"""
+    rng = np.random.default_rng(seed)
+    parents = draw_parents(indptr, indices, cum_shares, rows, rng.random((n_draws, rows.size)))
+    ruc = ruc_ids[parents]
+    quintile = quintile_ids[parents]
+    ruc_quintile = np.where((ruc >= 0) & (quintile >= 0), ruc * n_quintile + quintile, -1)
+    return sum_by_draw(ruc, weights, n_ruc), sum_by_draw(ruc_quintile, weights, n_ruc * n_quintile)
+
+
+# -----------------------------------------------------------------------------
+def summarise(draws, baseline, index, interval):
+    """Function to summarise draws (n_draws, n_cells) as mean and interval estimate per cell"""
+    alpha = (1 - interval) / 2
+    return pd.DataFrame({'Age_65plus_figure': baseline,
+                         'Age_65plus_mean': draws.mean(axis = 0),
+                         'Age_65plus_lower': np.quantile(draws, alpha, axis = 0),
+                         'Age_65plus_upper': np.quantile(draws, 1 - alpha, axis = 0),
+                         }, index = index)
+
+
+# -----------------------------------------------------------------------------
+def crosswalk_sensitivity(crosswalk, population, ruc11, decile11, ruc21, quintile21, n_draws = 1000, seed = 0,
+                          chunk_size = 250, workers = 1, interval = 0.95):
+    """Function to run Monte Carlo draws over ambiguous LSOA 2011 -> 2021 assignments.
+
+    crosswalk - LSOACrosswalk
+    population - pd.Series of population aged 65+ indexed by 2021 LSOA code
+    ruc11 - pd.Series of RUC 2011 2 fold category indexed by 2011 LSOA code
+    decile11 - pd.Series of IMD 2019 decile indexed by 2011 LSOA code
+    ruc21, quintile21 - pd.Series of RUC 2011 2 fold category and IMD 2019 quintile indexed by 2021 LSOA code, as used
+                        in the figure tables
+    workers - number of worker processes. 1 runs in this process
+
+    Returns dict with 'figure1a' (by RUC2011_cat2) and 'figure3' (by RUC2011_cat2 and IMD_Quintile_2019) tables of
+    Age_65plus as in the figure tables (Age_65plus_figure), mean over draws and interval bounds, plus raw 'draws'"""
+    shares = crosswalk.shares_2021
+    weights = population.reindex(crosswalk.codes21).fillna(0).to_numpy(dtype = np.float64)
+
+    # Label ids of each 2011 LSOA, -1 where missing
+    ruc_ids, ruc_labels = pd.factorize(ruc11.reindex(crosswalk.codes11).astype(object), sort = True)
+    quintile = np.ceil(decile11.reindex(crosswalk.codes11).to_numpy(dtype = np.float64) / 2)
+    quintile_labels = np.arange(1, 6, dtype = np.float64)
+    quintile_ids = np.where(np.isnan(quintile), -1, quintile - 1).astype(np.int64)
+    n_ruc, n_quintile = len(ruc_labels), len(quintile_labels)
+
+    # Split 2021 LSOAs into fixed (one 2011 parent) and ambiguous (several 2011 parents)
+    n_parents = np.diff(shares.indptr)
+    fixed = np.flatnonzero(n_parents == 1)
+    rows = np.flatnonzero(n_parents > 1)
+    fixed_parents = shares.indices[shares.indptr[fixed]][None, :]
+    fixed_ruc = ruc_ids[fixed_parents]
+    fixed_ruc_quintile = np.where((fixed_ruc >= 0) & (quintile_ids[fixed_parents] >= 0), fixed_ruc * n_quintile + quintile_ids[fixed_parents], -1)
+    fixed_1a = sum_by_draw(fixed_ruc, weights[fixed], n_ruc)[0]
+    fixed_3 = sum_by_draw(fixed_ruc_quintile, weights[fixed], n_ruc * n_quintile)[0]
+
+    # Baseline: labels of each 2021 LSOA in the figure tables
+    base_ruc = pd.Index(ruc_labels).get_indexer(ruc21.reindex(crosswalk.codes21).astype(object))[None, :]
+    base_quintile = pd.Index(quintile_labels).get_indexer(quintile21.reindex(crosswalk.codes21).to_numpy(dtype = np.float64))[None, :]
+    base_ruc_quintile = np.where((base_ruc >= 0) & (base_quintile >= 0), base_ruc * n_quintile + base_quintile, -1)
+    baseline_1a = sum_by_draw(base_ruc, weights, n_ruc)[0]
+    baseline_3 = sum_by_draw(base_ruc_quintile, weights, n_ruc * n_quintile)[0]
+
+    # Draws, in chunks with independent seeds
+    chunk_sizes = [min(chunk_size, n_draws - start) for start in range(0, n_draws, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+    common = (shares.indptr, shares.indices, np.cumsum(shares.data), rows, weights[rows], ruc_ids, quintile_ids, n_ruc, n_quintile)
+    if workers == 1:
+        results = [simulate_chunk(chunk_seed, size, *common) for chunk_seed, size in zip(seeds, chunk_sizes)]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers = workers or os.cpu_count()) as executor:
+            futures = [executor.submit(simulate_chunk, chunk_seed, size, *common) for chunk_seed, size in zip(seeds, chunk_sizes)]
+            results = [future.result() for future in futures]
+    draws_1a = fixed_1a + np.concatenate([result[0] for result in results])
+    draws_3 = fixed_3 + np.concatenate([result[1] for result in results])
+
+    index_1a = pd.Index(np.asarray(ruc_labels, dtype = object), name = 'RUC2011_cat2')
+    index_3 = pd.MultiIndex.from_product([index_1a, quintile_labels], names = ['RUC2011_cat2', 'IMD_Quintile_2019'])
+    figure3 = summarise(draws_3, baseline_3, index_3, interval)
+    # Drop cells with no population in any draw, as groupby would
+    figure3 = figure3[(draws_3 > 0).any(axis = 0) | (baseline_3 > 0)]
+    return {'figure1a': summarise(draws_1a, baseline_1a, index_1a, interval).reset_index(),
+            'figure3': figure3.reset_index(),
+            'draws': {'figure1a': draws_1a, 'figure3': draws_3},
+            }
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Typed, column-pruned cache for the CSV inputs used in CMOresponse_GitHub.py
+
+Each source file is read once with an explicit schema - only the columns the analysis uses, with geography codes stored
+as categoricals - and written to a columnar (Parquet) file in the cache directory. The cache file name includes a hash
+of the source file contents, the schema and the CSV engine, so replacing or editing a source file, or changing its
+schema or engine, invalidates the cached copy automatically.
+"""
+
+import glob
+import hashlib
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+CACHE_DIR = '.cache'
+
+# sha256 of each source file by file_id, so a file is read for hashing once per process, although both the pipeline
+# stage keys and the cache key of its cached copy depend on it
+_file_hashes = {}
+
+# pyarrow CSV engine parses in native threads without holding the GIL, so several files can be read concurrently from a
+# thread pool. Falls back to the default C engine where pyarrow is not installed
+CSV_ENGINE = 'pyarrow' if PARQUET_AVAILABLE else 'c'
+
+# -----------------------------------------------------------------------------
+# Column schemas for each source file. 'usecols' lists the columns to keep (None keeps all columns), 'dtype' gives
+# explicit types. Geography codes and repeated labels are stored as categoricals. Population projections are not
+# listed, they are streamed in chunks by projections.py rather than loaded through the cache
+CENSUS_AGEBAND_COLUMNS = ['Age: Total',
+                          'Age: Aged 4 years and under',
+                          'Age: Aged 5 to 9 years',
+                          'Age: Aged 10 to 14 years',
+                          'Age: Aged 15 to 19 years',
+                          'Age: Aged 20 to 24 years',
+                          'Age: Aged 25 to 29 years',
+                          'Age: Aged 30 to 34 years',
+                          'Age: Aged 35 to 39 years',
+                          'Age: Aged 40 to 44 years',
+                          'Age: Aged 45 to 49 years',
+                          'Age: Aged 50 to 54 years',
+                          'Age: Aged 55 to 59 years',
+                          'Age: Aged 60 to 64 years',
+                          'Age: Aged 65 to 69 years',
+                          'Age: Aged 70 to 74 years',
+                          'Age: Aged 75 to 79 years',
+                          'Age: Aged 80 to 84 years',
+                          'Age: Aged 85 years and over',
+                          ]
+
+SCHEMAS = {
+    'census2021-ts007a-lsoa.csv': {
+        'usecols': ['geography code'] + CENSUS_AGEBAND_COLUMNS,
+        'dtype': {'geography code': 'category', **{col: 'int32' for col in CENSUS_AGEBAND_COLUMNS}},
+        },
+    'HealthByAgeSexDeprivation_Census20212011_LocalAuthority.csv': {
+        'usecols': ['Year', 'Area Code', 'Local Authority', 'Sex', 'Age', 'Health Status', 'Count', 'Population'],
+        'dtype': {'Year': 'int16', 'Area Code': 'str', 'Local Authority': 'str', 'Sex': 'category', 'Age': 'category',
+                  'Health Status': 'str', 'Count': 'float64', 'Population': 'float64'},
+        },
+    'File_2_-_IoD2019_Domains_of_Deprivation.csv': {
+        'usecols': ['LSOA code (2011)',
+                    'Index of Multiple Deprivation (IMD) Rank (where 1 is most deprived)',
+                    'Index of Multiple Deprivation (IMD) Decile (where 1 is most deprived 10% of LSOAs)',
+                    'Income Decile (where 1 is most deprived 10% of LSOAs)',
+                    'Health Deprivation and Disability Decile (where 1 is most deprived 10% of LSOAs)'],
+        'dtype': {'LSOA code (2011)': 'category',
+                  'Index of Multiple Deprivation (IMD) Rank (where 1 is most deprived)': 'str',
+                  'Index of Multiple Deprivation (IMD) Decile (where 1 is most deprived 10% of LSOAs)': 'int8',
+                  'Income Decile (where 1 is most deprived 10% of LSOAs)': 'int8',
+                  'Health Deprivation and Disability Decile (where 1 is most deprived 10% of LSOAs)': 'int8'},
+        },
+    'welsh-index-multiple-deprivation-2019-index-and-domain-ranks-by-small-area.csv': {
+        'usecols': ['LSOA Code', 'WIMD 2019 Overall Rank ', 'WIMD 2019 Overall Decile'],
+        'dtype': {'LSOA Code': 'category', 'WIMD 2019 Overall Rank ': 'int32', 'WIMD 2019 Overall Decile': 'int8'},
+        },
+    'Rural_Urban_Classification_2011_lookup_tables_for_small_area_geographies_EnglandWales.csv': {
+        'usecols': ['Lower Super Output Area 2011 Code',
+                    'Rural Urban Classification 2011 code',
+                    'Rural Urban Classification 2011 (10 fold)',
+                    'Rural Urban Classification 2011 (2 fold)'],
+        'dtype': {'Lower Super Output Area 2011 Code': 'category',
+                  'Rural Urban Classification 2011 code': 'category',
+                  'Rural Urban Classification 2011 (10 fold)': 'category',
+                  'Rural Urban Classification 2011 (2 fold)': 'category'},
+        },
+    'RUC11_LAD21CD_level.csv': {
+        'usecols': None,
+        'dtype': {'Local Authority District Area 2021 Code': 'category'},
+        },
+    'RUC11_LAD19CD_level.csv': {
+        'usecols': None,
+        'dtype': {'Local Authority District Area 2019 Code': 'category'},
+        },
+    'OA21_LSOA21_MSOA21_LAD22_EW_LU.csv': {
+        'usecols': ['oa21cd', 'lsoa21cd', 'lsoa21nm', 'msoa21cd', 'msoa21nm', 'lad22cd', 'lad22nm', 'lad22nmw'],
+        'dtype': {'oa21cd': 'str', 'lsoa21cd': 'category', 'lsoa21nm': 'category', 'msoa21cd': 'category',
+                  'msoa21nm': 'category', 'lad22cd': 'category', 'lad22nm': 'category', 'lad22nmw': 'category'},
+        },
+    'OA21_RGN22_LU.csv': {
+        'usecols': ['oa21cd', 'rgn22cd', 'rgn22nm', 'rgn22nmw'],
+        'dtype': {'oa21cd': 'str', 'rgn22cd': 'category', 'rgn22nm': 'category', 'rgn22nmw': 'category'},
+        },
+    'LSOA_(2011)_to_LSOA_(2021)_to_Local_Authority_District_(2022)_Lookup_for_England_and_Wales_(Version_2).csv': {
+        'usecols': ['LSOA11CD', 'LSOA21CD', 'CHGIND', 'LAD22CD'],
+        'dtype': {'LSOA11CD': 'category', 'LSOA21CD': 'category', 'CHGIND': 'category', 'LAD22CD': 'category'},
+        },
+    'Lower_layer_Super_Output_Areas_2021_EW_BSC_v2_7982568775378104300.csv': {
+        'usecols': ['LSOA21CD', 'LAT', 'LONG'],
+        'dtype': {'LSOA21CD': 'category', 'LAT': 'float64', 'LONG': 'float64'},
+        },
+    'LSOA11_LOC22_ICB22_LAD22_EN_LU.csv': {
+        'usecols': ['LSOA11CD', 'LOC22CD', 'LOC22CDH', 'LOC22NM', 'ICB22CD', 'ICB22CDH', 'ICB22NM', 'LAD22CD'],
+        'dtype': {'LSOA11CD': 'category', 'LOC22CD': 'category', 'LOC22CDH': 'category', 'LOC22NM': 'category',
+                  'ICB22CD': 'category', 'ICB22CDH': 'category', 'ICB22NM': 'category', 'LAD22CD': 'category'},
+        },
+    }
+
+
+#%% Define functions
+# -----------------------------------------------------------------------------
+def file_hash(path, chunk_size = 1 << 20):
+    """Function to return sha256 hex digest of file contents, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# -----------------------------------------------------------------------------
+def file_id(path):
+    """Function to return absolute path, modified time and size of file, which change when the file is edited"""
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+# -----------------------------------------------------------------------------
+def source_hash(path):
+    """Function to return file_hash of source file, hashed once per process for each file_id"""
+    key = file_id(path)
+    if key not in _file_hashes:
+        _file_hashes[key] = file_hash(path)
+    return _file_hashes[key]
+
+
+# -----------------------------------------------------------------------------
+def cache_key(path, schema, engine = CSV_ENGINE):
+    """Function to return cache key from source file contents, schema and CSV parser engine (engines can parse
+    columns not typed in the schema to different dtypes)"""
+    digest = hashlib.sha256(source_hash(path).encode())
+    digest.update(repr(sorted(schema.items())).encode())
+    digest.update(engine.encode())
+    return digest.hexdigest()[:16]
+
+
+# -----------------------------------------------------------------------------
+def read_csv_typed(path, schema = None, engine = CSV_ENGINE):
+    """Function to read CSV file using explicit schema, keeping only listed columns"""
+    if schema is None:
+        schema = SCHEMAS.get(os.path.basename(path), {})
+    data = pd.read_csv(path, usecols = schema.get('usecols'), dtype = schema.get('dtype'), engine = engine)
+    # Columns in schema order, whichever engine is used
+    return data[schema['usecols']] if schema.get('usecols') is not None else data
+
+
+# -----------------------------------------------------------------------------
+def write_table(data, path):
+    """Function to write data to columnar file. Uses Parquet where pyarrow is installed, pickle otherwise. Written to a
+    temporary file and then renamed, so an interrupted write never leaves a partial file at path. Returns path written"""
+    if PARQUET_AVAILABLE:
+        path = os.path.splitext(path)[0] + '.parquet'
+        data.to_parquet(path + '.tmp', index = False)
+    else:
+        path = os.path.splitext(path)[0] + '.pkl'
+        data.to_pickle(path + '.tmp', compression = None)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+# -----------------------------------------------------------------------------
+def read_table(path):
+    """Function to read file written by write_table"""
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+
+# -----------------------------------------------------------------------------
+def load_csv(path, cache_dir = CACHE_DIR, use_cache = True, engine = CSV_ENGINE):
+    """Function to load CSV source file through typed, column-pruned cache. Cache is rebuilt when the contents of the
+    source file, its schema or the engine change. use_cache = False reads the CSV without reading or writing the cache"""
+    schema = SCHEMAS.get(os.path.basename(path), {})
+    if not use_cache:
+        return read_csv_typed(path, schema, engine)
+
+    stem = os.path.splitext(os.path.basename(path))[0]
+    key = cache_key(path, schema, engine)
+    ext = '.parquet' if PARQUET_AVAILABLE else '.pkl'
+    cache_path = os.path.join(cache_dir, stem + '.' + key + ext)
+    if os.path.exists(cache_path):
+        return read_table(cache_path)
+
+    # Cold read: parse CSV with schema, write cache, then remove stale copies of the same file once the new copy is in place
+    data = read_csv_typed(path, schema, engine)
+    os.makedirs(cache_dir, exist_ok = True)
+    write_table(data, cache_path)
+    for stale_path in glob.glob(os.path.join(glob.escape(cache_dir), glob.escape(stem) + '.*')):
+        if stale_path != cache_path:
+            os.remove(stale_path)
+    return data
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+General health by age and sex for local authorities, for all years, sexes and age thresholds at once
+
+The Census general health table (Table 6, one row per area, year, sex, age band and health status) is pivoted once
+into arrays of counts by (area, year, sex, age band, health status) and population by (area, year, sex, age band).
+Cumulative sums over age bands give counts and population aged N+ for every band start N, so proportions in each
+health status, the combined bad / very bad proportion and its bin are calculated for every year, sex and age
+threshold in one pass, instead of filtering and grouping the table once per slice.
+
+Area codes are harmonised with a remap table from combined area name to the code used for mapping.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+# -----------------------------------------------------------------------------
+# Health status, renamed to be alphabetical for mapping
+HEALTH_STATUS_RENAME = {'Very good':'5. Very good',
+                        'Good':'4. Good',
+                        'Fair':'3. Fair',
+                        'Bad':'2. Bad',
+                        'Very bad':'1. Very bad',
+                        }
+BAD_HEALTH_STATUS = ['Bad', 'Very bad']
+
+# Area code for combined areas, to match mapping boundaries. Westminster E09000033, Cornwall E06000052
+AREA_CODE_REMAP = {'Cornwall and Isles of Scilly':'E06000052',
+                   'City of London and Westminster':'E09000033',
+                   }
+
+# ~ equal percentage bins for proportion with bad or very bad health
+PROPORTION_BIN_EDGES = [0.09, 0.11, 0.13, 0.15, 0.17]
+PROPORTION_BIN_LABELS = ['1: 7 to 9 %', '2: 9 to 11 %', '3: 11 to 13 %', '4: 13 to 15 %', '5: 15 to 17 %', '6: 17 to 24 %']
+
+
+#%% Define functions
+# -----------------------------------------------------------------------------
+def age_band_start(age):
+    """Function to return start age of age band label, e.g. '65 to 69' -> 65, '90+' -> 90"""
+    match = re.match(r'\s*(\d+)', str(age))
+    if match is None:
+        raise ValueError(f"Cannot read start age from age band '{age}'")
+    return int(match.group(1))
+
+
+# -----------------------------------------------------------------------------
+def bin_proportion(proportion, edges = PROPORTION_BIN_EDGES, labels = PROPORTION_BIN_LABELS):
+    """Function to bin array of proportions, lower edge inclusive. Missing proportions stay missing"""
+    labels = np.append(np.asarray(labels, dtype = object), None)
+    bins = np.digitize(proportion, edges)
+    return labels[np.where(np.isnan(proportion), len(labels) - 1, bins)]
+
+
+#%% GeneralHealth
+# -----------------------------------------------------------------------------
+class GeneralHealth:
+    """Counts by (area, year, sex, age band, health status) and population by (area, year, sex, age band)"""
+
+    def __init__(self, area_codes, area_names, years, sexes, ages, statuses, counts, population):
+        self.area_codes = np.asarray(area_codes, dtype = object)
+        self.area_names = np.asarray(area_names, dtype = object)
+        self.years = np.asarray(years)
+        self.sexes = np.asarray(sexes, dtype = object)
+        self.ages = list(ages)
+        self.age_starts = np.array([age_band_start(age) for age in self.ages])
+        self.statuses = list(statuses)
+        self.counts = counts
+        self.population = population
+        # Counts and population aged band start+, by summing from oldest band down
+        self.counts_cumulative = np.flip(np.cumsum(np.flip(counts, axis = 3), axis = 3), axis = 3)
+        self.population_cumulative = np.flip(np.cumsum(np.flip(population, axis = 3), axis = 3), axis = 3)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def from_frame(cls, data, area_code_remap = AREA_CODE_REMAP):
+        """Function to pivot general health table into arrays, applying area code remap by area name"""
+        raw_ids, raw_codes = pd.factorize(data['Area Code'], sort = True)
+        first = np.unique(raw_ids, return_index = True)[1]
+        raw_names = data['Local Authority'].to_numpy(dtype = object)[first]
+        remap = pd.Series(area_code_remap, dtype = object)
+        remapped = pd.Series(raw_names).map(remap).fillna(pd.Series(np.asarray(raw_codes, dtype = object))).to_numpy(dtype = object)
+        # Areas in order of remapped code, as when grouping by area code after the remap
+        code_ids, area_codes = pd.factorize(remapped, sort = True)
+        area_ids = code_ids[raw_ids]
+        area_names = raw_names[np.unique(code_ids, return_index = True)[1]]
+
+        year_ids, years = pd.factorize(data['Year'], sort = True)
+        sex_ids, sexes = pd.factorize(data['Sex'].astype(object), sort = True)
+        ages = sorted(data['Age'].astype(object).unique(), key = age_band_start)
+        age_ids = pd.Index(ages).get_indexer(data['Age'].astype(object))
+        present = set(data['Health Status'].unique())
+        statuses = [status for status in HEALTH_STATUS_RENAME if status in present]
+        status_ids = pd.Index(statuses).get_indexer(data['Health Status'])
+        if (status_ids < 0).any():
+            unknown = data.loc[status_ids < 0, 'Health Status'].unique().tolist()
+            raise ValueError(f'Unknown health status: {unknown}')
+
+        shape = (len(area_codes), len(years), len(sexes), len(ages))
+        counts = np.zeros(shape + (len(statuses),))
+        np.add.at(counts, (area_ids, year_ids, sex_ids, age_ids, status_ids), data['Count'].to_numpy(dtype = np.float64))
+        # Population of age band is repeated on each health status row
+        population = np.zeros(shape)
+        population[area_ids, year_ids, sex_ids, age_ids] = data['Population'].to_numpy(dtype = np.float64)
+        return cls(area_codes, area_names, np.asarray(years), np.asarray(sexes, dtype = object), ages, statuses, counts, population)
+
+    # -------------------------------------------------------------------------
+    def _age_positions(self, min_ages):
+        """Function to return age band positions of each min_age"""
+        positions = []
+        for min_age in min_ages:
+            matches = np.flatnonzero(self.age_starts == min_age)
+            if matches.size == 0:
+                raise ValueError(f'Age {min_age} is not the start of an age band, band start ages are {self.age_starts.tolist()}')
+            positions.append(matches[0])
+        return positions
+
+    # -------------------------------------------------------------------------
+    def _grid(self, min_ages, extra = None):
+        """Function to return long DataFrame of area, year, sex, min age (and extra dimension) combinations, in array order"""
+        dims = [np.arange(len(self.area_codes)), self.years, self.sexes, np.asarray(min_ages)]
+        names = ['area', 'Year', 'Sex', 'Min age']
+        if extra is not None:
+            dims.append(np.asarray(extra[1], dtype = object))
+            names.append(extra[0])
+        grid = pd.MultiIndex.from_product(dims, names = names).to_frame(index = False)
+        grid.insert(0, 'Local Authority', self.area_names[grid['area'].to_numpy()])
+        grid.insert(0, 'Area Code', self.area_codes[grid['area'].to_numpy()])
+        return grid.drop(columns = 'area')
+
+    # -------------------------------------------------------------------------
+    def proportions(self, min_ages = (65,)):
+        """Function to return count, population and proportion in each health status, aged min_age+, for every area,
+        year, sex and min_age. Health status renamed to be alphabetical. Combinations with no population are dropped"""
+        positions = self._age_positions(min_ages)
+        counts = self.counts_cumulative[:, :, :, positions, :]
+        population = np.broadcast_to(self.population_cumulative[:, :, :, positions, None], counts.shape)
+        table = self._grid(min_ages, ('Health Status', [HEALTH_STATUS_RENAME[status] for status in self.statuses]))
+        table['Count'] = counts.ravel()
+        table['Population'] = population.ravel()
+        table = table[table['Population'] > 0].reset_index(drop = True)
+        table['proportion'] = table['Count'] / table['Population']
+        return table
+
+    # -------------------------------------------------------------------------
+    def bad_health(self, min_ages = (65,), bin_edges = PROPORTION_BIN_EDGES, bin_labels = PROPORTION_BIN_LABELS):
+        """Function to return combined bad and very bad health count, population, proportion and proportion bin, aged
+        min_age+, for every area, year, sex and min_age. Combinations with no population are dropped"""
+        positions = self._age_positions(min_ages)
+        bad = [self.statuses.index(status) for status in BAD_HEALTH_STATUS if status in self.statuses]
+        counts = self.counts_cumulative[:, :, :, positions, :][..., bad].sum(axis = -1)
+        population = self.population_cumulative[:, :, :, positions]
+        table = self._grid(min_ages)
+        table['Count'] = counts.ravel()
+        table['Population'] = population.ravel()
+        table = table[table['Population'] > 0].reset_index(drop = True)
+        table['proportion'] = table['Count'] / table['Population']
+        table['proportion_bin'] = bin_proportion(table['proportion'].to_numpy(), bin_edges, bin_labels)
+        return table
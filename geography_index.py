@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Integer-coded geography hierarchy for Census 2021 areas
+
+Output area (OA) -> LSOA -> MSOA -> local authority (LAD) -> Region, and LSOA -> NHS sub-ICB location -> ICB.
+Each level is stored as dense integer ids (0 to n-1) with a parent-pointer array to the next level up, so any vector of
+values at one level can be rolled up to a higher level with a single np.bincount, and code <-> id <-> name lookups
+are hash lookups rather than string merges.
+"""
+
+import numpy as np
+import pandas as pd
+
+from grouping import group_sums
+
+# -----------------------------------------------------------------------------
+# Level definitions: code column and name columns in the lookup files
+LEVELS = {'oa': {'code': 'oa21cd', 'names': []},
+          'lsoa': {'code': 'lsoa21cd', 'names': ['lsoa21nm']},
+          'msoa': {'code': 'msoa21cd', 'names': ['msoa21nm']},
+          'lad': {'code': 'lad22cd', 'names': ['lad22nm', 'lad22nmw']},
+          'rgn': {'code': 'rgn22cd', 'names': ['rgn22nm', 'rgn22nmw']},
+          'loc': {'code': 'LOC22CD', 'names': ['LOC22CDH', 'LOC22NM']},
+          'icb': {'code': 'ICB22CD', 'names': ['ICB22CDH', 'ICB22NM']},
+          }
+
+# Direct parent of each level. LSOA has two parents: the statistical (MSOA) and NHS (sub-ICB location) hierarchies
+PARENTS = {'oa': ['lsoa'],
+           'lsoa': ['msoa', 'loc'],
+           'msoa': ['lad'],
+           'lad': ['rgn'],
+           'rgn': [],
+           'loc': ['icb'],
+           'icb': [],
+           }
+
+
+#%% Define functions
+# -----------------------------------------------------------------------------
+def first_per_group(group_ids, n_groups):
+    """Function to return row position of first row for each group id, -1 where group has no rows"""
+    first = np.full(n_groups, -1, dtype = np.int64)
+    valid = group_ids >= 0
+    unique_ids, first_pos = np.unique(group_ids[valid], return_index = True)
+    first[unique_ids] = np.flatnonzero(valid)[first_pos]
+    return first
+
+
+#%% GeographyIndex
+# -----------------------------------------------------------------------------
+class GeographyIndex:
+    """Dense integer-coded geography hierarchy with parent-pointer arrays between levels"""
+
+    def __init__(self):
+        self.codes = {}  # level -> pd.Index of codes, position = integer id
+        self.names = {}  # level -> {name column: np.array aligned to ids}
+        self.parents = {}  # (level, parent level) -> np.array of parent ids, -1 where unknown
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def from_lookups(cls, oa_lookup, oa_region_lookup, nhs_lookup = None, crosswalk = None):
+        """Function to build index from OA21 -> LSOA21/MSOA21/LAD22 lookup, OA21 -> Region lookup and, optionally,
+        LSOA11 -> sub-ICB/ICB lookup together with LSOA 2011 -> 2021 crosswalk (LSOACrosswalk). Each 2021 LSOA takes
+        the sub-ICB location with the largest share of its 2011 parents"""
+        index = cls()
+        oa = pd.merge(oa_lookup, oa_region_lookup, how = 'left', on = 'oa21cd')
+
+        # Factorise each statistical level over OA rows
+        ids = {}
+        for level in ['oa', 'lsoa', 'msoa', 'lad', 'rgn']:
+            ids[level] = index._add_level(level, oa[LEVELS[level]['code']], oa)
+
+        # Parent pointers, taken from first OA row of each child
+        for level in ['oa', 'lsoa', 'msoa', 'lad']:
+            first = first_per_group(ids[level], len(index.codes[level]))
+            for parent in PARENTS[level]:
+                if parent in ids:
+                    index.parents[(level, parent)] = np.where(first >= 0, ids[parent][first], -1)
+
+        # NHS hierarchy. NHS lookup is keyed on 2011 LSOA, so 2021 LSOAs are mapped through 2011 LSOA
+        if nhs_lookup is not None and crosswalk is not None:
+            ids['loc'] = index._add_level('loc', nhs_lookup[LEVELS['loc']['code']], nhs_lookup)
+            ids['icb'] = index._add_level('icb', nhs_lookup[LEVELS['icb']['code']], nhs_lookup)
+            first = first_per_group(ids['loc'], len(index.codes['loc']))
+            index.parents[('loc', 'icb')] = ids['icb'][first]
+
+            # Sub-ICB location with largest share of 2011 parents
+            lsoa_loc = np.full(len(index.codes['lsoa']), -1, dtype = np.int64)
+            loc_codes = crosswalk.majority_2021(crosswalk.vector(nhs_lookup, 'LSOA11CD', LEVELS['loc']['code']))
+            lsoa_pos = index.lookup('lsoa', crosswalk.codes21.to_numpy())
+            loc_ids = index.lookup('loc', loc_codes)
+            keep = lsoa_pos >= 0
+            lsoa_loc[lsoa_pos[keep]] = loc_ids[keep]
+            index.parents[('lsoa', 'loc')] = lsoa_loc
+        return index
+
+    # -------------------------------------------------------------------------
+    def _add_level(self, level, codes, data):
+        """Function to factorise codes for level, store codes and names, and return id of each row"""
+        row_ids, uniques = pd.factorize(codes.astype(str).where(codes.notna()), sort = True)
+        self.codes[level] = pd.Index(uniques, name = LEVELS[level]['code'])
+        first = first_per_group(row_ids, len(uniques))
+        self.names[level] = {col: data[col].astype(object).to_numpy()[first] for col in LEVELS[level]['names'] if col in data.columns}
+        return row_ids.astype(np.int64)
+
+    # -------------------------------------------------------------------------
+    def size(self, level):
+        """Function to return number of areas at level"""
+        return len(self.codes[level])
+
+    # -------------------------------------------------------------------------
+    def lookup(self, level, codes):
+        """Function to return integer ids for array of area codes, -1 where code not found"""
+        return self.codes[level].get_indexer(np.asarray(codes, dtype = object))
+
+    # -------------------------------------------------------------------------
+    def code(self, level, ids):
+        """Function to return area codes for array of integer ids, None where id is -1 (e.g. code not found by lookup)"""
+        return np.append(self.codes[level].to_numpy(dtype = object), None)[ids]
+
+    # -------------------------------------------------------------------------
+    def name(self, level, codes, name_col = None):
+        """Function to return area names for array of area codes, None where code not found. Defaults to first name
+        column of level"""
+        if name_col is None:
+            name_col = LEVELS[level]['names'][0]
+        ids = self.lookup(level, codes)
+        names = np.append(self.names[level][name_col], None)
+        return names[ids]
+
+    # -------------------------------------------------------------------------
+    def parent(self, level, ancestor):
+        """Function to return array mapping each id at level to id at ancestor level, following parent pointers"""
+        if level == ancestor:
+            return np.arange(self.size(level))
+        if (level, ancestor) in self.parents:
+            return self.parents[(level, ancestor)]
+        for parent in PARENTS[level]:
+            if (level, parent) not in self.parents:
+                continue
+            try:
+                upper = self.parent(parent, ancestor)
+            except KeyError:
+                continue
+            step = self.parents[(level, parent)]
+            # Append -1 so that unknown parents (-1) stay unknown
+            mapping = np.append(upper, -1)[step]
+            self.parents[(level, ancestor)] = mapping
+            return mapping
+        raise KeyError(f"'{ancestor}' is not an ancestor of '{level}'")
+
+    # -------------------------------------------------------------------------
+    def rollup(self, values, level, ancestor):
+        """Function to sum values aligned to ids at level up to ancestor level. Accepts 1d (n,) or 2d (n, k) values.
+        Values where the parent is unknown are dropped"""
+        return group_sums(self.parent(level, ancestor), values, self.size(ancestor))
+
+    # -------------------------------------------------------------------------
+    def rollup_series(self, series, level, ancestor):
+        """Function to roll up pd.Series indexed by area codes at level to ancestor level, returned indexed by ancestor codes"""
+        values = group_sums(self.lookup(level, series.index), series.to_numpy(dtype = np.float64), self.size(level))
+        return pd.Series(self.rollup(values, level, ancestor), index = self.codes[ancestor], name = series.name)
+
+    # -------------------------------------------------------------------------
+    def to_frame(self, level, ancestors = None):
+        """Function to return one row per area at level, with codes and names of the area and its ancestors"""
+        if ancestors is None:
+            ancestors = [lev for lev in ['msoa', 'lad', 'rgn', 'loc', 'icb']
+                         if lev != level and lev in self.codes and self._is_ancestor(level, lev)]
+        data = {LEVELS[level]['code']: self.codes[level].to_numpy()}
+        data.update(self.names[level])
+        for ancestor in ancestors:
+            mapping = self.parent(level, ancestor)
+            data[LEVELS[ancestor]['code']] = np.append(self.codes[ancestor].to_numpy(), None)[mapping]
+            for col, names in self.names[ancestor].items():
+                data[col] = np.append(names, None)[mapping]
+        return pd.DataFrame(data)
+
+    # -------------------------------------------------------------------------
+    def _is_ancestor(self, level, ancestor):
+        """Function to check whether ancestor level can be reached from level"""
+        try:
+            self.parent(level, ancestor)
+        except KeyError:
+            return False
+        return True
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""
+Grouped sums of value arrays by integer group id
+
+Several columns are summed in a single np.bincount: each (group, column) pair gets its own flat id, group * k + column,
+so the sums come back as one (groups x columns) array without looping over columns. Used for the aggregate cube, the
+geography rollups, population projection and spatial bin totals, and the crosswalk sensitivity draws.
+"""
+
+import numpy as np
+
+
+#%% Define functions
+# -----------------------------------------------------------------------------
+def group_sums(group_ids, values, n_groups):
+    """Function to sum values by group id. values is (n,) or (n, k). group_ids is (n,), or (n, k) to group each column
+    of values separately. Entries with group id -1 are dropped. Returns (n_groups,) or (n_groups, k) array"""
+    group_ids = np.asarray(group_ids, dtype = np.int64)
+    values = np.asarray(values, dtype = np.float64)
+    if values.ndim == 1:
+        keep = group_ids >= 0
+        return np.bincount(group_ids[keep], weights = values[keep], minlength = n_groups)
+    k = values.shape[1]
+    group_ids = np.broadcast_to(group_ids[:, None] if group_ids.ndim == 1 else group_ids, values.shape)
+    keep = group_ids >= 0
+    # Offset each column into its own block, so all columns are summed in one bincount
+    flat_ids = (group_ids * k + np.arange(k))[keep]
+    return np.bincount(flat_ids, weights = values[keep], minlength = n_groups * k).reshape(n_groups, k)
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in run instrumentation: per-stage time, memory and row counts, and key coverage of joins
+
+A RunRecorder is attached to a pipeline run (Pipeline.run(recorder = ...), or --report on the command line). While it
+is recording:
+    - every stage records wall time, peak memory allocated while it runs (tracemalloc), row counts of its inputs and
+      outputs, and whether it ran or was loaded from the stage cache
+    - joins record row counts, the share of keys matched, a sample of unmatched keys, the count and share of non-null
+      values each joined column brings in and a sample of output keys (e.g. LSOA21CD) left null in each column. A key
+      can match and still bring in nothing (e.g. a source row with missing values), and a missing key has no value to
+      sample, so the non-null counts and null samples are the coverage that matters for the figures. Joins are recorded by the
+      analysis stages, not by the library modules: merges made through instrumentation.merge, transfers through the
+      LSOA 2011 -> 2021 crosswalk (record_crosswalk), sources of the LSOA table (record_sources) and record_join
+
+The report is written as JSON, so hot spots and changes in data coverage can be compared between runs. When no
+recorder is active the hooks return straight away.
+"""
+
+import contextlib
+import datetime
+import json
+import platform
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+# Number of unmatched keys, and of output keys left null per column, kept per join
+SAMPLE_SIZE = 10
+
+_active = None
+
+
+#%% Define functions
+# -----------------------------------------------------------------------------
+def active():
+    """Function to return recorder currently recording, or None"""
+    return _active
+
+
+# -----------------------------------------------------------------------------
+def count_rows(obj):
+    """Function to return row count of DataFrame, Series or array, dict of row counts for dict of tables, None otherwise"""
+    if isinstance(obj, (pd.DataFrame, pd.Series, np.ndarray)):
+        return int(len(obj))
+    if isinstance(obj, dict):
+        counts = {key: count_rows(value) for key, value in obj.items()}
+        counts = {key: count for key, count in counts.items() if count is not None}
+        return counts if counts else None
+    return None
+
+
+# -----------------------------------------------------------------------------
+def key_index(data, cols):
+    """Function to return join key of data as pd.Index, tuples where cols is a list of several columns"""
+    if isinstance(cols, (list, tuple)) and len(cols) > 1:
+        return pd.MultiIndex.from_frame(data[list(cols)]).to_flat_index()
+    col = cols[0] if isinstance(cols, (list, tuple)) else cols
+    return pd.Index(np.asarray(data[col], dtype = object))
+
+
+# -----------------------------------------------------------------------------
+def key_coverage(keys, reference, sample_size = SAMPLE_SIZE):
+    """Function to return count of keys, count found in reference, match rate and sample of distinct keys not found.
+    Missing keys count as not found"""
+    keys = pd.Index(np.asarray(keys, dtype = object))
+    found = keys.isin(pd.Index(np.asarray(reference, dtype = object)))
+    missing = pd.isna(keys)
+    unmatched = keys[~found & ~missing].unique()[:sample_size]
+    return {'keys': int(len(keys)),
+            'matched': int(found.sum()),
+            'match_rate': round(float(found.mean()), 6) if len(keys) else None,
+            'missing_keys': int(missing.sum()),
+            'unmatched_sample': [str(key) for key in unmatched],
+            }
+
+
+# -----------------------------------------------------------------------------
+def null_sample(filled, keys, sample_size = SAMPLE_SIZE):
+    """Function to return sample of distinct keys (aligned to rows of filled, e.g. LSOA21CD of output rows) left with a
+    null value, for each column of filled with any"""
+    keys = pd.Index(np.asarray(keys, dtype = object))
+    samples = {}
+    for col in filled.columns:
+        missing = keys[filled[col].isna().to_numpy()]
+        if len(missing):
+            samples[str(col)] = [str(key) for key in missing.unique()[:sample_size]]
+    return {'null_sample': samples}
+
+
+# -----------------------------------------------------------------------------
+def non_null(filled):
+    """Function to return count and share of non-null values in each column of DataFrame"""
+    counts = filled.notna().sum()
+    return {'non_null': {str(col): int(count) for col, count in counts.items()},
+            'non_null_rate': {str(col): round(float(count / len(filled)), 6) if len(filled) else None for col, count in counts.items()},
+            }
+
+
+# -----------------------------------------------------------------------------
+def record_join(name, keys, reference, filled = None, filled_keys = None, **counts):
+    """Function to record coverage of keys (e.g. left join keys) in reference (e.g. right join keys) on active
+    recorder. filled is optionally DataFrame of columns the join brought in, to count non-null values, and filled_keys
+    the output keys of its rows, to sample those left null. counts are extra fields, e.g. left_rows, output_rows. Does
+    nothing when not recording"""
+    if _active is not None:
+        _active.join(name, keys, reference, filled = filled, filled_keys = filled_keys, **counts)
+
+
+# -----------------------------------------------------------------------------
+def record_crosswalk(name, crosswalk, data, key, result):
+    """Function to record transfer of 2011 LSOA keyed data onto 2021 codes with LSOACrosswalk.frame_2021: coverage of
+    data[key] in crosswalk 2011 codes, and 2021 LSOAs left with a value of each transferred column"""
+    if _active is not None:
+        _active.join(name, data[key], crosswalk.codes11, filled = result.drop(columns = 'LSOA21CD'), filled_keys = result['LSOA21CD'],
+                     left_rows = len(data), output_rows = len(result))
+
+
+# -----------------------------------------------------------------------------
+def record_sources(builder, table):
+    """Function to record each source of LSOATableBuilder assembled into table: coverage of table join keys in source
+    keys, and non-null values of the columns the source added"""
+    if _active is not None:
+        for source in builder.sources:
+            _active.join(f"LSOA table: {source['name']}", table[source['on']], source['data'][source['key']],
+                         filled = table[source['columns']], filled_keys = table[builder.key],
+                         left_rows = len(table), right_rows = len(source['data']))
+
+
+# -----------------------------------------------------------------------------
+def merge(name, left, right, sample_key = None, **kwargs):
+    """Function to pd.merge left and right, recording row counts and coverage of left keys in right keys when recording.
+    sample_key is the column of the output identifying rows left with null added columns, the left join key if None"""
+    result = pd.merge(left, right, **kwargs)
+    if _active is not None:
+        left_on = kwargs.get('left_on', kwargs.get('on'))
+        right_on = kwargs.get('right_on', kwargs.get('on'))
+        on = left_on if isinstance(left_on, (list, tuple)) else [left_on]
+        added = [col for col in result.columns if col not in left.columns and col not in on]
+        _active.join(name, key_index(left, left_on), key_index(right, right_on), filled = result[added],
+                     filled_keys = key_index(result, left_on if sample_key is None else sample_key),
+                     left_rows = len(left), right_rows = len(right), output_rows = len(result))
+    return result
+
+
+#%% RunRecorder
+# -----------------------------------------------------------------------------
+class RunRecorder:
+    """Records stage timings, memory, row counts and join coverage for one pipeline run"""
+
+    def __init__(self, trace_memory = True, sample_size = SAMPLE_SIZE):
+        self.trace_memory = trace_memory
+        self.sample_size = sample_size
+        self.info = {}
+        self.stages = []
+        self.joins = []
+        self.current_stage = None
+
+    # -------------------------------------------------------------------------
+    @contextlib.contextmanager
+    def recording(self, **info):
+        """Context manager to make recorder active. info is added to the report (e.g. targets)"""
+        global _active
+        if _active is not None:
+            raise RuntimeError('Another recorder is already recording')
+        start_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if start_tracing:
+            tracemalloc.start()
+        self.info.update(info, started = datetime.datetime.now().isoformat(timespec = 'seconds'),
+                         python = platform.python_version(), pandas = pd.__version__)
+        start = time.perf_counter()
+        _active = self
+        try:
+            yield self
+        finally:
+            _active = None
+            self.info['wall_s'] = round(time.perf_counter() - start, 4)
+            if start_tracing:
+                self.info['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1e6, 3)
+                tracemalloc.stop()
+
+    # -------------------------------------------------------------------------
+    @contextlib.contextmanager
+    def stage(self, name, action, inputs = None, key = None):
+        """Context manager to record stage. Yields entry dict, output rows are added with set_output"""
+        entry = {'stage': name,
+                 'action': action,
+                 'key': key,
+                 'input_rows': {input_name: count_rows(value) for input_name, value in (inputs or {}).items()},
+                 }
+        self.current_stage = name
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            entry['wall_s'] = round(time.perf_counter() - start, 4)
+            entry['peak_mb'] = round((tracemalloc.get_traced_memory()[1] - before) / 1e6, 3) if tracing else None
+            self.stages.append(entry)
+            self.current_stage = None
+
+    # -------------------------------------------------------------------------
+    def set_output(self, entry, output):
+        """Function to add output row counts to stage entry"""
+        entry['output_rows'] = count_rows(output)
+
+    # -------------------------------------------------------------------------
+    def join(self, name, keys, reference, filled = None, filled_keys = None, **counts):
+        """Function to record coverage of keys in reference, and non-null values of columns in filled, in current stage.
+        filled_keys are optionally keys of the rows of filled, sampled where a column is null"""
+        entry = {'stage': self.current_stage, 'join': name}
+        entry.update({field: int(value) for field, value in counts.items()})
+        entry.update(key_coverage(keys, reference, self.sample_size))
+        if filled is not None:
+            entry.update(non_null(filled))
+            if filled_keys is not None:
+                entry.update(null_sample(filled, filled_keys, self.sample_size))
+        self.joins.append(entry)
+
+    # -------------------------------------------------------------------------
+    def report(self):
+        """Function to return report as dict: run info, stages in order run, joins"""
+        return {'run': self.info, 'stages': self.stages, 'joins': self.joins}
+
+    # -------------------------------------------------------------------------
+    def summary(self):
+        """Function to return DataFrame of stages, slowest first"""
+        table = pd.DataFrame(self.stages, columns = ['stage', 'action', 'wall_s', 'peak_mb'])
+        return table.sort_values('wall_s', ascending = False).reset_index(drop = True)
+
+    # -------------------------------------------------------------------------
+    def write(self, path):
+        """Function to write report to JSON file. Returns path"""
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent = 2)
+        return path
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Index-aligned builder for the combined LSOA level table (1 row per 2021 LSOA)
+
+Attribute sources (IMD, geocodes, positions, NHS, RUC...) are registered with the key they are indexed on, and the wide
+table is assembled in one pass by reindexing each source onto the base table rows, rather than through a chain of
+pd.merge calls that each copy the widening table. Every source must be unique on its key, so a join can never add rows.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+#%% Define functions
+# -----------------------------------------------------------------------------
+def minimal_dtype(series):
+    """Function to downcast numeric column to smallest dtype that holds values without loss"""
+    if pd.api.types.is_integer_dtype(series) and not isinstance(series.dtype, pd.CategoricalDtype):
+        return pd.to_numeric(series, downcast = 'integer')
+    if pd.api.types.is_float_dtype(series):
+        values = series.to_numpy(dtype = np.float64)
+        finite = values[~np.isnan(values)]
+        # Only downcast floats that hold whole numbers (codes, deciles, percentiles), so no precision is lost
+        if np.array_equal(finite, np.round(finite)) and (finite.size == 0 or np.abs(finite).max() < 2 ** 24):
+            return series.astype(np.float32)
+    return series
+
+
+#%% LSOATableBuilder
+# -----------------------------------------------------------------------------
+class LSOATableBuilder:
+    """Register attribute sources keyed on 2021 LSOA code (or on a column already in the table) and assemble wide table in one pass"""
+
+    def __init__(self, base, key = 'lsoa21cd'):
+        duplicated = base[key].duplicated()
+        if duplicated.any():
+            raise ValueError(f"Base table is not unique on '{key}', e.g. {base.loc[duplicated, key].head(5).to_list()}")
+        self.base = base
+        self.key = key
+        self.sources = []
+
+    # -------------------------------------------------------------------------
+    def add_source(self, name, data, key, columns, on = None, dtypes = None):
+        """Function to register source. Rows of data are matched on data[key] == table[on], where on defaults to the
+        table key. Only columns listed are added. dtypes optionally gives explicit dtypes, otherwise numeric columns are
+        downcast to the smallest dtype that holds them"""
+        data = data[data[key].notna()]
+        duplicated = data[key].duplicated()
+        if duplicated.any():
+            raise ValueError(f"Source '{name}' is not unique on '{key}' so join would add rows: "
+                             f"{duplicated.sum()} duplicated keys, e.g. {data.loc[duplicated, key].head(5).to_list()}")
+        existing = set(self.base.columns).union(*[set(source['columns']) for source in self.sources])
+        clash = [col for col in columns if col in existing]
+        if clash:
+            raise ValueError(f"Source '{name}' columns already in table: {clash}")
+        self.sources.append({'name': name,
+                             'data': data,
+                             'key': key,
+                             'columns': list(columns),
+                             'on': self.key if on is None else on,
+                             'dtypes': dtypes if dtypes is not None else {},
+                             })
+        return self
+
+    # -------------------------------------------------------------------------
+    def build(self):
+        """Function to assemble wide table: base table plus the requested columns of every source, aligned to base rows"""
+        added = {}
+        for source in self.sources:
+            on = source['on']
+            if on in added:
+                keys = added[on]
+            elif on in self.base.columns:
+                keys = self.base[on]
+            else:
+                raise KeyError(f"Source '{source['name']}' joins on '{on}', which is not in base table or an earlier source")
+
+            data = source['data']
+            aligned = (data.set_index(pd.Index(data[source['key']].astype(object), name = None))[source['columns']]
+                       .reindex(np.asarray(keys.astype(object))))
+            for col in source['columns']:
+                series = aligned[col].reset_index(drop = True)
+                series.index = self.base.index
+                if col in source['dtypes']:
+                    series = series.astype(source['dtypes'][col])
+                else:
+                    series = minimal_dtype(series)
+                added[col] = series
+
+        return pd.concat([self.base, pd.DataFrame(added, index = self.base.index)], axis = 1)
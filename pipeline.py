@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+Named pipeline stages with content-hash memoization
+
+Each stage is a function registered on a Pipeline with the stages it takes as inputs, its parameters and, for load
+stages, the source files it reads. The stage key is a hash of the stage's source code (and of any helper code it
+declares in depends), its parameters, the contents of its source files and the keys of its input stages. Outputs are
+pickled to disk under the key, so a stage only re-executes when something upstream of it has changed, and a cached
+stage does not need its inputs loaded at all. When a stage is rewritten, its outputs under older keys are deleted.
+
+depends lists the helper functions, classes and modules a stage calls. Helpers defined in the same module as the stage
+are hashed by their own source. Helpers from other modules are hashed with the whole module they are defined in, and
+the modules from the same directory that it imports, directly or indirectly - so a change to a private function a
+class calls, or to data_cache.py, reaches every stage that depends on it.
+
+Only the stages upstream of the requested targets are planned, so source files not needed for the targets are never
+read. Stages whose inputs are ready run concurrently on a thread pool - all load stages start at once, and with the
+pyarrow CSV engine (see data_cache.py) the reads run in parallel.
+
+Usage:
+    pipeline = Pipeline()
+
+    @pipeline.stage(files = ['data.csv'], memoize = False)
+    def load_data():
+        return pd.read_csv('data.csv')
+
+    @pipeline.stage(inputs = ['load_data'], params = {'min_age': 65})
+    def table(load_data, min_age):
+        ...
+
+    results = pipeline.run(['table'])
+"""
+
+import concurrent.futures
+import contextlib
+import glob
+import hashlib
+import inspect
+import os
+import pickle
+
+from data_cache import CACHE_DIR, file_id, source_hash
+
+STAGE_CACHE_DIR = os.path.join(CACHE_DIR, 'stages')
+
+
+#%% Define functions
+# -----------------------------------------------------------------------------
+def local_modules(module):
+    """Function to return module and the modules in the same directory that it imports, directly or indirectly,
+    sorted by name"""
+    root = os.path.dirname(os.path.abspath(module.__file__))
+    found, todo = {}, [module]
+    while todo:
+        current = todo.pop()
+        if current.__name__ in found:
+            continue
+        found[current.__name__] = current
+        for value in vars(current).values():
+            if not (inspect.ismodule(value) or inspect.isfunction(value) or inspect.isclass(value)):
+                continue
+            imported = value if inspect.ismodule(value) else inspect.getmodule(value)
+            path = getattr(imported, '__file__', None)
+            if path is not None and os.path.dirname(os.path.abspath(path)) == root:
+                todo.append(imported)
+    return [found[name] for name in sorted(found)]
+
+
+#%% Stage
+# -----------------------------------------------------------------------------
+class Stage:
+    """Pipeline stage: function, names of input stages, parameters, source files and helper code it depends on"""
+
+    def __init__(self, name, func, inputs, params, files, depends, memoize):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.params = dict(params)
+        self.files = list(files)
+        self.depends = list(depends)
+        self.memoize = memoize
+        # Stage functions with a use_cache argument are passed use_cache of the run, e.g. so loads can bypass a file cache of their own
+        self.takes_use_cache = 'use_cache' in inspect.signature(func).parameters
+
+    # -------------------------------------------------------------------------
+    def code_hash(self):
+        """Function to return hash of stage function source and of helper code it depends on: source of helpers in the
+        stage's own module, whole module (and local modules it imports) of helpers from other modules"""
+        digest = hashlib.sha256(inspect.getsource(self.func).encode())
+        for obj in self.depends:
+            module = obj if inspect.ismodule(obj) else inspect.getmodule(obj)
+            for source in [obj] if module is inspect.getmodule(self.func) else local_modules(module):
+                digest.update(inspect.getsource(source).encode())
+        return digest.hexdigest()
+
+
+#%% Pipeline
+# -----------------------------------------------------------------------------
+class Pipeline:
+    """Directed acyclic graph of stages, memoized to disk by content hash"""
+
+    def __init__(self, cache_dir = STAGE_CACHE_DIR):
+        self.stages = {}
+        self.cache_dir = cache_dir
+
+    # -------------------------------------------------------------------------
+    def stage(self, name = None, inputs = (), params = None, files = (), depends = (), memoize = True):
+        """Decorator to register function as stage. Function is called with outputs of input stages and params as
+        keyword arguments. memoize = False for stages that are cheap or cached elsewhere (e.g. loads through data_cache).
+        A function with a use_cache argument is passed use_cache of the run, which is not part of the stage key"""
+        def register(func):
+            stage_name = name if name is not None else func.__name__
+            if stage_name in self.stages:
+                raise ValueError(f"Stage '{stage_name}' already registered")
+            missing = [input_name for input_name in inputs if input_name not in self.stages]
+            if missing:
+                raise ValueError(f"Stage '{stage_name}' inputs not registered: {missing}. Register inputs first")
+            self.stages[stage_name] = Stage(stage_name, func, inputs, params if params is not None else {}, files, depends, memoize)
+            return func
+        return register
+
+    # -------------------------------------------------------------------------
+    def sinks(self):
+        """Function to return names of stages that are not an input to any other stage"""
+        used = {input_name for stage in self.stages.values() for input_name in stage.inputs}
+        return [stage_name for stage_name in self.stages if stage_name not in used]
+
+    # -------------------------------------------------------------------------
+    def upstream(self, targets):
+        """Function to return names of targets and all stages upstream of them, in dependency order"""
+        order, seen = [], set()
+
+        def visit(stage_name):
+            if stage_name in seen:
+                return
+            seen.add(stage_name)
+            for input_name in self.stages[stage_name].inputs:
+                visit(input_name)
+            order.append(stage_name)
+
+        for target in targets:
+            if target not in self.stages:
+                raise KeyError(f"Unknown stage '{target}'")
+            visit(target)
+        return order
+
+    # -------------------------------------------------------------------------
+    def source_files(self, targets):
+        """Function to return source files read by targets and stages upstream of them"""
+        files = []
+        for stage_name in self.upstream(targets):
+            files += [path for path in self.stages[stage_name].files if path not in files]
+        return files
+
+    # -------------------------------------------------------------------------
+    def keys(self, targets):
+        """Function to return content-hash key of each stage upstream of targets"""
+        # Hash source files concurrently - hashlib releases the GIL on large reads. Hashes are kept by data_cache for the
+        # process by absolute path, modified time and size, so files are not hashed again by later runs or by load_csv,
+        # and a file edited (or a working directory changed) since is rehashed
+        file_ids = {path: file_id(path) for path in self.source_files(targets)}
+        paths = list({source_id: path for path, source_id in file_ids.items()}.values())
+        with concurrent.futures.ThreadPoolExecutor(max_workers = max(len(paths), 1)) as executor:
+            file_hashes = dict(zip([file_ids[path] for path in paths], executor.map(source_hash, paths)))
+
+        keys = {}
+        for stage_name in self.upstream(targets):
+            stage = self.stages[stage_name]
+            digest = hashlib.sha256(stage_name.encode())
+            digest.update(stage.code_hash().encode())
+            digest.update(repr(sorted(stage.params.items())).encode())
+            for path in stage.files:
+                digest.update(file_hashes[file_ids[path]].encode())
+            for input_name in stage.inputs:
+                digest.update(keys[input_name].encode())
+            keys[stage_name] = digest.hexdigest()[:16]
+        return keys
+
+    # -------------------------------------------------------------------------
+    def _cache_path(self, stage_name, key):
+        return os.path.join(self.cache_dir, f'{stage_name}.{key}.pkl')
+
+    # -------------------------------------------------------------------------
+    def _is_cached(self, stage_name, key):
+        return self.stages[stage_name].memoize and os.path.exists(self._cache_path(stage_name, key))
+
+    # -------------------------------------------------------------------------
+    def _load(self, stage_name, key):
+        with open(self._cache_path(stage_name, key), 'rb') as f:
+            return pickle.load(f)
+
+    # -------------------------------------------------------------------------
+    def call(self, stage_name, outputs, use_cache = True):
+        """Function to call stage function with outputs of its input stages (dict of stage name -> output) and params"""
+        stage = self.stages[stage_name]
+        options = {'use_cache': use_cache} if stage.takes_use_cache else {}
+        return stage.func(**{input_name: outputs[input_name] for input_name in stage.inputs}, **stage.params, **options)
+
+    # -------------------------------------------------------------------------
+    def _execute(self, stage_name, key, outputs, use_cache):
+        """Function to run stage with outputs of its inputs, and save output under key, removing outputs of the stage
+        saved under other keys"""
+        stage = self.stages[stage_name]
+        output = self.call(stage_name, outputs, use_cache)
+        if use_cache and stage.memoize:
+            os.makedirs(self.cache_dir, exist_ok = True)
+            path = self._cache_path(stage_name, key)
+            with open(path + '.tmp', 'wb') as f:
+                pickle.dump(output, f, protocol = pickle.HIGHEST_PROTOCOL)
+            os.replace(path + '.tmp', path)
+            for stale_path in glob.glob(os.path.join(glob.escape(self.cache_dir), glob.escape(stage_name) + '.*.pkl')):
+                if stale_path != path:
+                    os.remove(stale_path)
+        return output
+
+    # -------------------------------------------------------------------------
+    def plan(self, targets, use_cache = True):
+        """Function to return, for each stage needed to produce targets, 'cached' (loaded from disk) or 'run'"""
+        keys = self.keys(targets)
+        plan = {}
+        needed = set(targets)
+        for stage_name in reversed(self.upstream(targets)):
+            if stage_name not in needed:
+                continue
+            if use_cache and self._is_cached(stage_name, keys[stage_name]):
+                plan[stage_name] = 'cached'
+            else:
+                plan[stage_name] = 'run'
+                needed.update(self.stages[stage_name].inputs)
+        return {stage_name: plan[stage_name] for stage_name in self.upstream(targets) if stage_name in plan}
+
+    # -------------------------------------------------------------------------
+    def _recorded(self, recorder, stage_name, key, action, outputs, use_cache):
+        """Function to load or run stage under recorder, recording time, memory and row counts"""
+        inputs = {} if action == 'cached' else {input_name: outputs[input_name] for input_name in self.stages[stage_name].inputs}
+        with recorder.stage(stage_name, action, inputs, key) as entry:
+            output = self._load(stage_name, key) if action == 'cached' else self._execute(stage_name, key, outputs, use_cache)
+            recorder.set_output(entry, output)
+        return output
+
+    # -------------------------------------------------------------------------
+    def run(self, targets = None, workers = 4, use_cache = True, recorder = None):
+        """Function to produce outputs of target stages (default all sink stages). Only stages whose key has changed
+        since the last run re-execute. Returns dict of stage name -> output for every stage loaded or run.
+        recorder optionally records each stage (see instrumentation.py). Stages then run one at a time, so time and
+        peak memory are attributable to a single stage"""
+        targets = self.sinks() if targets is None else list(targets)
+        keys = self.keys(targets)
+        plan = self.plan(targets, use_cache)
+        if recorder is not None:
+            workers = 1
+        outputs = {}
+        pending = dict(plan)
+        with contextlib.ExitStack() as context:
+            if recorder is not None:
+                context.enter_context(recorder.recording(targets = targets, plan = plan))
+            executor = context.enter_context(concurrent.futures.ThreadPoolExecutor(max_workers = workers))
+            running = {}
+            while pending or running:
+                # Submit every stage whose inputs are all available
+                for stage_name, action in list(pending.items()):
+                    if action == 'run' and not all(input_name in outputs for input_name in self.stages[stage_name].inputs):
+                        continue
+                    if recorder is not None:
+                        future = executor.submit(self._recorded, recorder, stage_name, keys[stage_name], action, outputs, use_cache)
+                    elif action == 'cached':
+                        future = executor.submit(self._load, stage_name, keys[stage_name])
+                    else:
+                        future = executor.submit(self._execute, stage_name, keys[stage_name], outputs, use_cache)
+                    running[future] = stage_name
+                    del pending[stage_name]
+                if not running:
+                    raise RuntimeError(f'Stages cannot run, inputs unavailable: {list(pending)}')
+                done, _ = concurrent.futures.wait(running, return_when = concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    outputs[running.pop(future)] = future.result()
+        return outputs
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Subnational population projections held as a compact area x age group x year array
+
+The ONS projections table (one row per area and age group, one column per year) is streamed in chunks, so the full
+string-typed table is never held in memory. Each chunk is reduced to integer area and age group ids plus a float block
+of projection years. A code prefix index (E06 unitary authorities, E07 non-metropolitan districts, E08 metropolitan
+districts, E09 London boroughs, E10 counties, E12 regions, E92 England...) gives the rows for any type of area without
+a regex over every row.
+
+Totals for any set of areas, age threshold and all projection years are then a single reduction over the array.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from grouping import group_sums
+
+# Code prefixes of local authority districts
+LAD_PREFIXES = ['E06', 'E07', 'E08', 'E09']
+
+
+#%% Define functions
+# -----------------------------------------------------------------------------
+def age_group_start(age_group):
+    """Function to return start age of projections age group label, e.g. '65-69' -> 65, '90+' -> 90. None for 'All ages'"""
+    match = re.match(r'\s*(\d+)', str(age_group))
+    return int(match.group(1)) if match else None
+
+
+#%% PopulationProjections
+# -----------------------------------------------------------------------------
+class PopulationProjections:
+    """Projected population by area x age group x year"""
+
+    def __init__(self, codes, areas, age_groups, years, values):
+        self.codes = pd.Index(codes, name = 'CODE')
+        self.areas = np.asarray(areas, dtype = object)
+        self.age_groups = list(age_groups)
+        self.age_starts = np.array([age_group_start(age_group) for age_group in self.age_groups])
+        self.years = list(years)
+        self.values = values  # (n_area, n_age, n_year)
+        # Code prefix -> row ids
+        prefix_ids, prefixes = pd.factorize(self.codes.astype(str).str[:3])
+        self.prefix_index = {prefix: np.flatnonzero(prefix_ids == i) for i, prefix in enumerate(prefixes)}
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def from_csv(cls, path, chunksize = 20000, code_col = 'CODE', area_col = 'AREA', age_col = 'AGE GROUP'):
+        """Function to stream projections CSV in chunks into area x age group x year array. 'All ages' rows are
+        dropped, totals are recalculated from age groups when needed. Rows repeating an area and age group are summed"""
+        years = [col for col in pd.read_csv(path, nrows = 0).columns if re.fullmatch(r'\d{4}', col)]
+        codes = pd.Index([], dtype = object)
+        age_ids = {}
+        areas = []
+        blocks = []
+        for chunk in pd.read_csv(path, usecols = [code_col, area_col, age_col] + years, chunksize = chunksize,
+                                 dtype = {code_col: str, area_col: str, age_col: str, **{year: np.float64 for year in years}}):
+            chunk = chunk[chunk[age_col].map(age_group_start).notna()]
+            # Area ids in order of first appearance, across chunks. Codes new in this chunk take the next ids
+            chunk_ids, chunk_codes = pd.factorize(chunk[code_col])
+            positions = codes.get_indexer(chunk_codes)
+            new = positions < 0
+            positions[new] = len(codes) + np.arange(new.sum())
+            codes = codes.append(pd.Index(chunk_codes[new], dtype = object))
+            first = np.unique(chunk_ids, return_index = True)[1]
+            areas.append(chunk[area_col].to_numpy(dtype = object)[first[new]])
+            for age_group in chunk[age_col].unique():
+                age_ids.setdefault(age_group, len(age_ids))
+            blocks.append((positions[chunk_ids], chunk[age_col].map(age_ids).to_numpy(),
+                           chunk[years].to_numpy(dtype = np.float64)))
+
+        # Age groups in age order
+        age_groups = sorted(age_ids, key = age_group_start)
+        age_order = np.empty(len(age_ids), dtype = np.int64)
+        age_order[[age_ids[age_group] for age_group in age_groups]] = np.arange(len(age_groups))
+
+        values = np.zeros((len(codes), len(age_groups), len(years)))
+        for area_block, age_block, year_block in blocks:
+            np.add.at(values, (area_block, age_order[age_block]), year_block)
+        return cls(codes, np.concatenate(areas) if areas else [], age_groups, years, values)
+
+    # -------------------------------------------------------------------------
+    def rows(self, prefixes = None):
+        """Function to return row ids of areas with code prefixes given, or all areas"""
+        if prefixes is None:
+            return np.arange(len(self.codes))
+        return np.sort(np.concatenate([self.prefix_index.get(prefix, np.array([], dtype = np.int64)) for prefix in prefixes]))
+
+    # -------------------------------------------------------------------------
+    def age_mask(self, min_age = 0, max_age = None):
+        """Function to return boolean mask of age groups starting at min_age or over, and under max_age if given"""
+        mask = self.age_starts >= min_age
+        if max_age is not None:
+            mask &= self.age_starts < max_age
+        return mask
+
+    # -------------------------------------------------------------------------
+    def totals(self, prefixes = None, min_age = 0, max_age = None, years = None):
+        """Function to return projected population aged min_age+ (under max_age if given) per area, for all years or
+        the years given. Returns DataFrame indexed by CODE with AREA column and one column per year"""
+        rows = self.rows(prefixes)
+        year_pos = [self.years.index(str(year)) for year in years] if years is not None else slice(None)
+        values = self.values[rows][:, self.age_mask(min_age, max_age)].sum(axis = 1)[:, year_pos]
+        table = pd.DataFrame(values, index = self.codes[rows], columns = np.array(self.years)[year_pos])
+        table.insert(0, 'AREA', self.areas[rows])
+        return table
+
+    # -------------------------------------------------------------------------
+    def by_group(self, groups, prefixes = None, min_age = 0, max_age = None, years = None):
+        """Function to return projected population aged min_age+ summed by group, where groups is pd.Series mapping
+        area CODE to group (e.g. rural-urban classification). Areas with no group are dropped"""
+        table = self.totals(prefixes, min_age, max_age, years).drop(columns = 'AREA')
+        group = groups[~groups.index.duplicated()].reindex(table.index)
+        keep = group.notna().to_numpy()
+        group_ids, group_labels = pd.factorize(group[keep], sort = True)
+        sums = group_sums(group_ids, table.to_numpy()[keep], len(group_labels))
+        return pd.DataFrame(sums, index = pd.Index(np.asarray(group_labels), name = groups.name), columns = table.columns)
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Spatial index and pre-binned map aggregates over LSOA positions (LSOA 2021 population weighted centroids, LAT / LONG)
+
+Positions are held in a KD-tree over 3D unit-sphere coordinates, so straight-line (chord) distances in the tree convert
+exactly to great-circle distances. Queries are vectorized over any number of query points:
+- within(values, radius_km) - sum of values (e.g. Age_65plus) of LSOAs within radius of each point (default each LSOA)
+- nearest(lat, long, k) - distance to and position of k nearest LSOAs. With no query points, k nearest other LSOAs
+- nearest_sum(values, k) - sum of values over k nearest LSOAs. With no query points, each LSOA itself and its k - 1
+  nearest other LSOAs, so like within it counts the LSOA itself
+
+bin_aggregates sums any value columns into square or hexagonal bins at several bin sizes at once, so a map can draw a
+few thousand bins at the zoom level needed rather than every LSOA point. Bins are on a fixed grid (equirectangular
+projection about REFERENCE_LAT, origin at 0, 0), so bin ids are stable between runs. Tables are written as columnar
+files with compact dtypes by write_aggregates.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import spatial
+
+from data_cache import write_table
+from grouping import group_sums
+from lsoa_table import minimal_dtype
+
+EARTH_RADIUS_KM = 6371.0088
+# Latitude about which bins are projected, roughly centre of England and Wales
+REFERENCE_LAT = 52.5
+BIN_SIZES_KM = [2, 5, 10, 20, 50]
+
+
+#%% Define functions
+# -----------------------------------------------------------------------------
+def to_unit_xyz(lat, long):
+    """Function to convert latitude and longitude in degrees to (n, 3) array of 3D unit-sphere coordinates"""
+    lat, long = np.radians(np.asarray(lat, dtype = np.float64)), np.radians(np.asarray(long, dtype = np.float64))
+    return np.column_stack([np.cos(lat) * np.cos(long), np.cos(lat) * np.sin(long), np.sin(lat)])
+
+
+# -----------------------------------------------------------------------------
+def km_to_chord(distance_km):
+    """Function to convert great-circle distance to straight-line distance between points on unit sphere"""
+    return 2 * np.sin(np.asarray(distance_km) / (2 * EARTH_RADIUS_KM))
+
+
+# -----------------------------------------------------------------------------
+def chord_to_km(chord):
+    """Function to convert straight-line distance between points on unit sphere to great-circle distance"""
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1))
+
+
+# -----------------------------------------------------------------------------
+def project(lat, long, reference_lat = REFERENCE_LAT):
+    """Function to project latitude and longitude to x, y in km, equirectangular about reference_lat"""
+    scale = np.radians(1) * EARTH_RADIUS_KM
+    return (np.asarray(long, dtype = np.float64) * scale * np.cos(np.radians(reference_lat)),
+            np.asarray(lat, dtype = np.float64) * scale)
+
+
+# -----------------------------------------------------------------------------
+def unproject(x, y, reference_lat = REFERENCE_LAT):
+    """Function to return latitude and longitude of projected x, y in km"""
+    scale = np.radians(1) * EARTH_RADIUS_KM
+    return np.asarray(y) / scale, np.asarray(x) / (scale * np.cos(np.radians(reference_lat)))
+
+
+# -----------------------------------------------------------------------------
+def bin_points(x, y, size, shape = 'square'):
+    """Function to assign projected points to bins of width size (km). Returns (n, 2) integer bin ids and (n, 2)
+    bin centres. shape = 'square', or 'hex' - pointy-top hexagons with centres size apart, as two offset rectangular
+    grids where each point takes the nearer centre"""
+    x, y = np.asarray(x, dtype = np.float64), np.asarray(y, dtype = np.float64)
+    if shape == 'square':
+        ids = np.column_stack([np.floor(x / size), np.floor(y / size)]).astype(np.int64)
+        return ids, (ids + 0.5) * size
+    if shape == 'hex':
+        height = size * np.sqrt(3)
+        # Grid a: centres at (i, j) * (size, height). Grid b: offset by half a cell in both directions
+        ia, ja = np.round(x / size), np.round(y / height)
+        ib, jb = np.floor(x / size), np.floor(y / height)
+        dist_a = (x - ia * size) ** 2 + (y - ja * height) ** 2
+        dist_b = (x - (ib + 0.5) * size) ** 2 + (y - (jb + 0.5) * height) ** 2
+        use_a = dist_a <= dist_b
+        # Bin id (column, row) on doubled grid, so both grids share one id space: grid a even, grid b odd
+        ids = np.column_stack([np.where(use_a, 2 * ia, 2 * ib + 1), np.where(use_a, 2 * ja, 2 * jb + 1)]).astype(np.int64)
+        return ids, ids * np.array([size, height]) / 2
+    raise ValueError(f"shape must be 'square' or 'hex', not '{shape}'")
+
+
+#%% SpatialIndex
+# -----------------------------------------------------------------------------
+class SpatialIndex:
+    """KD-tree over LSOA positions, with vectorized radius and nearest neighbour aggregate queries"""
+
+    def __init__(self, codes, lat, long):
+        self.codes = pd.Index(np.asarray(codes, dtype = object))
+        self.lat = np.asarray(lat, dtype = np.float64)
+        self.long = np.asarray(long, dtype = np.float64)
+        self.tree = spatial.cKDTree(to_unit_xyz(self.lat, self.long))
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def from_frame(cls, data, code = 'lsoa21cd', lat = 'LAT', long = 'LONG'):
+        """Function to build index from table with one row per area. Rows with no position are dropped"""
+        data = data[data[lat].notna() & data[long].notna()]
+        return cls(data[code], data[lat], data[long])
+
+    # -------------------------------------------------------------------------
+    def align(self, data, col, code = 'lsoa21cd'):
+        """Function to return column of data, keyed on area code column, aligned to index order. Missing as 0"""
+        values = pd.Series(data[col].to_numpy(dtype = np.float64), index = np.asarray(data[code], dtype = object))
+        return values[~values.index.duplicated()].reindex(self.codes).fillna(0).to_numpy()
+
+    # -------------------------------------------------------------------------
+    def _points(self, lat, long):
+        """Function to return query points as unit-sphere coordinates, default every indexed area"""
+        if lat is None:
+            return self.tree.data
+        return to_unit_xyz(np.atleast_1d(lat), np.atleast_1d(long))
+
+    # -------------------------------------------------------------------------
+    def within(self, values, radius_km, lat = None, long = None):
+        """Function to return, for each query point (default each indexed area), sum of values of areas within
+        radius_km (including the area itself) and count of areas. values aligned to index order"""
+        points = self._points(lat, long)
+        query_tree = self.tree if lat is None else spatial.cKDTree(points)
+        pairs = query_tree.sparse_distance_matrix(self.tree, km_to_chord(radius_km), output_type = 'ndarray')
+        values = np.asarray(values, dtype = np.float64)
+        sums = np.bincount(pairs['i'], weights = values[pairs['j']], minlength = len(points))
+        counts = np.bincount(pairs['i'], minlength = len(points))
+        return sums, counts
+
+    # -------------------------------------------------------------------------
+    def nearest(self, lat = None, long = None, k = 1):
+        """Function to return great-circle distance (km) to and index position of k nearest areas to each query point,
+        as (n, k) arrays. With no query points, nearest other areas to each indexed area"""
+        exclude_self = lat is None
+        distance, position = self.tree.query(self._points(lat, long), k = k + exclude_self)
+        distance, position = distance.reshape(len(distance), -1), position.reshape(len(position), -1)
+        if exclude_self:
+            # Drop each area itself by position rather than the first column, which for coincident areas can be the
+            # other area. Where the area is not among the k + 1 returned, drop the furthest
+            is_self = position == np.arange(len(position))[:, None]
+            is_self[~is_self.any(axis = 1), -1] = True
+            distance, position = distance[~is_self].reshape(len(distance), k), position[~is_self].reshape(len(position), k)
+        return chord_to_km(distance), position
+
+    # -------------------------------------------------------------------------
+    def nearest_sum(self, values, k, lat = None, long = None):
+        """Function to return sum of values over k nearest areas to each query point, and distance (km) to the
+        furthest of them. With no query points, the k areas are each indexed area itself and its k - 1 nearest other
+        areas (as given by nearest), so the area's own value is always included"""
+        values = np.asarray(values, dtype = np.float64)
+        if lat is None:
+            if k == 1:
+                return values.copy(), np.zeros(len(values))
+            distance, position = self.nearest(k = k - 1)
+            return values + values[position].sum(axis = 1), distance[:, -1]
+        distance, position = self.nearest(lat, long, k = k)
+        return values[position].sum(axis = 1), distance[:, -1]
+
+    # -------------------------------------------------------------------------
+    def bin_aggregates(self, values, sizes_km = BIN_SIZES_KM, shape = 'hex'):
+        """Function to sum value columns into bins, at each bin size. values is dict of column name -> values aligned
+        to index order. Returns long table, one row per non-empty bin per size: size_km, bin_x, bin_y (bin id),
+        LAT and LONG of bin centre, n_areas, then one column per value"""
+        x, y = project(self.lat, self.long)
+        columns = list(values)
+        matrix = np.column_stack([np.asarray(values[col], dtype = np.float64) for col in columns]) if columns else np.empty((len(x), 0))
+        tables = []
+        for size in sizes_km:
+            ids, centres = bin_points(x, y, size, shape)
+            bins, first, bin_ids = np.unique(ids, axis = 0, return_index = True, return_inverse = True)
+            bin_ids = bin_ids.ravel()
+            n_bins = len(bins)
+            sums = group_sums(bin_ids, matrix, n_bins)
+            lat, long = unproject(centres[first, 0], centres[first, 1])
+            table = pd.DataFrame({'size_km': size,
+                                  'bin_x': bins[:, 0],
+                                  'bin_y': bins[:, 1],
+                                  'LAT': lat,
+                                  'LONG': long,
+                                  'n_areas': np.bincount(bin_ids, minlength = n_bins),
+                                  })
+            for i, col in enumerate(columns):
+                table[col] = sums[:, i]
+            tables.append(table)
+        return pd.concat(tables, ignore_index = True)
+
+
+# -----------------------------------------------------------------------------
+def write_aggregates(data, path):
+    """Function to write table to columnar file with compact dtypes: whole number columns downcast to smallest integer
+    type, positions as float32 (~1 m precision). Returns path written"""
+    data = data.copy()
+    for col in data.columns:
+        if col in ['LAT', 'LONG']:
+            data[col] = data[col].astype(np.float32)
+        elif pd.api.types.is_float_dtype(data[col]) and np.array_equal(data[col], np.round(data[col])):
+            data[col] = minimal_dtype(data[col].astype(np.int64))
+        else:
+            data[col] = minimal_dtype(data[col])
+    return write_table(data, path)
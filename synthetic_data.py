@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic versions of every input file read by CMOresponse_GitHub.py
+
+Files have the same names and columns as the ONS / gov.uk sources, with cardinalities matching the real data at
+scale = 1: ~189k output areas, ~35.7k 2021 LSOAs, ~34.7k 2011 LSOAs (unchanged, split, merged and redrawn in roughly
+the real proportions), ~7.3k MSOAs and 331 local authorities. Values are random, so outputs are only useful for timing
+and regression testing the pipeline, not for analysis.
+
+Usage: python synthetic_data.py --output-dir synthetic --scale 1 --seed 0
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_cache import CENSUS_AGEBAND_COLUMNS
+# Output file names, as read by the analysis script
+from config import FILES
+
+# -----------------------------------------------------------------------------
+# Real cardinalities at scale = 1
+N_LAD_ENGLAND = 309
+N_LAD_WALES = 22
+N_LSOA11_ENGLAND = 32844
+N_LSOA11_WALES = 1909
+OA_PER_LSOA = 5.3
+LSOA_PER_MSOA = 4.9
+LAD_PER_LOC = 2.9
+LOC_PER_ICB = 2.5
+
+# Share of 2011 LSOAs by change indicator: U unchanged, S split, M merged, X redrawn
+CHANGE_SHARES = {'U': 0.943, 'S': 0.033, 'M': 0.022, 'X': 0.002}
+# Share of merged 2021 LSOAs by number of 2011 parents. Redrawn LSOAs have 2 parents
+MERGE_PARENT_SHARES = {2: 0.6, 3: 0.3, 4: 0.1}
+
+REGIONS = [('E12000001', 'North East'), ('E12000002', 'North West'), ('E12000003', 'Yorkshire and The Humber'),
+           ('E12000004', 'East Midlands'), ('E12000005', 'West Midlands'), ('E12000006', 'East of England'),
+           ('E12000007', 'London'), ('E12000008', 'South East'), ('E12000009', 'South West')]
+WALES = ('W92000004', 'Wales')
+
+RUC_LSOA = [('A1', 'Urban major conurbation', 'Urban'),
+            ('B1', 'Urban minor conurbation', 'Urban'),
+            ('C1', 'Urban city and town', 'Urban'),
+            ('C2', 'Urban city and town in a sparse setting', 'Urban'),
+            ('D1', 'Rural town and fringe', 'Rural'),
+            ('D2', 'Rural town and fringe in a sparse setting', 'Rural'),
+            ('E1', 'Rural village', 'Rural'),
+            ('E2', 'Rural village in a sparse setting', 'Rural'),
+            ('F1', 'Rural hamlet and isolated dwellings', 'Rural'),
+            ('F2', 'Rural hamlet and isolated dwellings in a sparse setting', 'Rural')]
+RUC_LSOA_SHARES = [0.35, 0.04, 0.42, 0.01, 0.09, 0.01, 0.05, 0.01, 0.02, 0.00]
+
+RUC_LAD = [('Urban with Major Conurbation', 'Predominantly Urban'),
+           ('Urban with Minor Conurbation', 'Predominantly Urban'),
+           ('Urban with City and Town', 'Predominantly Urban'),
+           ('Urban with Significant Rural', 'Urban with Significant Rural'),
+           ('Largely Rural', 'Predominantly Rural'),
+           ('Mainly Rural', 'Predominantly Rural')]
+
+HEALTH_STATUS = ['Very good', 'Good', 'Fair', 'Bad', 'Very bad']
+HEALTH_AGES = ['0 to 4', '5 to 9', '10 to 14', '15 to 19', '20 to 24', '25 to 29', '30 to 34', '35 to 39', '40 to 44',
+               '45 to 49', '50 to 54', '55 to 59', '60 to 64', '65 to 69', '70 to 74', '75 to 79', '80 to 84',
+               '85 to 89', '90+']
+PROJECTION_YEARS = [str(year) for year in range(2018, 2044)]
+PROJECTION_AGES = ['0-4', '5-9', '10-14', '15-19', '20-24', '25-29', '30-34', '35-39', '40-44', '45-49', '50-54',
+                   '55-59', '60-64', '65-69', '70-74', '75-79', '80-84', '85-89', '90+']
+
+#%% Define functions
+# -----------------------------------------------------------------------------
+def make_codes(prefix, n, start = 1):
+    """Function to return n ONS style 9 character codes with given 3 character prefix"""
+    return np.array([f'{prefix}{i:06d}' for i in range(start, start + n)], dtype = object)
+
+
+# -----------------------------------------------------------------------------
+def split_sizes(rng, total, n_groups):
+    """Function to split total into n_groups positive integer sizes, roughly equal"""
+    cuts = np.sort(rng.choice(np.arange(1, total), size = n_groups - 1, replace = False))
+    return np.diff(np.concatenate([[0], cuts, [total]]))
+
+
+# -----------------------------------------------------------------------------
+def make_lads(rng, scale):
+    """Function to return LAD table: code, name, region code and name, nation, RUC 6 and 3 fold"""
+    n_england = max(int(round(N_LAD_ENGLAND * scale)), 9)
+    n_wales = max(int(round(N_LAD_WALES * scale)), 1)
+    # English LAD types: unitary (E06), non-metropolitan district (E07), metropolitan district (E08), London borough (E09)
+    prefixes = rng.choice(['E06', 'E07', 'E08', 'E09'], size = n_england, p = [0.2, 0.55, 0.12, 0.13])
+    counters = {prefix: 0 for prefix in ['E06', 'E07', 'E08', 'E09']}
+    codes = []
+    for prefix in prefixes:
+        counters[prefix] += 1
+        codes.append(f'{prefix}{counters[prefix]:06d}')
+    region_ids = np.sort(rng.integers(0, len(REGIONS), size = n_england))
+    region_ids[:len(REGIONS)] = np.arange(len(REGIONS))  # every region has at least one LAD
+    england = pd.DataFrame({'lad22cd': codes,
+                            'rgn22cd': [REGIONS[i][0] for i in region_ids],
+                            'rgn22nm': [REGIONS[i][1] for i in region_ids],
+                            'nation': 'E'})
+    wales = pd.DataFrame({'lad22cd': make_codes('W06', n_wales),
+                          'rgn22cd': WALES[0],
+                          'rgn22nm': WALES[1],
+                          'nation': 'W'})
+    lads = pd.concat([england, wales], ignore_index = True)
+    lads['lad22nm'] = 'Local Authority ' + lads['lad22cd']
+    lads['lad22nmw'] = np.where(lads['nation'] == 'W', 'Awdurdod Lleol ' + lads['lad22cd'], None)
+    lads['rgn22nmw'] = np.where(lads['nation'] == 'W', 'Cymru', None)
+    ruc = rng.integers(0, len(RUC_LAD), size = len(lads))
+    lads['ruc6'] = [RUC_LAD[i][0] for i in ruc]
+    lads['ruc3'] = [RUC_LAD[i][1] for i in ruc]
+    # Aggregated areas used in the general health table
+    lads.loc[lads.index[0], 'lad22nm'] = 'Cornwall and Isles of Scilly'
+    lads.loc[lads.index[1], 'lad22nm'] = 'City of London and Westminster'
+    return lads
+
+
+# -----------------------------------------------------------------------------
+def make_lsoas(rng, lads, scale):
+    """Function to return LSOA 2011 -> 2021 pairs with change indicator and LAD. Merged LSOAs combine 2 to 4 and
+    redrawn LSOAs 2 consecutive 2011 LSOAs in the same LAD"""
+    pairs = []
+    counters = {'E': [1, 0], 'W': [1, 0]}  # next 2011 LSOA number, next new 2021 LSOA number, by nation
+    for nation, n_lsoa11 in [('E', N_LSOA11_ENGLAND), ('W', N_LSOA11_WALES)]:
+        nation_lads = lads.loc[lads['nation'] == nation, 'lad22cd'].to_numpy()
+        n_lsoa11 = max(int(round(n_lsoa11 * scale)), 10 * len(nation_lads))
+        lad_of_lsoa = np.repeat(nation_lads, split_sizes(rng, n_lsoa11, len(nation_lads)))
+        change = rng.choice(list(CHANGE_SHARES), size = n_lsoa11, p = list(CHANGE_SHARES.values()))
+        prefix11, prefix21 = ('E01', 'E01') if nation == 'E' else ('W01', 'W01')
+        i = 0
+        while i < n_lsoa11:
+            lad = lad_of_lsoa[i]
+            # Merges and redraws take the next 2011 LSOAs in the same LAD
+            available = 1
+            while available < max(MERGE_PARENT_SHARES) and i + available < n_lsoa11 and lad_of_lsoa[i + available] == lad:
+                available += 1
+            kind = change[i] if (change[i] in ['U', 'S'] or available > 1) else 'U'
+            if kind == 'U':
+                parents, n_children = [counters[nation][0]], 1
+            elif kind == 'S':
+                parents, n_children = [counters[nation][0]], int(rng.integers(2, 4))
+            elif kind == 'M':
+                n_parents = min(int(rng.choice(list(MERGE_PARENT_SHARES), p = list(MERGE_PARENT_SHARES.values()))), available)
+                parents, n_children = list(range(counters[nation][0], counters[nation][0] + n_parents)), 1
+            else:
+                parents, n_children = [counters[nation][0], counters[nation][0] + 1], 2
+            # Unchanged LSOAs keep their 2011 code, new 2021 LSOAs are numbered from 100000
+            if kind == 'U':
+                children = [f'{prefix21}{parents[0]:06d}']
+            else:
+                children = [f'{prefix21}{counters[nation][1] + k + 100000:06d}' for k in range(n_children)]
+                counters[nation][1] += n_children
+            for parent in parents:
+                for child in children:
+                    pairs.append((f'{prefix11}{parent:06d}', child, kind, lad))
+            counters[nation][0] += len(parents)
+            i += len(parents)
+    lookup = pd.DataFrame(pairs, columns = ['LSOA11CD', 'LSOA21CD', 'CHGIND', 'LAD22CD'])
+    return lookup
+
+
+# -----------------------------------------------------------------------------
+def make_geography(rng, lads, lookup):
+    """Function to return OA level lookup (OA, LSOA, MSOA, LAD, Region) and LSOA 2021 table"""
+    lsoa21 = lookup.drop_duplicates(subset = 'LSOA21CD')[['LSOA21CD', 'LAD22CD']].reset_index(drop = True)
+    lsoa21 = pd.merge(lsoa21, lads, how = 'left', left_on = 'LAD22CD', right_on = 'lad22cd')
+    lsoa21['lsoa21nm'] = lsoa21['lad22nm'] + ' ' + (lsoa21.groupby('lad22cd').cumcount() + 1).astype(str).str.zfill(3)
+
+    # MSOAs: runs of ~5 consecutive LSOAs within LAD
+    msoa_in_lad = lsoa21.groupby('lad22cd').cumcount() // int(round(LSOA_PER_MSOA))
+    msoa_key = lsoa21['lad22cd'] + '_' + msoa_in_lad.astype(str)
+    msoa_ids = pd.factorize(msoa_key)[0]
+    lsoa21['msoa21cd'] = np.where(lsoa21['nation'] == 'E', 'E02', 'W02') + pd.Series(msoa_ids + 1).astype(str).str.zfill(6)
+    lsoa21['msoa21nm'] = lsoa21['lad22nm'] + ' MSOA ' + (msoa_in_lad + 1).astype(str)
+
+    # OAs: 4 to 7 per LSOA, mean ~5.3
+    n_oa = rng.choice([4, 5, 6, 7], size = len(lsoa21), p = [0.2, 0.4, 0.3, 0.1])
+    oa = lsoa21.loc[lsoa21.index.repeat(n_oa)].reset_index(drop = True)
+    oa['oa21cd'] = np.where(oa['nation'] == 'E', 'E00', 'W00') + pd.Series(np.arange(1, len(oa) + 1)).astype(str).str.zfill(6)
+    oa = oa.rename(columns = {'LSOA21CD': 'lsoa21cd'})
+    return oa, lsoa21
+
+
+# -----------------------------------------------------------------------------
+def make_census_ageband(rng, lsoa21):
+    """Function to return Census 2021 TS007A LSOA population by 5-year age band"""
+    n = len(lsoa21)
+    # Older age profile in some areas, so 65+ varies by area
+    age_weights = np.linspace(1.0, 0.3, len(CENSUS_AGEBAND_COLUMNS) - 1)
+    older = rng.uniform(0.5, 2.0, size = (n, 1))
+    weights = age_weights * np.where(np.arange(len(age_weights)) >= 13, older, 1.0)
+    weights = weights / weights.sum(axis = 1, keepdims = True)
+    totals = rng.integers(1000, 3000, size = n)
+    bands = np.stack([rng.multinomial(total, p) for total, p in zip(totals, weights)])
+    data = pd.DataFrame(bands, columns = CENSUS_AGEBAND_COLUMNS[1:])
+    data.insert(0, 'Age: Total', bands.sum(axis = 1))
+    data.insert(0, 'geography code', lsoa21['LSOA21CD'].to_numpy())
+    data.insert(0, 'geography', lsoa21['lsoa21nm'].to_numpy())
+    data.insert(0, 'date', 2021)
+    return data
+
+
+# -----------------------------------------------------------------------------
+def make_imd(rng, lsoa11):
+    """Function to return England IoD2019 domains file and Wales WIMD 2019 file"""
+    england = lsoa11[lsoa11['LSOA11CD'].str.startswith('E')].reset_index(drop = True)
+    rank = rng.permutation(len(england)) + 1
+    decile = np.ceil(rank / len(england) * 10).astype(int)
+    imd_england = pd.DataFrame({'LSOA code (2011)': england['LSOA11CD'],
+                                'LSOA name (2011)': 'LSOA ' + england['LSOA11CD'],
+                                'Local Authority District code (2019)': england['LAD22CD'],
+                                'Index of Multiple Deprivation (IMD) Rank (where 1 is most deprived)': [f'{r:,}' for r in rank],
+                                'Index of Multiple Deprivation (IMD) Decile (where 1 is most deprived 10% of LSOAs)': decile,
+                                'Income Decile (where 1 is most deprived 10% of LSOAs)': np.clip(decile + rng.integers(-1, 2, len(england)), 1, 10),
+                                'Health Deprivation and Disability Decile (where 1 is most deprived 10% of LSOAs)': np.clip(decile + rng.integers(-1, 2, len(england)), 1, 10),
+                                })
+    wales = lsoa11[lsoa11['LSOA11CD'].str.startswith('W')].reset_index(drop = True)
+    rank = rng.permutation(len(wales)) + 1
+    imd_wales = pd.DataFrame({'LSOA Code': wales['LSOA11CD'],
+                              'LSOA Name (Eng)': 'LSOA ' + wales['LSOA11CD'],
+                              'WIMD 2019 Overall Rank ': rank,
+                              'WIMD 2019 Overall Decile': np.ceil(rank / len(wales) * 10).astype(int),
+                              })
+    return imd_england, imd_wales
+
+
+# -----------------------------------------------------------------------------
+def make_ruc_lsoa(rng, lsoa11):
+    """Function to return 2011 LSOA rural-urban classification lookup"""
+    ruc = rng.choice(len(RUC_LSOA), size = len(lsoa11), p = np.array(RUC_LSOA_SHARES) / sum(RUC_LSOA_SHARES))
+    return pd.DataFrame({'Lower Super Output Area 2011 Code': lsoa11['LSOA11CD'],
+                         'Lower Super Output Area 2011 Name': 'LSOA ' + lsoa11['LSOA11CD'],
+                         'Rural Urban Classification 2011 code': [RUC_LSOA[i][0] for i in ruc],
+                         'Rural Urban Classification 2011 (10 fold)': [RUC_LSOA[i][1] for i in ruc],
+                         'Rural Urban Classification 2011 (2 fold)': [RUC_LSOA[i][2] for i in ruc],
+                         })
+
+
+# -----------------------------------------------------------------------------
+def make_ruc_lad(lads, year):
+    """Function to return local authority rural-urban classification, England only, for LAD 2019 or 2021 codes"""
+    england = lads[lads['nation'] == 'E']
+    return pd.DataFrame({f'Local Authority District Area {year} Code': england['lad22cd'].to_numpy(),
+                         f'Local Authority District Area {year} Name': england['lad22nm'].to_numpy(),
+                         'Rural Urban Classification 2011 (6 fold)': england['ruc6'].to_numpy(),
+                         'Rural Urban Classification 2011 (3 fold)': england['ruc3'].to_numpy(),
+                         })
+
+
+# -----------------------------------------------------------------------------
+def make_projections(rng, lads):
+    """Function to return 2018-based subnational population projections, LADs, counties, regions and England by age group"""
+    england = lads[lads['nation'] == 'E']
+    areas = [(code, name) for code, name in zip(england['lad22cd'], england['lad22nm'])]
+    areas += [(f'E10{i:06d}', f'County {i}') for i in range(1, 27)]
+    areas += REGIONS + [('E92000001', 'England')]
+    n_area, n_age, n_year = len(areas), len(PROJECTION_AGES), len(PROJECTION_YEARS)
+    base = rng.uniform(2000, 12000, size = (n_area, n_age, 1)) * np.linspace(1.0, 0.2, n_age)[None, :, None]
+    # Older age groups grow faster over projection period
+    growth = 1 + np.linspace(-0.05, 0.6, n_age)[None, :, None] * np.linspace(0, 1, n_year)[None, None, :]
+    values = np.round(base * growth, 3)
+    rows = pd.DataFrame({'CODE': np.repeat([a[0] for a in areas], n_age),
+                         'AREA': np.repeat([a[1] for a in areas], n_age),
+                         'AGE GROUP': np.tile(PROJECTION_AGES, n_area)})
+    rows = pd.concat([rows, pd.DataFrame(values.reshape(n_area * n_age, n_year), columns = PROJECTION_YEARS)], axis = 1)
+    # All ages total per area
+    totals = rows.groupby(['CODE', 'AREA'], sort = False)[PROJECTION_YEARS].sum().reset_index()
+    totals['AGE GROUP'] = 'All ages'
+    return pd.concat([rows, totals[rows.columns]], ignore_index = True).sort_values(['CODE'], kind = 'stable')
+
+
+# -----------------------------------------------------------------------------
+def make_healthbyage(rng, lads):
+    """Function to return general health by age and sex, local authority table, 2011 and 2021"""
+    areas = lads[['lad22cd', 'lad22nm']].to_numpy()
+    years, sexes = [2011, 2021], ['Persons', 'Female', 'Male']
+    grid = pd.MultiIndex.from_product([range(len(areas)), years, sexes, HEALTH_AGES],
+                                      names = ['area', 'Year', 'Sex', 'Age']).to_frame(index = False)
+    population = rng.integers(500, 6000, size = len(grid)).astype(float)
+    # Bad health more common at older ages
+    age_pos = grid['Age'].map({age: i for i, age in enumerate(HEALTH_AGES)}).to_numpy() / (len(HEALTH_AGES) - 1)
+    bad_share = 0.01 + 0.2 * age_pos * rng.uniform(0.6, 1.4, size = len(grid))
+    shares = np.stack([0.5 - 0.35 * age_pos, 0.3 * np.ones(len(grid)), 0.2 + 0.05 * age_pos, bad_share * 0.7, bad_share * 0.3], axis = 1)
+    shares = shares / shares.sum(axis = 1, keepdims = True)
+    counts = np.stack([rng.multinomial(int(n), p) for n, p in zip(population, shares)])
+    data = grid.loc[grid.index.repeat(len(HEALTH_STATUS))].reset_index(drop = True)
+    data['Health Status'] = np.tile(HEALTH_STATUS, len(grid))
+    data['Count'] = counts.ravel()
+    data['Population'] = np.repeat(population, len(HEALTH_STATUS))
+    data.insert(0, 'Local Authority', areas[data['area'].to_numpy(), 1])
+    data.insert(0, 'Area Code', areas[data['area'].to_numpy(), 0])
+    data['Percentage'] = np.round(data['Count'] / data['Population'] * 100, 1)
+    return data.drop(columns = 'area')[['Year', 'Area Code', 'Local Authority', 'Sex', 'Age', 'Health Status', 'Count', 'Population', 'Percentage']]
+
+
+# -----------------------------------------------------------------------------
+def make_positions(rng, lsoa21, lads):
+    """Function to return LSOA 2021 centroid positions, LSOAs clustered around a centre per LAD"""
+    lad_centre = pd.DataFrame({'lad22cd': lads['lad22cd'],
+                               'lat0': rng.uniform(50.2, 55.6, size = len(lads)),
+                               'long0': rng.uniform(-5.2, 1.6, size = len(lads))})
+    data = pd.merge(lsoa21[['LSOA21CD', 'lsoa21nm', 'lad22cd']], lad_centre, how = 'left', on = 'lad22cd')
+    lat = data['lat0'].to_numpy() + rng.normal(0, 0.08, size = len(data))
+    long = data['long0'].to_numpy() + rng.normal(0, 0.12, size = len(data))
+    return pd.DataFrame({'FID': np.arange(1, len(data) + 1),
+                         'LSOA21CD': data['LSOA21CD'],
+                         'LSOA21NM': data['lsoa21nm'],
+                         'BNG_E': np.round((long + 2) * 70000 + 400000).astype(int),
+                         'BNG_N': np.round((lat - 49) * 111000 - 100000).astype(int),
+                         'LONG': np.round(long, 6),
+                         'LAT': np.round(lat, 6),
+                         'Shape__Area': rng.uniform(1e5, 5e7, size = len(data)),
+                         'Shape__Length': rng.uniform(1e3, 5e4, size = len(data)),
+                         'GlobalID': [f'{{{i:08X}-0000-0000-0000-000000000000}}' for i in range(len(data))],
+                         })
+
+
+# -----------------------------------------------------------------------------
+def make_nhs_lookup(lads, lookup):
+    """Function to return LSOA 2011 to sub-ICB location and ICB lookup, England only"""
+    england = lads[lads['nation'] == 'E'].reset_index(drop = True)
+    loc_ids = (np.arange(len(england)) / LAD_PER_LOC).astype(int)
+    icb_ids = (loc_ids / LOC_PER_ICB).astype(int)
+    lad_nhs = pd.DataFrame({'LAD22CD': england['lad22cd'],
+                            'LAD22NM': england['lad22nm'],
+                            'LOC22CD': make_codes('E38', loc_ids.max() + 1)[loc_ids],
+                            'LOC22CDH': [f'{i:02d}A' for i in loc_ids],
+                            'LOC22NM': [f'NHS Sub-ICB Location {i}' for i in loc_ids],
+                            'ICB22CD': make_codes('E54', icb_ids.max() + 1)[icb_ids],
+                            'ICB22CDH': [f'Q{i:02d}' for i in icb_ids],
+                            'ICB22NM': [f'NHS Integrated Care Board {i}' for i in icb_ids]})
+    lsoa11 = lookup.drop_duplicates(subset = 'LSOA11CD')[['LSOA11CD', 'LAD22CD']]
+    data = pd.merge(lsoa11, lad_nhs, how = 'inner', on = 'LAD22CD')
+    data.insert(1, 'LSOA11NM', 'LSOA ' + data['LSOA11CD'])
+    data['ObjectId'] = np.arange(1, len(data) + 1)
+    return data[['LSOA11CD', 'LSOA11NM', 'LOC22CD', 'LOC22CDH', 'LOC22NM', 'ICB22CD', 'ICB22CDH', 'ICB22NM', 'LAD22CD', 'LAD22NM', 'ObjectId']]
+
+
+# -----------------------------------------------------------------------------
+def generate(output_dir, scale = 1.0, seed = 0):
+    """Function to write synthetic versions of all input files to output_dir. Returns dict of file paths"""
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok = True)
+
+    lads = make_lads(rng, scale)
+    lookup = make_lsoas(rng, lads, scale)
+    oa, lsoa21 = make_geography(rng, lads, lookup)
+    lsoa11 = lookup.drop_duplicates(subset = 'LSOA11CD')[['LSOA11CD', 'LAD22CD']]
+    imd_england, imd_wales = make_imd(rng, lsoa11)
+
+    lad_names = lads.set_index('lad22cd')['lad22nm']
+    lsoa_lookup = lookup.assign(LSOA11NM = 'LSOA ' + lookup['LSOA11CD'],
+                                LSOA21NM = 'LSOA ' + lookup['LSOA21CD'],
+                                LAD22NM = lookup['LAD22CD'].map(lad_names),
+                                LAD22NMW = '',
+                                ObjectId = np.arange(1, len(lookup) + 1))
+
+    tables = {'census_ageband': make_census_ageband(rng, lsoa21),
+              'healthbyage': make_healthbyage(rng, lads),
+              'projections': make_projections(rng, lads),
+              'imd_england': imd_england,
+              'imd_wales': imd_wales,
+              'ruc_lsoa': make_ruc_lsoa(rng, lsoa11),
+              'ruc_lad21': make_ruc_lad(lads, 2021),
+              'ruc_lad19': make_ruc_lad(lads, 2019),
+              'oa_lookup': oa[['oa21cd', 'lsoa21cd', 'lsoa21nm', 'msoa21cd', 'msoa21nm', 'lad22cd', 'lad22nm', 'lad22nmw']].assign(ObjectId = np.arange(1, len(oa) + 1)),
+              'oa_region': oa[['oa21cd', 'rgn22cd', 'rgn22nm', 'rgn22nmw']].assign(ObjectId = np.arange(1, len(oa) + 1)),
+              'lsoa_lookup': lsoa_lookup[['LSOA11CD', 'LSOA11NM', 'LSOA21CD', 'LSOA21NM', 'CHGIND', 'LAD22CD', 'LAD22NM', 'LAD22NMW', 'ObjectId']],
+              'positions': make_positions(rng, lsoa21, lads),
+              'nhs_lookup': make_nhs_lookup(lads, lookup),
+              }
+    paths = {}
+    for name, data in tables.items():
+        paths[name] = os.path.join(output_dir, FILES[name])
+        data.to_csv(paths[name], index = False)
+    return paths
+
+
+#%% Command line
+# -----------------------------------------------------------------------------
+def main(argv = None):
+    """Function to write synthetic input files from command line arguments"""
+    parser = argparse.ArgumentParser(description = 'Write synthetic versions of the CMO response input files')
+    parser.add_argument('--output-dir', default = 'synthetic', help = 'Directory to write files to')
+    parser.add_argument('--scale', type = float, default = 1.0, help = 'Scale factor on number of areas (1 = real ONS scale)')
+    parser.add_argument('--seed', type = int, default = 0, help = 'Random seed')
+    args = parser.parse_args(argv)
+    paths = generate(args.output_dir, scale = args.scale, seed = args.seed)
+    for path in paths.values():
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""
+Shared test setup: analysis modules are flat top-level modules in the repository root
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Scale of synthetic input files used by tests that run pipeline stages (~1.8k 2021 LSOAs)
+SYNTHETIC_SCALE = 0.05
+
+
+# -----------------------------------------------------------------------------
+@pytest.fixture(scope = 'session')
+def synthetic_dir(tmp_path_factory):
+    """Directory of synthetic input files, generated once per test session"""
+    import synthetic_data
+    data_dir = tmp_path_factory.mktemp('synthetic')
+    synthetic_data.generate(str(data_dir), scale = SYNTHETIC_SCALE, seed = 0)
+    return data_dir
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for AggregateCube: tables match groupby over LSOA rows, age ranges must be on band boundaries
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregate_cube import AggregateCube
+
+BANDS = ['Age_Under5', 'Age_5to64', 'Age_65to84', 'Age_85plus']
+
+
+# -----------------------------------------------------------------------------
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    n = 200
+    table = pd.DataFrame({'rgn22cd': rng.choice(['E12000001', 'E12000002', 'W92000004'], n),
+                          'RUC2011_cat2': rng.choice(['Urban', 'Rural', None], n)})
+    for band in BANDS:
+        table[band] = rng.integers(0, 100, n)
+    table['rgn22nm'] = table['rgn22cd'].map({'E12000001': 'North East', 'E12000002': 'North West', 'W92000004': 'Wales'})
+    return table
+
+
+# -----------------------------------------------------------------------------
+def test_table_matches_groupby(data):
+    cube = AggregateCube.from_frame(data, dims = ['rgn22cd', 'RUC2011_cat2'], bands = BANDS, attrs = {'rgn22cd': ['rgn22nm']})
+    data['Age_65plus'] = data['Age_65to84'] + data['Age_85plus']
+    expected = data.groupby(['rgn22cd', 'RUC2011_cat2']).agg({'rgn22nm': 'first', 'Age_65plus': 'sum'}).reset_index()
+    pd.testing.assert_frame_equal(cube.table(['rgn22cd', 'RUC2011_cat2'], min_age = 65), expected, check_dtype = False)
+
+
+# -----------------------------------------------------------------------------
+def test_age_range(data):
+    cube = AggregateCube.from_frame(data, dims = ['rgn22cd'], bands = BANDS)
+    assert cube.population(5, 65).sum() == data['Age_5to64'].sum()
+    assert cube.population(0, 85).sum() == data[BANDS[:3]].to_numpy().sum()
+
+
+# -----------------------------------------------------------------------------
+def test_ages_off_band_boundaries_raise(data):
+    cube = AggregateCube.from_frame(data, dims = ['rgn22cd'], bands = BANDS)
+    with pytest.raises(ValueError, match = 'not the start of an age band'):
+        cube.population(60)
+    with pytest.raises(ValueError, match = 'not the start of an age band'):
+        cube.population(0, 70)
+    with pytest.raises(ValueError, match = 'open-ended'):
+        cube.population(65, 90)
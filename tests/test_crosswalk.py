@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for LSOACrosswalk: majority labels and tie-breaks, weighted transfers in both directions
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from crosswalk import LSOACrosswalk
+
+
+# -----------------------------------------------------------------------------
+@pytest.fixture
+def crosswalk():
+    """2021 LSOA E01100001 unchanged, E01100002 merged from two 2011 LSOAs (higher code listed first), E01100003
+    merged from three, E01100004 and E01100005 split from one 2011 LSOA"""
+    lookup = pd.DataFrame({'LSOA11CD': ['E01000001', 'E01000009', 'E01000002', 'E01000003', 'E01000004', 'E01000005', 'E01000006', 'E01000006'],
+                           'LSOA21CD': ['E01100001', 'E01100002', 'E01100002', 'E01100003', 'E01100003', 'E01100003', 'E01100004', 'E01100005']})
+    return LSOACrosswalk.from_lookup(lookup)
+
+
+# -----------------------------------------------------------------------------
+def labels_2011(crosswalk, labels):
+    """Function to align dict of 2011 code -> label to crosswalk 2011 codes"""
+    return pd.Series(labels, dtype = object).reindex(crosswalk.codes11).to_numpy()
+
+
+# -----------------------------------------------------------------------------
+def test_majority_tie_goes_to_first_listed_parent(crosswalk):
+    labels = labels_2011(crosswalk, {'E01000001': 'Urban', 'E01000009': 'Urban', 'E01000002': 'Rural',
+                                     'E01000003': 'Rural', 'E01000004': 'Urban', 'E01000005': 'Urban', 'E01000006': 'Rural'})
+    result = pd.Series(crosswalk.majority_2021(labels), index = crosswalk.codes21)
+    # Equal shares of Urban and Rural: first-listed parent E01000009 wins, although its label and code sort later
+    assert result['E01100002'] == 'Urban'
+    # Two of three parents Urban beats the first-listed parent's Rural
+    assert result['E01100003'] == 'Urban'
+    assert result['E01100001'] == 'Urban'
+    assert result['E01100004'] == 'Rural'
+    assert result['E01100005'] == 'Rural'
+
+
+# -----------------------------------------------------------------------------
+def test_majority_tie_with_first_parent_missing_goes_to_lowest_label(crosswalk):
+    labels = labels_2011(crosswalk, {'E01000003': None, 'E01000004': 'Urban', 'E01000005': 'Rural'})
+    result = pd.Series(crosswalk.majority_2021(labels), index = crosswalk.codes21)
+    assert result['E01100003'] == 'Rural'
+    # No parent with a label
+    assert pd.isna(result['E01100001'])
+
+
+# -----------------------------------------------------------------------------
+def test_majority_follows_weights():
+    lookup = pd.DataFrame({'LSOA11CD': ['E01000001', 'E01000002'], 'LSOA21CD': ['E01100001', 'E01100001'], 'weight': [1.0, 3.0]})
+    crosswalk = LSOACrosswalk.from_lookup(lookup, weights = 'weight')
+    assert crosswalk.majority_2021(np.array(['Urban', 'Rural'], dtype = object)).tolist() == ['Rural']
+
+
+# -----------------------------------------------------------------------------
+def test_transfers(crosswalk):
+    values = pd.Series({'E01000001': 1.0, 'E01000009': 2.0, 'E01000002': 4.0, 'E01000003': 3.0,
+                        'E01000004': np.nan, 'E01000005': 5.0, 'E01000006': 10.0}).reindex(crosswalk.codes11).to_numpy()
+    mean = pd.Series(crosswalk.to_2021(values, how = 'mean'), index = crosswalk.codes21)
+    assert mean.tolist() == [1.0, 3.0, 4.0, 10.0, 10.0]
+    total = pd.Series(crosswalk.to_2021(values, how = 'sum'), index = crosswalk.codes21)
+    # Counts of split 2011 LSOA shared equally, missing counted as 0
+    assert total.tolist() == [1.0, 6.0, 8.0, 5.0, 5.0]
+    assert crosswalk.to_2011(total.to_numpy(), how = 'sum').sum() == pytest.approx(total.sum())
+
+
+# -----------------------------------------------------------------------------
+def test_frame_2021_restores_numeric_labels(crosswalk):
+    data = pd.DataFrame({'LSOA11CD': ['E01000001', 'E01000009', 'E01000002', 'E01000006'], 'IMD_Decile_2019': [1, 7, 3, 10]})
+    result = crosswalk.frame_2021(data, key = 'LSOA11CD', columns = ['IMD_Decile_2019'])
+    assert result['LSOA21CD'].tolist() == crosswalk.codes21.tolist()
+    assert pd.api.types.is_numeric_dtype(result['IMD_Decile_2019'])
+    assert result['IMD_Decile_2019'].tolist()[:2] == [1, 7]
+    assert np.isnan(result['IMD_Decile_2019'].iloc[2])
+
+
+# -----------------------------------------------------------------------------
+def test_frame_2021_by_takes_all_columns_from_one_parent(crosswalk):
+    # E01100003 merged from three 2011 LSOAs: two with decile 1, first-listed E01000003 with decile 2
+    data = pd.DataFrame({'LSOA11CD': ['E01000003', 'E01000004', 'E01000005'],
+                         'IMD_Percentile_2019': [15, 5, 8],
+                         'IMD_Decile_2019': [2, 1, 1]})
+    result = crosswalk.frame_2021(data, key = 'LSOA11CD', columns = ['IMD_Percentile_2019', 'IMD_Decile_2019'], by = 'IMD_Decile_2019')
+    row = result.set_index('LSOA21CD').loc['E01100003']
+    # Majority decile 1, and percentile of the same parent (equal shares, so lowest code E01000004)
+    assert row['IMD_Decile_2019'] == 1
+    assert row['IMD_Percentile_2019'] == 5
+    # Voting on each column separately mixes parents
+    separate = crosswalk.frame_2021(data, key = 'LSOA11CD', columns = ['IMD_Percentile_2019', 'IMD_Decile_2019']).set_index('LSOA21CD')
+    assert separate.loc['E01100003', 'IMD_Percentile_2019'] == 15
+
+
+# -----------------------------------------------------------------------------
+def test_majority_parent_prefers_first_listed_parent_within_majority(crosswalk):
+    labels = labels_2011(crosswalk, {'E01000003': 'Urban', 'E01000004': 'Urban', 'E01000005': 'Rural'})
+    parent = pd.Series(crosswalk.majority_parent_2021(labels), index = crosswalk.codes21)
+    assert crosswalk.codes11[parent['E01100003']] == 'E01000003'
+    assert parent['E01100001'] == -1
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for crosswalk_sensitivity: parents are drawn within each 2021 LSOA in proportion to crosswalk share, draws do not
+depend on the number of workers, and only 2021 LSOAs with several 2011 parents vary between draws
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from crosswalk import LSOACrosswalk
+from crosswalk_sensitivity import crosswalk_sensitivity, draw_parents
+
+
+# -----------------------------------------------------------------------------
+@pytest.fixture
+def crosswalk():
+    """2021 LSOA E01100001 unchanged, E01100002 merged from two 2011 LSOAs with shares 1:3, E01100003 and E01100004
+    split from one 2011 LSOA"""
+    lookup = pd.DataFrame({'LSOA11CD': ['E01000001', 'E01000002', 'E01000003', 'E01000004', 'E01000004'],
+                           'LSOA21CD': ['E01100001', 'E01100002', 'E01100002', 'E01100003', 'E01100004'],
+                           'weight': [1.0, 1.0, 3.0, 1.0, 1.0]})
+    return LSOACrosswalk.from_lookup(lookup, weights = 'weight')
+
+
+# -----------------------------------------------------------------------------
+@pytest.fixture
+def inputs(crosswalk):
+    """Keyword arguments of crosswalk_sensitivity: parents of E01100002 differ in RUC and IMD, and the figure tables
+    take its majority parent E01000003"""
+    return {'crosswalk': crosswalk,
+            'population': pd.Series({'E01100001': 10.0, 'E01100002': 5.0, 'E01100003': 2.0, 'E01100004': 3.0}),
+            'ruc11': pd.Series({'E01000001': 'Urban', 'E01000002': 'Urban', 'E01000003': 'Rural', 'E01000004': 'Rural'}),
+            'decile11': pd.Series({'E01000001': 1, 'E01000002': 2, 'E01000003': 9, 'E01000004': 10}),
+            'ruc21': pd.Series({'E01100001': 'Urban', 'E01100002': 'Rural', 'E01100003': 'Rural', 'E01100004': 'Rural'}),
+            'quintile21': pd.Series({'E01100001': 1, 'E01100002': 5, 'E01100003': 5, 'E01100004': 5}),
+            }
+
+
+# -----------------------------------------------------------------------------
+def test_draw_parents_within_row_by_share():
+    lookup = pd.DataFrame({'LSOA11CD': ['E01000001', 'E01000002', 'E01000003', 'E01000004', 'E01000005', 'E01000006'],
+                           'LSOA21CD': ['E01100001', 'E01100001', 'E01100002', 'E01100002', 'E01100002', 'E01100003'],
+                           'weight': [1.0, 3.0, 1.0, 1.0, 2.0, 1.0]})
+    shares = LSOACrosswalk.from_lookup(lookup, weights = 'weight').shares_2021
+    rows = np.arange(3)
+    parents = draw_parents(shares.indptr, shares.indices, np.cumsum(shares.data), rows, np.random.default_rng(0).random((20000, 3)))
+    for row in rows:
+        own = shares.indices[shares.indptr[row]:shares.indptr[row + 1]]
+        assert np.isin(parents[:, row], own).all()
+        frequency = np.bincount(parents[:, row], minlength = shares.shape[1])[own] / len(parents)
+        np.testing.assert_allclose(frequency, shares.data[shares.indptr[row]:shares.indptr[row + 1]], atol = 0.015)
+    # u at the ends of [0, 1) picks the first and last parent of the row
+    edges = draw_parents(shares.indptr, shares.indices, np.cumsum(shares.data), np.array([1, 1]), np.array([[0.0, 1 - 1e-12]]))
+    assert edges.tolist() == [[shares.indices[2], shares.indices[4]]]
+
+
+# -----------------------------------------------------------------------------
+def test_draws_same_for_any_number_of_workers(inputs):
+    one = crosswalk_sensitivity(**inputs, n_draws = 50, seed = 1, chunk_size = 20, workers = 1)
+    two = crosswalk_sensitivity(**inputs, n_draws = 50, seed = 1, chunk_size = 20, workers = 2)
+    np.testing.assert_array_equal(one['draws']['figure1a'], two['draws']['figure1a'])
+    np.testing.assert_array_equal(one['draws']['figure3'], two['draws']['figure3'])
+
+
+# -----------------------------------------------------------------------------
+def test_only_ambiguous_lsoas_vary(inputs):
+    result = crosswalk_sensitivity(**inputs, n_draws = 400, seed = 0)
+    figure1a = pd.DataFrame(result['draws']['figure1a'], columns = result['figure1a']['RUC2011_cat2'])
+    # Unchanged and split 2021 LSOAs are counted in every draw, the merged LSOA's 5 moves between categories
+    assert set(figure1a['Urban']) == {10.0, 15.0}
+    assert set(figure1a['Rural']) == {5.0, 10.0}
+    assert (figure1a.sum(axis = 1) == 20.0).all()
+    assert (figure1a['Rural'] == 10.0).mean() == pytest.approx(0.75, abs = 0.06)
+
+
+# -----------------------------------------------------------------------------
+def test_baseline_matches_figure_tables(inputs):
+    result = crosswalk_sensitivity(**inputs, n_draws = 10)
+    assert result['figure1a'].set_index('RUC2011_cat2')['Age_65plus_figure'].to_dict() == {'Rural': 10.0, 'Urban': 10.0}
+    figure3 = result['figure3'].set_index(['RUC2011_cat2', 'IMD_Quintile_2019'])['Age_65plus_figure']
+    assert figure3[figure3 > 0].to_dict() == {('Rural', 5.0): 10.0, ('Urban', 1.0): 10.0}
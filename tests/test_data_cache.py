@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for data_cache: cached copy matches the typed CSV read, is keyed on file contents, schema and engine, and source files are
+hashed once per process
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+import data_cache
+from pipeline import Pipeline
+
+FILE_NAME = 'RUC11_LAD19CD_level.csv'
+
+
+# -----------------------------------------------------------------------------
+def write_csv(path, n = 3):
+    pd.DataFrame({'Local Authority District Area 2019 Code': [f'E0600000{i}' for i in range(n)],
+                  'Rural Urban Classification 2011 (3 fold)': ['Predominantly Urban'] * n}).to_csv(path, index = False)
+
+
+# -----------------------------------------------------------------------------
+def test_cached_copy_matches_csv(tmp_path):
+    path = str(tmp_path / FILE_NAME)
+    write_csv(path)
+    cache_dir = str(tmp_path / 'cache')
+    first = data_cache.load_csv(path, cache_dir = cache_dir)
+    assert isinstance(first['Local Authority District Area 2019 Code'].dtype, pd.CategoricalDtype)
+    assert len(os.listdir(cache_dir)) == 1
+    pd.testing.assert_frame_equal(data_cache.load_csv(path, cache_dir = cache_dir), first)
+
+
+# -----------------------------------------------------------------------------
+def test_changed_file_replaces_cached_copy(tmp_path):
+    path = str(tmp_path / FILE_NAME)
+    cache_dir = str(tmp_path / 'cache')
+    write_csv(path)
+    data_cache.load_csv(path, cache_dir = cache_dir)
+    write_csv(path, n = 5)
+    assert len(data_cache.load_csv(path, cache_dir = cache_dir)) == 5
+    assert len(os.listdir(cache_dir)) == 1
+
+
+# -----------------------------------------------------------------------------
+def test_failed_write_keeps_cached_copy(tmp_path, monkeypatch):
+    path = str(tmp_path / FILE_NAME)
+    cache_dir = str(tmp_path / 'cache')
+    write_csv(path)
+    data_cache.load_csv(path, cache_dir = cache_dir)
+    cached = os.listdir(cache_dir)
+    write_csv(path, n = 5)
+
+    def fail(data, path):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(data_cache, 'write_table', fail)
+    with pytest.raises(OSError):
+        data_cache.load_csv(path, cache_dir = cache_dir)
+    # Copy of the previous file contents is only removed once the new copy is written
+    assert os.listdir(cache_dir) == cached
+
+
+# -----------------------------------------------------------------------------
+def test_write_table_leaves_no_temporary_file(tmp_path):
+    path = data_cache.write_table(pd.DataFrame({'a': [1, 2]}), str(tmp_path / 'table.parquet'))
+    assert os.listdir(tmp_path) == [os.path.basename(path)]
+    assert data_cache.read_table(path)['a'].tolist() == [1, 2]
+
+
+# -----------------------------------------------------------------------------
+def test_key_includes_engine(tmp_path):
+    path = str(tmp_path / FILE_NAME)
+    write_csv(path)
+    schema = data_cache.SCHEMAS[FILE_NAME]
+    assert data_cache.cache_key(path, schema, 'c') != data_cache.cache_key(path, schema, 'python')
+
+
+# -----------------------------------------------------------------------------
+def test_source_hashed_once_for_stage_keys_and_cache(tmp_path, monkeypatch):
+    path = str(tmp_path / FILE_NAME)
+    write_csv(path)
+    hashed = []
+    file_hash = data_cache.file_hash
+    monkeypatch.setattr(data_cache, 'file_hash', lambda path: hashed.append(path) or file_hash(path))
+    pipeline = Pipeline(cache_dir = str(tmp_path / 'stages'))
+
+    @pipeline.stage(params = {'path': path}, files = [path], memoize = False)
+    def load(path, use_cache = True):
+        return data_cache.load_csv(path, cache_dir = str(tmp_path / 'cache'), use_cache = use_cache)
+
+    pipeline.run()
+    pipeline.run()
+    assert hashed == [path]
+    # Edited file is hashed again
+    write_csv(path, n = 5)
+    assert len(pipeline.run()['load']) == 5
+    assert hashed == [path, path]
+
+
+# -----------------------------------------------------------------------------
+def test_no_cache_writes_nothing(tmp_path):
+    path = str(tmp_path / FILE_NAME)
+    write_csv(path)
+    cache_dir = str(tmp_path / 'cache')
+    assert len(data_cache.load_csv(path, cache_dir = cache_dir, use_cache = False)) == 3
+    assert not os.path.exists(cache_dir)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Tests that figure tables from the pipeline match the original analysis cells, re-implemented here with plain pandas
+merges and groupbys, on synthetic input files. groupby().nth(0) is taken as the first row per group, as it was before
+pandas 2. 2011 LSOA data (IMD, RUC) is mapped to 2021 LSOAs as the crosswalk does, written here with groupby: each
+2021 LSOA takes the 2011 parent holding the most common label, rather than the first-listed parent. The synthetic
+lookup has 3 and 4 parent merges, where the two differ
+"""
+
+import pandas as pd
+import pytest
+
+from config import FILES
+
+CENSUS_65PLUS = ['Age: Aged 65 to 69 years', 'Age: Aged 70 to 74 years', 'Age: Aged 75 to 79 years', 'Age: Aged 80 to 84 years',
+                 'Age: Aged 85 years and over']
+AGE_GROUPS_65PLUS = ['65-69', '70-74', '75-79', '80-84', '85-89', '90+']
+
+
+# -----------------------------------------------------------------------------
+def first_rows(data, key):
+    """Function to return first row for each value of key"""
+    return data.drop_duplicates(subset = key).reset_index(drop = True)
+
+
+# -----------------------------------------------------------------------------
+def majority_parents(lookup, data, label):
+    """Function to return one 2011 parent (LSOA11CD) per 2021 LSOA (LSOA21CD), of those whose label in data is most
+    common among the 2021 LSOA's parents. Ties between labels go to the first-listed parent's label, then the lowest
+    label. Of parents with the winning label, the first-listed is taken, then the lowest code"""
+    pairs = lookup[['LSOA21CD', 'LSOA11CD']].copy()
+    pairs['first'] = ~pairs['LSOA21CD'].duplicated()
+    pairs = pd.merge(pairs, data[['LSOA11CD', label]], how = 'inner', on = 'LSOA11CD')
+    pairs = pairs[pairs[label].notna()]
+    votes = pairs.groupby(['LSOA21CD', label]).agg(n = ('LSOA11CD', 'size'), first = ('first', 'any')).reset_index()
+    votes = votes.sort_values(['LSOA21CD', 'n', 'first', label], ascending = [True, False, False, True])
+    pairs = pd.merge(pairs, first_rows(votes, 'LSOA21CD')[['LSOA21CD', label]], how = 'inner', on = ['LSOA21CD', label])
+    pairs = pairs.sort_values(['LSOA21CD', 'first', 'LSOA11CD'], ascending = [True, False, True])
+    return first_rows(pairs, 'LSOA21CD')[['LSOA21CD', 'LSOA11CD']]
+
+
+# -----------------------------------------------------------------------------
+def reference_lsoa(data_dir):
+    """Function to return LSOA level table as built by the original cells"""
+    read = lambda key: pd.read_csv(data_dir / FILES[key])
+    census = read('census_ageband').rename(columns = {'geography code': 'lsoa21cd'})
+    census['Age_65plus'] = census[CENSUS_65PLUS].sum(axis = 1)
+
+    geocode = pd.merge(read('oa_lookup'), read('oa_region'), how = 'left', on = 'oa21cd')
+    geocode_LSOA = first_rows(geocode, 'lsoa21cd')
+    lookup = read('lsoa_lookup')
+
+    england = read('imd_england').rename(columns = {'LSOA code (2011)': 'LSOA11CD',
+                                                    'Index of Multiple Deprivation (IMD) Decile (where 1 is most deprived 10% of LSOAs)': 'IMD_Decile_2019'})
+    wales = read('imd_wales').rename(columns = {'LSOA Code': 'LSOA11CD', 'WIMD 2019 Overall Decile': 'IMD_Decile_2019'})
+    imd11 = pd.concat([england[['LSOA11CD', 'IMD_Decile_2019']], wales[['LSOA11CD', 'IMD_Decile_2019']]], ignore_index = True)
+    imd = pd.merge(majority_parents(lookup, imd11, 'IMD_Decile_2019'), imd11, how = 'left', on = 'LSOA11CD')
+    imd['IMD_Quintile_2019'] = (imd['IMD_Decile_2019'] + 1) // 2
+
+    ruc11 = read('ruc_lsoa').rename(columns = {'Lower Super Output Area 2011 Code': 'LSOA11CD',
+                                               'Rural Urban Classification 2011 code': 'RUC2011_code',
+                                               'Rural Urban Classification 2011 (2 fold)': 'RUC2011_cat2'})
+    ruc = pd.merge(majority_parents(lookup, ruc11, 'RUC2011_code'), ruc11[['LSOA11CD', 'RUC2011_cat2']], how = 'left', on = 'LSOA11CD')
+
+    data = pd.merge(census, imd, how = 'left', left_on = 'lsoa21cd', right_on = 'LSOA21CD')
+    data = pd.merge(data, geocode_LSOA[['lsoa21cd', 'rgn22cd', 'rgn22nm']], how = 'left', on = 'lsoa21cd')
+    return pd.merge(data, ruc[['LSOA21CD', 'RUC2011_cat2']], how = 'left', left_on = 'lsoa21cd', right_on = 'LSOA21CD')
+
+
+# -----------------------------------------------------------------------------
+def reference_figure2(data_dir):
+    """Function to return Figure 2 table as built by the original cells"""
+    projections = pd.read_csv(data_dir / FILES['projections'])
+    projections = projections[projections['CODE'].str.contains('E06|E07|E08|E09') & projections['AGE GROUP'].isin(AGE_GROUPS_65PLUS)]
+    grouped = projections.groupby('CODE').agg({'AREA': 'first', '2018': 'sum', '2043': 'sum'}).reset_index()
+    merged = pd.merge(grouped, pd.read_csv(data_dir / FILES['ruc_lad19']), how = 'left', left_on = 'CODE', right_on = 'Local Authority District Area 2019 Code')
+    return merged.groupby('Rural Urban Classification 2011 (3 fold)').agg({'2018': 'sum', '2043': 'sum'})
+
+
+# -----------------------------------------------------------------------------
+def reference_figure4(data_dir):
+    """Function to return Figure 4 table (before LAD geocodes are joined) as built by the original cells"""
+    health = pd.read_csv(data_dir / FILES['healthbyage'])
+    health = health[(health['Sex'] == 'Persons') & (health['Year'] == 2021)
+                    & health['Age'].isin(['65 to 69', '70 to 74', '75 to 79', '80 to 84', '85 to 89', '90+'])]
+    grouped = health.groupby(['Area Code', 'Health Status']).agg({'Local Authority': 'first', 'Count': 'sum', 'Population': 'sum'}).reset_index()
+    grouped.loc[grouped['Local Authority'] == 'Cornwall and Isles of Scilly', 'Area Code'] = 'E06000052'
+    grouped.loc[grouped['Local Authority'] == 'City of London and Westminster', 'Area Code'] = 'E09000033'
+    bad = grouped[grouped['Health Status'].isin(['Very bad', 'Bad'])].groupby('Area Code').agg({'Count': 'sum', 'Population': 'first'})
+    bad['proportion'] = bad['Count'] / bad['Population']
+    bad['proportion_bin'] = pd.cut(bad['proportion'], [-float('inf'), 0.09, 0.11, 0.13, 0.15, 0.17, float('inf')], right = False,
+                                   labels = ['1: 7 to 9 %', '2: 9 to 11 %', '3: 11 to 13 %', '4: 13 to 15 %', '5: 15 to 17 %', '6: 17 to 24 %']).astype(object)
+    return bad.reset_index()
+
+
+# -----------------------------------------------------------------------------
+@pytest.fixture(scope = 'module')
+def outputs(synthetic_dir):
+    """Figure tables from the pipeline, run without the stage cache"""
+    import CMOresponse_GitHub as script
+    cwd = pytest.MonkeyPatch()
+    cwd.chdir(synthetic_dir)
+    try:
+        yield script.main(['--figures', '1a,1b,2,3,4', '--no-cache', '--workers', '1'])
+    finally:
+        cwd.undo()
+
+
+# -----------------------------------------------------------------------------
+def test_figure1(outputs, synthetic_dir):
+    data = reference_lsoa(synthetic_dir)
+    figure1a = data.groupby('RUC2011_cat2').agg({'Age_65plus': 'sum'}).reset_index()
+    figure1b = data.groupby(['rgn22cd', 'RUC2011_cat2']).agg({'rgn22nm': 'first', 'Age_65plus': 'sum'}).reset_index()
+    pd.testing.assert_frame_equal(outputs['figure1a_65plus_byRUC_Overall'], figure1a, check_dtype = False)
+    pd.testing.assert_frame_equal(outputs['figure1b_65plus_byRUCandRegion'], figure1b, check_dtype = False)
+
+
+# -----------------------------------------------------------------------------
+def test_figure2(outputs, synthetic_dir):
+    pd.testing.assert_frame_equal(outputs['figure2_populationprojections_byRUC'], reference_figure2(synthetic_dir), check_dtype = False)
+
+
+# -----------------------------------------------------------------------------
+def test_figure3(outputs, synthetic_dir):
+    figure3 = reference_lsoa(synthetic_dir).groupby(['RUC2011_cat2', 'IMD_Quintile_2019']).agg({'Age_65plus': 'sum'}).reset_index()
+    pd.testing.assert_frame_equal(outputs['figure3_65plus_byRUCandIMD'], figure3, check_dtype = False)
+
+
+# -----------------------------------------------------------------------------
+def test_figure4(outputs, synthetic_dir):
+    figure4 = reference_figure4(synthetic_dir)
+    pd.testing.assert_frame_equal(outputs['figure4_badhealth_bylocalauthority'][figure4.columns], figure4, check_dtype = False)
+
+
+# -----------------------------------------------------------------------------
+def test_unknown_figure_is_usage_error(capsys):
+    import CMOresponse_GitHub as script
+    with pytest.raises(SystemExit) as exit_info:
+        script.main(['--figures', '9'])
+    assert exit_info.value.code == 2
+    assert "Unknown figure '9'" in capsys.readouterr().err
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for GeneralHealth: proportions and bad health for every year, sex and age threshold match filtering and grouping
+the table once per slice, including a combined area whose code is remapped
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from general_health import AREA_CODE_REMAP, HEALTH_STATUS_RENAME, GeneralHealth, age_band_start, bin_proportion
+
+AGES = ['60 to 64', '65 to 69', '70 to 74', '75 to 79', '80 to 84', '85 to 89', '90+']
+SLICES = [(2021, 'Persons', 65), (2021, 'Female', 75), (2011, 'Male', 85), (2011, 'Persons', 60)]
+
+
+# -----------------------------------------------------------------------------
+@pytest.fixture(scope = 'module')
+def data():
+    """General health table for three areas, in shuffled row order. 'Cornwall and Isles of Scilly' has a code that
+    sorts last, and is remapped to E06000052, which sorts first"""
+    rng = np.random.default_rng(0)
+    areas = pd.DataFrame({'Area Code': ['E06000060', 'E06000999', 'E08000001'],
+                          'Local Authority': ['Buckinghamshire', 'Cornwall and Isles of Scilly', 'Bolton']})
+    grid = pd.MultiIndex.from_product([range(len(areas)), [2011, 2021], ['Persons', 'Female', 'Male'], AGES, list(HEALTH_STATUS_RENAME)],
+                                      names = ['area', 'Year', 'Sex', 'Age', 'Health Status']).to_frame(index = False)
+    grid['Count'] = rng.integers(0, 400, size = len(grid)).astype(float)
+    # Population of age band repeated on each health status row
+    grid['Population'] = grid.groupby(['area', 'Year', 'Sex', 'Age'])['Count'].transform('sum')
+    grid = pd.concat([areas.iloc[grid['area']].reset_index(drop = True), grid.drop(columns = 'area')], axis = 1)
+    return grid.sample(frac = 1, random_state = 1).reset_index(drop = True)
+
+
+# -----------------------------------------------------------------------------
+def reference(data, year, sex, min_age):
+    """Function to return count and population by area code and health status for one slice, with filter and groupby"""
+    rows = data[(data['Year'] == year) & (data['Sex'] == sex) & (data['Age'].map(age_band_start) >= min_age)].copy()
+    rows['Area Code'] = rows['Local Authority'].map(AREA_CODE_REMAP).fillna(rows['Area Code'])
+    counts = rows.groupby(['Area Code', 'Health Status'])['Count'].sum().reset_index()
+    population = rows.drop_duplicates(subset = ['Area Code', 'Age']).groupby('Area Code')['Population'].sum()
+    counts['Population'] = counts['Area Code'].map(population)
+    return counts
+
+
+# -----------------------------------------------------------------------------
+def select(table, year, sex, min_age):
+    """Function to return rows of table for one slice"""
+    return table[(table['Year'] == year) & (table['Sex'] == sex) & (table['Min age'] == min_age)].reset_index(drop = True)
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize('year, sex, min_age', SLICES)
+def test_proportions_match_groupby(data, year, sex, min_age):
+    result = select(GeneralHealth.from_frame(data).proportions(min_ages = [60, 65, 75, 85]), year, sex, min_age)
+    expected = reference(data, year, sex, min_age)
+    expected['Health Status'] = expected['Health Status'].map(HEALTH_STATUS_RENAME)
+    expected['proportion'] = expected['Count'] / expected['Population']
+    # Areas in order of remapped code
+    assert result['Area Code'].unique().tolist() == ['E06000052', 'E06000060', 'E08000001']
+    assert result.loc[result['Area Code'] == 'E06000052', 'Local Authority'].unique().tolist() == ['Cornwall and Isles of Scilly']
+    columns = ['Area Code', 'Health Status', 'Count', 'Population', 'proportion']
+    pd.testing.assert_frame_equal(result[columns].sort_values(columns[:2]).reset_index(drop = True),
+                                  expected[columns].sort_values(columns[:2]).reset_index(drop = True))
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize('year, sex, min_age', SLICES)
+def test_bad_health_matches_groupby(data, year, sex, min_age):
+    result = select(GeneralHealth.from_frame(data).bad_health(min_ages = [60, 65, 75, 85]), year, sex, min_age)
+    expected = reference(data, year, sex, min_age)
+    expected = expected[expected['Health Status'].isin(['Bad', 'Very bad'])].groupby('Area Code').agg({'Count': 'sum', 'Population': 'first'}).reset_index()
+    expected['proportion'] = expected['Count'] / expected['Population']
+    expected['proportion_bin'] = bin_proportion(expected['proportion'].to_numpy())
+    pd.testing.assert_frame_equal(result[expected.columns], expected)
+
+
+# -----------------------------------------------------------------------------
+def test_min_age_not_band_start_raises(data):
+    with pytest.raises(ValueError, match = 'not the start of an age band'):
+        GeneralHealth.from_frame(data).proportions(min_ages = [67])
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for GeographyIndex: 1d and 2d rollups match summing by parent code, areas with unknown parents are dropped, and
+lookups of codes not in the index return None
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from crosswalk import LSOACrosswalk
+from geography_index import GeographyIndex
+
+
+# -----------------------------------------------------------------------------
+@pytest.fixture
+def index():
+    """Three English LSOAs in two MSOAs, and a Welsh LSOA with no region and no NHS sub-ICB location"""
+    oa_lookup = pd.DataFrame({'oa21cd': ['E00000001', 'E00000002', 'E00000003', 'E00000004', 'W00000001', 'W00000002'],
+                              'lsoa21cd': ['E01000001', 'E01000001', 'E01000002', 'E01000003', 'W01000001', 'W01000001'],
+                              'lsoa21nm': ['LSOA 1', 'LSOA 1', 'LSOA 2', 'LSOA 3', 'LSOA W', 'LSOA W'],
+                              'msoa21cd': ['E02000001', 'E02000001', 'E02000001', 'E02000002', 'W02000001', 'W02000001'],
+                              'lad22cd': ['E06000001', 'E06000001', 'E06000001', 'E06000002', 'W06000001', 'W06000001']})
+    oa_region = pd.DataFrame({'oa21cd': ['E00000001', 'E00000002', 'E00000003', 'E00000004'],
+                              'rgn22cd': ['E12000001'] * 4, 'rgn22nm': ['North East'] * 4})
+    nhs_lookup = pd.DataFrame({'LSOA11CD': ['E01000001', 'E01000002', 'E01000003'],
+                               'LOC22CD': ['E38000001', 'E38000002', 'E38000002'],
+                               'ICB22CD': ['E54000001', 'E54000001', 'E54000001']})
+    crosswalk = LSOACrosswalk.from_lookup(pd.DataFrame({'LSOA11CD': ['E01000001', 'E01000002', 'E01000003', 'W01000001'],
+                                                        'LSOA21CD': ['E01000001', 'E01000002', 'E01000003', 'W01000001']}))
+    return GeographyIndex.from_lookups(oa_lookup, oa_region, nhs_lookup = nhs_lookup, crosswalk = crosswalk)
+
+
+# -----------------------------------------------------------------------------
+def test_rollup_1d(index):
+    values = np.array([1.0, 2.0, 4.0, 8.0])
+    assert index.codes['lsoa'].tolist() == ['E01000001', 'E01000002', 'E01000003', 'W01000001']
+    np.testing.assert_array_equal(index.rollup(values, 'lsoa', 'msoa'), [3.0, 4.0, 8.0])
+    np.testing.assert_array_equal(index.rollup(values, 'lsoa', 'lad'), [3.0, 4.0, 8.0])
+    # Welsh LSOA has no region and no sub-ICB location, so is dropped
+    np.testing.assert_array_equal(index.rollup(values, 'lsoa', 'rgn'), [7.0])
+    np.testing.assert_array_equal(index.rollup(values, 'lsoa', 'loc'), [1.0, 6.0])
+    np.testing.assert_array_equal(index.rollup(values, 'lsoa', 'icb'), [7.0])
+
+
+# -----------------------------------------------------------------------------
+def test_unknown_parents(index):
+    assert index.parent('lad', 'rgn').tolist() == [0, 0, -1]
+    assert index.parent('lsoa', 'rgn').tolist() == [0, 0, 0, -1]
+    assert index.parent('lsoa', 'icb').tolist() == [0, 0, 0, -1]
+    with pytest.raises(KeyError):
+        index.parent('msoa', 'icb')
+
+
+# -----------------------------------------------------------------------------
+def test_rollup_2d_matches_each_column(index):
+    values = np.random.default_rng(0).random((4, 3))
+    for ancestor in ['msoa', 'rgn', 'loc']:
+        expected = np.column_stack([index.rollup(values[:, col], 'lsoa', ancestor) for col in range(3)])
+        np.testing.assert_allclose(index.rollup(values, 'lsoa', ancestor), expected)
+    assert index.rollup(values, 'lsoa', 'rgn').shape == (1, 3)
+
+
+# -----------------------------------------------------------------------------
+def test_rollup_series(index):
+    # Codes in any order, repeated codes added, codes not in index dropped
+    series = pd.Series([8.0, 1.0, 2.0, 4.0, 16.0, 0.5], name = 'Age_65plus',
+                       index = ['W01000001', 'E01000001', 'E01000002', 'E01000003', 'E01999999', 'E01000001'])
+    result = index.rollup_series(series, 'lsoa', 'msoa')
+    assert result.name == 'Age_65plus'
+    assert result.to_dict() == {'E02000001': 3.5, 'E02000002': 4.0, 'W02000001': 8.0}
+
+
+# -----------------------------------------------------------------------------
+def test_lookup_of_missing_codes(index):
+    ids = index.lookup('lsoa', ['E01000002', 'E01999999'])
+    assert ids.tolist() == [1, -1]
+    assert index.code('lsoa', ids).tolist() == ['E01000002', None]
+    assert index.name('lsoa', ['E01000002', 'E01999999']).tolist() == ['LSOA 2', None]
+    assert index.name('rgn', ['E12000001', 'W92000004']).tolist() == ['North East', None]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for group_sums: one bincount over all columns matches summing each column by group, with missing groups dropped
+"""
+
+import numpy as np
+import pandas as pd
+
+from grouping import group_sums
+
+
+# -----------------------------------------------------------------------------
+def test_group_sums_match_groupby():
+    rng = np.random.default_rng(0)
+    group_ids = rng.integers(-1, 5, 200)
+    values = rng.random((200, 3))
+    expected = pd.DataFrame(values[group_ids >= 0]).groupby(group_ids[group_ids >= 0]).sum().reindex(range(6), fill_value = 0.0)
+    np.testing.assert_allclose(group_sums(group_ids, values, 6), expected.to_numpy())
+    np.testing.assert_allclose(group_sums(group_ids, values[:, 1], 6), expected[1].to_numpy())
+    assert group_sums(group_ids, np.empty((200, 0)), 6).shape == (6, 0)
+
+
+# -----------------------------------------------------------------------------
+def test_group_sums_with_ids_per_column():
+    group_ids = np.array([[0, 1], [1, -1], [0, 0]])
+    values = np.array([[1.0, 10.0], [2.0, 20.0], [4.0, 40.0]])
+    np.testing.assert_array_equal(group_sums(group_ids, values, 2), [[5.0, 40.0], [2.0, 10.0]])
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for run instrumentation: joins report non-null values brought in and output keys left null, not only matched keys
+"""
+
+import pandas as pd
+
+import instrumentation
+from lsoa_table import LSOATableBuilder
+
+
+# -----------------------------------------------------------------------------
+def test_record_sources_counts_non_null_values():
+    base = pd.DataFrame({'lsoa21cd': ['E01000001', 'E01000002', 'W01000001', 'W01000002']})
+    # Every key matches, but Welsh LSOAs have no NHS sub-ICB location
+    nhs = pd.DataFrame({'LSOA21CD': ['E01000001', 'E01000002', 'W01000001', 'W01000002'], 'LOC22CD': ['E38000001', 'E38000002', None, None]})
+    builder = LSOATableBuilder(base).add_source('NHS', nhs, key = 'LSOA21CD', columns = ['LOC22CD'])
+    recorder = instrumentation.RunRecorder(trace_memory = False)
+    with recorder.recording():
+        table = builder.build()
+        instrumentation.record_sources(builder, table)
+    join, = recorder.report()['joins']
+    assert join['join'] == 'LSOA table: NHS'
+    assert join['match_rate'] == 1.0
+    assert join['non_null'] == {'LOC22CD': 2}
+    assert join['non_null_rate'] == {'LOC22CD': 0.5}
+    assert join['null_sample'] == {'LOC22CD': ['W01000001', 'W01000002']}
+
+
+# -----------------------------------------------------------------------------
+def test_merge_samples_output_keys_of_rows_with_missing_join_key():
+    nhs = pd.DataFrame({'LSOA21CD': ['E01000001', 'W01000001', 'W01000002'], 'LOC22CD': ['E38000001', None, None]})
+    locations = pd.DataFrame({'LOC22CD': ['E38000001'], 'LOC22NM': ['Sub-ICB 1']})
+    recorder = instrumentation.RunRecorder(trace_memory = False)
+    with recorder.recording():
+        instrumentation.merge('NHS', nhs, locations, how = 'left', on = 'LOC22CD', sample_key = 'LSOA21CD')
+    join, = recorder.report()['joins']
+    # Missing join keys are not unmatched keys, so only the output keys show which rows are left null
+    assert join['missing_keys'] == 2
+    assert join['unmatched_sample'] == []
+    assert join['null_sample'] == {'LOC22NM': ['W01000001', 'W01000002']}
+
+
+# -----------------------------------------------------------------------------
+def test_hooks_do_nothing_when_not_recording():
+    data = pd.DataFrame({'key': ['a', 'b'], 'value': [1, None]})
+    instrumentation.record_join('join', data['key'], ['a'], filled = data[['value']])
+    result = instrumentation.merge('merge', data, data.rename(columns = {'value': 'other'}), how = 'left', on = 'key')
+    assert instrumentation.active() is None
+    assert len(result) == 2
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for LSOATableBuilder: joins never add rows, and only listed columns are added
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from lsoa_table import LSOATableBuilder, minimal_dtype
+
+
+# -----------------------------------------------------------------------------
+@pytest.fixture
+def base():
+    return pd.DataFrame({'lsoa21cd': ['E01000001', 'E01000002', 'E01000003'], 'Age_65plus': [10, 20, 30]})
+
+
+# -----------------------------------------------------------------------------
+def test_base_not_unique_raises():
+    base = pd.DataFrame({'lsoa21cd': ['E01000001', 'E01000001'], 'Age_65plus': [1, 2]})
+    with pytest.raises(ValueError, match = 'not unique'):
+        LSOATableBuilder(base)
+
+
+# -----------------------------------------------------------------------------
+def test_source_not_unique_raises(base):
+    source = pd.DataFrame({'LSOA21CD': ['E01000001', 'E01000001', 'E01000002'], 'IMD_Decile_2019': [1, 2, 3]})
+    with pytest.raises(ValueError, match = 'join would add rows'):
+        LSOATableBuilder(base).add_source('IMD', source, key = 'LSOA21CD', columns = ['IMD_Decile_2019'])
+
+
+# -----------------------------------------------------------------------------
+def test_missing_source_keys_are_ignored_for_uniqueness(base):
+    source = pd.DataFrame({'LSOA21CD': ['E01000001', None, None], 'IMD_Decile_2019': [1, 2, 3]})
+    table = LSOATableBuilder(base).add_source('IMD', source, key = 'LSOA21CD', columns = ['IMD_Decile_2019']).build()
+    assert table['IMD_Decile_2019'].tolist()[0] == 1
+    assert table['IMD_Decile_2019'].isna().sum() == 2
+
+
+# -----------------------------------------------------------------------------
+def test_column_clash_raises(base):
+    source = pd.DataFrame({'LSOA21CD': ['E01000001'], 'Age_65plus': [5]})
+    with pytest.raises(ValueError, match = 'already in table'):
+        LSOATableBuilder(base).add_source('Clash', source, key = 'LSOA21CD', columns = ['Age_65plus'])
+
+
+# -----------------------------------------------------------------------------
+def test_unknown_join_column_raises(base):
+    source = pd.DataFrame({'lad22cd': ['E06000001'], 'RUC': ['Urban']})
+    builder = LSOATableBuilder(base).add_source('RUC LAD', source, key = 'lad22cd', on = 'lad22cd', columns = ['RUC'])
+    with pytest.raises(KeyError, match = 'lad22cd'):
+        builder.build()
+
+
+# -----------------------------------------------------------------------------
+def test_build_keeps_rows_and_joins_on_earlier_source(base):
+    geocodes = pd.DataFrame({'lsoa21cd': ['E01000003', 'E01000001', 'E01000004'], 'lad22cd': ['E06000002', 'E06000001', 'E06000003']})
+    ruc_lad = pd.DataFrame({'LAD21CD': ['E06000001', 'E06000002'], 'RUC_LAD': ['Urban', 'Rural']})
+    table = (LSOATableBuilder(base)
+             .add_source('Geocodes', geocodes, key = 'lsoa21cd', columns = ['lad22cd'])
+             .add_source('RUC LAD', ruc_lad, key = 'LAD21CD', on = 'lad22cd', columns = ['RUC_LAD'])
+             .build())
+    assert len(table) == len(base)
+    assert table.columns.tolist() == ['lsoa21cd', 'Age_65plus', 'lad22cd', 'RUC_LAD']
+    assert table['lad22cd'].tolist()[::2] == ['E06000001', 'E06000002']
+    assert pd.isna(table['lad22cd'].iloc[1])
+    assert table['RUC_LAD'].tolist()[::2] == ['Urban', 'Rural']
+
+
+# -----------------------------------------------------------------------------
+def test_minimal_dtype_only_downcasts_whole_numbers():
+    assert minimal_dtype(pd.Series([1, 2, 3])).dtype == np.int8
+    assert minimal_dtype(pd.Series([1.0, np.nan, 10.0])).dtype == np.float32
+    assert minimal_dtype(pd.Series([0.5, 1.0])).dtype == np.float64
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for Pipeline: stage keys change with code, helper code, parameters and source files, only stages downstream of
+a change re-run, and outputs under old keys are removed
+"""
+
+import importlib
+import inspect
+import os
+import sys
+
+import pytest
+
+from pipeline import Pipeline
+
+HELPERS = '''
+import stage_base
+
+def scale(value):
+    return value * stage_base.FACTOR
+'''
+
+
+# -----------------------------------------------------------------------------
+@pytest.fixture
+def helpers(tmp_path, monkeypatch):
+    """Helper module, importing a second local module, written to a temporary directory"""
+    (tmp_path / 'stage_helpers.py').write_text(HELPERS)
+    (tmp_path / 'stage_base.py').write_text('FACTOR = 2\n')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    for name in ['stage_helpers', 'stage_base']:
+        sys.modules.pop(name, None)
+    module = importlib.import_module('stage_helpers')
+    yield module
+    for name in ['stage_helpers', 'stage_base']:
+        sys.modules.pop(name, None)
+
+
+# -----------------------------------------------------------------------------
+def rewrite(module, path, text):
+    """Function to rewrite module source file and reload module"""
+    path.write_text(text)
+    importlib.reload(module)
+
+
+# -----------------------------------------------------------------------------
+def make_pipeline(cache_dir, helpers, source_path, calls):
+    """Function to return pipeline: load (reads source file) -> scaled (calls helper) -> total (has params)"""
+    pipeline = Pipeline(cache_dir = str(cache_dir))
+
+    @pipeline.stage(params = {'path': str(source_path)}, files = [str(source_path)], memoize = False)
+    def load(path):
+        calls.append('load')
+        with open(path) as f:
+            return int(f.read())
+
+    @pipeline.stage(inputs = ['load'], depends = [helpers.scale])
+    def scaled(load):
+        calls.append('scaled')
+        return helpers.scale(load)
+
+    @pipeline.stage(inputs = ['scaled'], params = {'offset': 1})
+    def total(scaled, offset):
+        calls.append('total')
+        return scaled + offset
+
+    return pipeline
+
+
+# -----------------------------------------------------------------------------
+@pytest.fixture
+def setup(tmp_path, helpers):
+    source_path = tmp_path / 'source.txt'
+    source_path.write_text('5')
+    calls = []
+    pipeline = make_pipeline(tmp_path / 'stages', helpers, source_path, calls)
+    return pipeline, calls, source_path
+
+
+# -----------------------------------------------------------------------------
+def test_rerun_loads_from_cache(setup):
+    pipeline, calls, _ = setup
+    assert pipeline.run(['total'])['total'] == 11
+    assert calls == ['load', 'scaled', 'total']
+    calls.clear()
+    assert pipeline.plan(['total']) == {'total': 'cached'}
+    assert pipeline.run(['total'])['total'] == 11
+    assert calls == []
+
+
+# -----------------------------------------------------------------------------
+def test_param_change_reruns_only_that_stage(setup):
+    pipeline, calls, _ = setup
+    pipeline.run(['total'])
+    calls.clear()
+    pipeline.stages['total'].params['offset'] = 2
+    assert pipeline.plan(['total']) == {'scaled': 'cached', 'total': 'run'}
+    assert pipeline.run(['total'])['total'] == 12
+    assert calls == ['total']
+
+
+# -----------------------------------------------------------------------------
+def test_source_file_change_reruns_downstream(setup):
+    pipeline, calls, source_path = setup
+    pipeline.run(['total'])
+    calls.clear()
+    source_path.write_text('50')
+    assert pipeline.run(['total'])['total'] == 101
+    assert calls == ['load', 'scaled', 'total']
+
+
+# -----------------------------------------------------------------------------
+def test_helper_change_reruns_downstream(setup, helpers, tmp_path):
+    pipeline, calls, _ = setup
+    before = pipeline.keys(['total'])
+    pipeline.run(['total'])
+    calls.clear()
+    rewrite(helpers, tmp_path / 'stage_helpers.py', HELPERS.replace('value * stage_base.FACTOR', 'value * stage_base.FACTOR * 10'))
+    after = pipeline.keys(['total'])
+    assert after['load'] == before['load']
+    assert after['scaled'] != before['scaled']
+    assert after['total'] != before['total']
+    assert pipeline.run(['total'])['total'] == 101
+    assert calls == ['load', 'scaled', 'total']
+
+
+# -----------------------------------------------------------------------------
+def test_change_to_module_imported_by_helper_reruns_downstream(setup, helpers, tmp_path):
+    pipeline, calls, _ = setup
+    pipeline.run(['total'])
+    calls.clear()
+    rewrite(sys.modules['stage_base'], tmp_path / 'stage_base.py', 'FACTOR = 30\n')
+    assert pipeline.run(['total'])['total'] == 151
+    assert calls == ['load', 'scaled', 'total']
+
+
+# -----------------------------------------------------------------------------
+def test_outputs_under_old_keys_removed(setup):
+    pipeline, _, _ = setup
+    pipeline.run(['total'])
+    for offset in [2, 3]:
+        pipeline.stages['total'].params['offset'] = offset
+        pipeline.run(['total'])
+    key = pipeline.keys(['total'])['total']
+    assert sorted(os.listdir(pipeline.cache_dir)) == sorted([f"scaled.{pipeline.keys(['total'])['scaled']}.pkl", f'total.{key}.pkl'])
+
+
+# -----------------------------------------------------------------------------
+def test_no_cache_writes_nothing(setup):
+    pipeline, calls, _ = setup
+    pipeline.run(['total'], use_cache = False)
+    assert not os.path.exists(pipeline.cache_dir)
+
+
+# -----------------------------------------------------------------------------
+def test_unknown_input_raises(tmp_path):
+    pipeline = Pipeline(cache_dir = str(tmp_path))
+    with pytest.raises(ValueError, match = 'not registered'):
+        @pipeline.stage(inputs = ['missing'])
+        def stage(missing):
+            return missing
+
+
+# -----------------------------------------------------------------------------
+def test_script_stage_keys_follow_helper_code(synthetic_dir, monkeypatch):
+    """Figure stage keys change when data_cache (used by load stages) or sum_cols (used by census) change"""
+    import CMOresponse_GitHub as script
+    import data_cache
+    monkeypatch.chdir(synthetic_dir)
+    before = script.pipeline.keys(['figure1a'])['figure1a']
+    getsource = inspect.getsource
+    for changed in [data_cache, script.sum_cols]:
+        monkeypatch.setattr(inspect, 'getsource', lambda obj, changed = changed: getsource(obj) + ('\n# changed' if obj is changed else ''))
+        assert script.pipeline.keys(['figure1a'])['figure1a'] != before
+    monkeypatch.setattr(inspect, 'getsource', getsource)
+    assert script.pipeline.keys(['figure1a'])['figure1a'] == before
+
+
+# -----------------------------------------------------------------------------
+def test_use_cache_passed_to_stages_taking_it(tmp_path):
+    pipeline = Pipeline(cache_dir = str(tmp_path))
+
+    @pipeline.stage(memoize = False)
+    def load(use_cache = True):
+        return use_cache
+
+    assert pipeline.run(['load'])['load'] is True
+    assert pipeline.run(['load'], use_cache = False)['load'] is False
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for PopulationProjections: streamed array matches groupby over the projections table
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from projections import PopulationProjections, LAD_PREFIXES
+
+
+# -----------------------------------------------------------------------------
+@pytest.fixture
+def table():
+    rng = np.random.default_rng(0)
+    codes = ['E06000001', 'E07000002', 'E08000003', 'E10000004', 'E12000001', 'W06000001']
+    ages = ['0-4', '5-64', '65-69', '70-89', '90+']
+    rows = pd.DataFrame([(code, f'Area {code}', age) for code in codes for age in ages + ['All ages']],
+                        columns = ['CODE', 'AREA', 'AGE GROUP'])
+    # Repeat one area and age group, split across chunks
+    rows = pd.concat([rows, rows[(rows['CODE'] == 'E07000002') & (rows['AGE GROUP'] == '65-69')]], ignore_index = True)
+    for year in ['2018', '2019', '2043']:
+        rows[year] = rng.uniform(0, 1000, len(rows)).round(1)
+    return rows
+
+
+# -----------------------------------------------------------------------------
+def test_from_csv_matches_groupby(table, tmp_path):
+    path = tmp_path / 'projections.csv'
+    table.to_csv(path, index = False)
+    projections = PopulationProjections.from_csv(path, chunksize = 7)
+    assert projections.codes.tolist() == table['CODE'].unique().tolist()
+    assert projections.areas.tolist() == table['AREA'].unique().tolist()
+
+    filtered = table[table['CODE'].str.contains('E06|E07|E08|E09') & table['AGE GROUP'].isin(['65-69', '70-89', '90+'])]
+    expected = filtered.groupby('CODE').agg({'AREA': 'first', '2018': 'sum', '2019': 'sum', '2043': 'sum'})
+    result = projections.totals(prefixes = LAD_PREFIXES, min_age = 65)
+    pd.testing.assert_frame_equal(result, expected, check_names = False)
+
+
+# -----------------------------------------------------------------------------
+def test_by_group(table, tmp_path):
+    path = tmp_path / 'projections.csv'
+    table.to_csv(path, index = False)
+    projections = PopulationProjections.from_csv(path)
+    groups = pd.Series({'E06000001': 'Urban', 'E07000002': 'Rural', 'E08000003': 'Urban'}, name = 'RUC')
+    result = projections.by_group(groups, prefixes = LAD_PREFIXES, min_age = 65, years = ['2018', '2043'])
+    totals = projections.totals(prefixes = LAD_PREFIXES, min_age = 65, years = ['2018', '2043'])
+    assert result.loc['Urban', '2043'] == pytest.approx(totals.loc[['E06000001', 'E08000003'], '2043'].sum())
+    assert result.index.tolist() == ['Rural', 'Urban']
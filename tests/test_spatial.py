@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for SpatialIndex: radius and nearest neighbour queries match brute force great-circle distances, including
+areas at the same position
+"""
+
+import numpy as np
+import pytest
+
+from spatial import EARTH_RADIUS_KM, SpatialIndex
+
+
+# -----------------------------------------------------------------------------
+def haversine_km(lat1, long1, lat2, long2):
+    """Function to return great-circle distance (km) between every pair of points, as (n1, n2) array"""
+    lat1, long1, lat2, long2 = [np.radians(np.asarray(x, dtype = np.float64)) for x in [lat1, long1, lat2, long2]]
+    a = (np.sin((lat2[None, :] - lat1[:, None]) / 2) ** 2
+         + np.cos(lat1[:, None]) * np.cos(lat2[None, :]) * np.sin((long2[None, :] - long1[:, None]) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+# -----------------------------------------------------------------------------
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(50.5, 53.5, 300)
+    long = rng.uniform(-4.0, 0.5, 300)
+    # Pairs of areas at the same position
+    lat[[1, 3, 5]], long[[1, 3, 5]] = lat[[0, 2, 4]], long[[0, 2, 4]]
+    values = rng.integers(0, 1000, 300).astype(np.float64)
+    return SpatialIndex([f'E01{i:06d}' for i in range(300)], lat, long), values
+
+
+# -----------------------------------------------------------------------------
+def test_within_matches_brute_force(points):
+    index, values = points
+    distance = haversine_km(index.lat, index.long, index.lat, index.long)
+    sums, counts = index.within(values, 25)
+    np.testing.assert_allclose(sums, (values[None, :] * (distance <= 25)).sum(axis = 1))
+    np.testing.assert_array_equal(counts, (distance <= 25).sum(axis = 1))
+
+
+# -----------------------------------------------------------------------------
+def test_nearest_excludes_self_matches_brute_force(points):
+    index, _ = points
+    distance = haversine_km(index.lat, index.long, index.lat, index.long)
+    np.fill_diagonal(distance, np.inf)
+    nearest_km, position = index.nearest(k = 3)
+    assert not (position == np.arange(len(position))[:, None]).any()
+    np.testing.assert_allclose(nearest_km, np.sort(distance, axis = 1)[:, :3], atol = 1e-6)
+    # Coincident areas are each other's nearest area, at distance 0
+    assert position[[0, 1, 2, 3], 0].tolist() == [1, 0, 3, 2]
+    np.testing.assert_allclose(nearest_km[[0, 1, 2, 3], 0], 0, atol = 1e-6)
+
+
+# -----------------------------------------------------------------------------
+def test_nearest_to_query_points_matches_brute_force(points):
+    index, _ = points
+    lat, long = np.array([51.5, 52.0]), np.array([-0.1, -2.0])
+    distance = haversine_km(lat, long, index.lat, index.long)
+    nearest_km, position = index.nearest(lat, long, k = 4)
+    np.testing.assert_allclose(nearest_km, np.sort(distance, axis = 1)[:, :4], atol = 1e-6)
+    np.testing.assert_allclose(np.take_along_axis(distance, position, axis = 1), nearest_km, atol = 1e-6)
+
+
+# -----------------------------------------------------------------------------
+def test_nearest_sum_includes_self(points):
+    index, values = points
+    # Coincident areas tie as neighbours of other areas, so give them equal values
+    values[[1, 3, 5]] = values[[0, 2, 4]]
+    distance = haversine_km(index.lat, index.long, index.lat, index.long)
+    np.fill_diagonal(distance, np.inf)
+    others = np.argsort(distance, axis = 1, kind = 'stable')[:, :2]
+    sums, furthest_km = index.nearest_sum(values, k = 3)
+    np.testing.assert_allclose(sums, values + values[others].sum(axis = 1))
+    np.testing.assert_allclose(furthest_km, np.sort(distance, axis = 1)[:, 1], atol = 1e-6)
+    np.testing.assert_array_equal(index.nearest_sum(values, k = 1)[0], values)